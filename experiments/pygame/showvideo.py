@@ -0,0 +1,30 @@
+import asyncio
+import click
+
+from robot.outputs.display import OLEDDisplay
+from robot.outputs.video import play_video
+
+
+@click.command()
+@click.argument('source')
+@click.option('--fps', type=float, default=None,
+              help="Override the video's own frame rate")
+@click.option('--loop/--no-loop', default=False)
+@click.option('--virtual/--no-virtual', default=False,
+              help="Render to a virtual display instead of the OLED")
+def main(source, fps, loop, virtual):
+    oled = OLEDDisplay(virtual=virtual)
+    oled.setup()
+    try:
+        dropped = asyncio.get_event_loop().run_until_complete(
+            play_video(oled, source, oled.device.size, fps=fps, loop=loop))
+        print(f"Dropped {dropped} frames")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        oled.clear()
+        print("Done")
+
+
+if __name__ == "__main__":
+    main()
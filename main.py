@@ -6,6 +6,7 @@ import logging
 import pathlib
 import time
 
+import robot.bundle as robot_bundle
 import robot.outputs.display as robot_display
 import robot.outputs.sound as robot_sound
 import robot.servers.http as http_serve
@@ -90,6 +91,16 @@ def run_display_test(driver: robot_driver.RobotDriver) -> None:
     robot_display.run_test()
 
 
+def run_build_bundle(driver: robot_driver.RobotDriver) -> None:
+    logger.info("Building asset bundle")
+    display = driver.display
+    if display is not None and display.device is not None:
+        robot_bundle.build_bundle(driver.bundle_path,
+                                  display_size=display.device.size)
+    else:
+        robot_bundle.build_bundle(driver.bundle_path)
+
+
 driver_modes = {
     'osc': None,
     'http': run_http_server,
@@ -101,6 +112,7 @@ driver_modes = {
     'servotest': run_servo_test,
     'test': run_test_mode,
     'asynctest': run_async_test,
+    'bundle': run_build_bundle,
 }
 
 
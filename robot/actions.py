@@ -6,10 +6,17 @@ Each should also be a coroutine.
 import abc
 import asyncio
 import collections
+import itertools
 import logging
 import random
 
-from robot.outputs.display import RESOURCES
+import numpy as np
+
+import robot.dsp as dsp
+from robot.outputs.display import (RESOURCES, Marquee, play_animation,
+                                   play_marquee)
+from robot.outputs.sound import SoundFile, Tone
+from robot.outputs.synth import StreamingSynth, Waveform
 
 logger = logging.getLogger(__name__)
 
@@ -19,6 +26,10 @@ tagged_registry = collections.defaultdict(list)
 
 class Action(abc.ABC):
     tags = []
+    # Higher priority actions preempt lower ones (see ActionScheduler).
+    priority = 0
+    timeout = None
+    scheduler = None
 
     def __init__(self, driver):
         self.driver = driver
@@ -34,32 +45,33 @@ class Action(abc.ABC):
             tagged_registry[tag].append(cls)
 
     def __enter__(self):
-        "register the subclass's callbacks, if available, to the driver"
-        logger.info(f"__enter__")
-        if hasattr(self, 'button_callback'):
-            logger.info(f"__enter__ {self.button_callback}")
-            self.driver.register_button_callback(self.button_callback)
-
-        if hasattr(self, 'knob_callback'):
-            logger.info(f"__enter__ {self.knob_callback}")
-            self.driver.register_knob_callback(self.knob_callback)
-
+        "subscribe the subclass's callbacks, if available, to the event bus"
+        self._subscriptions = self.driver.events.subscribe_handlers(self)
+        logger.info(f"__enter__ {self._subscriptions}")
         return self
 
     def __exit__(self, *exec):
-        "deregister callbacks"
-        logger.info(f"Degregistering {self}'s callbacks")
-        self.driver.deregister_callbacks()
+        "unsubscribe callbacks"
+        logger.info(f"Unsubscribing {self}'s callbacks")
+        for topic, callback in self._subscriptions:
+            self.driver.events.unsubscribe(topic, callback)
         return False
 
 bar_one = 0.4
 bar_two = 0.8
 
 class MainLoop(Action):
-    def __init__(self, driver, sleep_time=15):
+    # Turning the knobs this far in total (in ADC steps) starts the synth.
+    SYNTH_KNOB_TRAVEL = 1024
+
+    def __init__(self, driver, sleep_time=30):
         super(MainLoop, self).__init__(driver)
         self.next_state = None
-        self.sleep_time = 30
+        self.heard_clap = False
+        self.knob_travel = 0
+        # Whether anyone has touched the robot; if not, it goes to sleep.
+        self.active = False
+        self.sleep_time = sleep_time
 
         self.bar_one = 0.4
         self.bar_two = 0.8
@@ -68,11 +80,17 @@ class MainLoop(Action):
 
     def button_callback(self, button):
         logger.info(f"Button Callback {button}")
+        self.active = True
         if button is not None and hasattr(button, 'label') and hasattr(button, 'led') and button.led.get_state():
             self.next_state = button.label
 
     def knob_callback(self, knob):
         logger.debug(f"Knob callback {knob}")
+        movement = abs(knob.value - knob.last_value)
+        if movement > self.driver.adc.change_tolerance:
+            self.knob_travel += movement
+            self.active = True
+
         global bar_one
         global bar_two
         if knob.pin == 2:
@@ -82,9 +100,15 @@ class MainLoop(Action):
             self.bar_two = 1 - (knob.value / 1024)
             bar_two = self.bar_two
 
-        self.driver.display.draw_bars(bar_one, bar_two)
+        asyncio.ensure_future(
+            self.driver.display.adraw_bars(bar_one, bar_two))
         logger.debug(f"Knob callback {knob}; {self.bar_one} {self.bar_two}")
 
+    def clap_callback(self, level):
+        logger.info(f"Heard a clap {level}")
+        self.heard_clap = True
+        self.active = True
+
     async def run_servo_script(self, script):
         for label, pos, diff, pause in script:
             if label:
@@ -116,7 +140,7 @@ class MainLoop(Action):
 
         tasks = []
 
-        tasks.append(self.run_servo_script([
+        tasks.append(asyncio.ensure_future(self.run_servo_script([
             # Init
             ('left_shoulder', .2, None, 0),
             ('left_arm', .3, None, 0),
@@ -134,20 +158,36 @@ class MainLoop(Action):
             ('left_arm', .3, None, 0),
             ('right_arm', 0, None, 0),
             (None, None, None, .1),
-        ]))
+        ])))
 
         #self.driver.display.draw_bars(self.bar_one, self.bar_two)
 
-        async def welcome():
-            await self.driver.sound.aplay_speech("Hello.")
-            await self.driver.sound.aplay_speech(
-                "Welcome to Christopher and Zo ell's wedding")
-        tasks.append(welcome())
+        welcome = asyncio.ensure_future(play_marquee(
+            self.driver.display,
+            Marquee("Welcome to Christopher and Zoël's wedding!",
+                    self.driver.display.device.size)))
+
+        # "Hello." plays as soon as it's synthesized, while the rest is.
+        tasks.append(asyncio.ensure_future(
+            self.driver.sound.aplay_speech_sequence([
+                "Hello.",
+                "Welcome to Christopher and Zo ell's wedding"], pause=.2)))
 
         while total_sleep < self.sleep_time:
             logger.debug(f"Next loop - {total_sleep}, {self.next_state}")
+            if self.heard_clap:
+                await self.driver.sound.aplay_speech("Let's dance!")
+                result = DanceParty
+                break
+
+            if self.knob_travel >= self.SYNTH_KNOB_TRAVEL:
+                welcome.cancel()
+                result = KnobSynth
+                break
+
             if self.next_state is not None:
-                self.driver.display.draw_text(f"Pushed {self.next_state}")
+                welcome.cancel()
+                await self.driver.display.adraw_text(f"Pushed {self.next_state}")
                 await self.driver.sound.aplay_speech(f"You pushed {self.next_state}")
                 await asyncio.sleep(0.25)
 
@@ -168,21 +208,30 @@ class MainLoop(Action):
                 self.next_state = None
 
             if random.random() > .6:
-                tasks.append(self.run_servo_script([
+                tasks.append(asyncio.ensure_future(self.run_servo_script([
                     # Do the stuff
                     ('left_shoulder', None, random.uniform(-self.bar_two, self.bar_two) / 20.0, 0),
                     ('left_arm', None, random.uniform(-self.bar_two, self.bar_two) / 20.0, 0),
                     ('right_arm', None, random.uniform(-self.bar_one, self.bar_one) / 10.0, 0),
-                ]))
+                ])))
 
-            tasks.append(asyncio.sleep(.1))
+            tasks.append(asyncio.ensure_future(asyncio.sleep(.1)))
             await asyncio.gather(*tasks)
 
             tasks = []
             total_sleep += .1
 
-        self.driver.display.clear()
+        # Breaking out early leaves the welcome speech or a servo script
+        # running; stop them rather than let them outlive the action.
+        # (If the action itself is cancelled, gather() cancels them.)
+        for task in tasks:
+            task.cancel()
+        welcome.cancel()
+        await self.driver.display.aclear()
         self.driver.clear_all_leds()
+        if result is None and not self.active:
+            logger.info("Nobody's about; starting the screensaver")
+            result = Screensaver
         return result
 
 
@@ -191,16 +240,16 @@ class FlashStuff(Action):
 
     async def run(self):
         logger.info("FlashStuff")
-        self.driver.display.draw_text("beep beep!")
+        await self.driver.display.adraw_text("beep beep!")
         await asyncio.sleep(0.5)
         for i in range(6):
             logger.info(f"FlashStuff - {i}")
             self.driver.toggle_all_leds()
-            self.driver.display.fill_rgb(255 * (i / 6), 0, 0)
+            await self.driver.display.afill_rgb(255 * (i / 6), 0, 0)
             await asyncio.sleep(0.25)
             self.driver.toggle_all_leds()
             await asyncio.sleep(0.25)
-        self.driver.display.clear()
+        await self.driver.display.aclear()
 
         return MainLoop
 
@@ -219,12 +268,12 @@ class ActionPlayTwoSounds(Action):
         logger.debug("Knob callback:", knob)
 
     async def run(self):
-        self.driver.display.draw_image(RESOURCES / "heart1.jpg")
+        await self.driver.display.adraw_image(RESOURCES / "heart1.jpg")
         await self.driver.sound.aplay_init_sound()
         await self.driver.sound.aplay_speech("Hello, I am the robot")
 
         await self.driver.sound.aplay_sin(freq=1000, dur=1)
-        self.driver.display.draw_image(RESOURCES / "heart2.jpg")
+        await self.driver.display.adraw_image(RESOURCES / "heart2.jpg")
 
         await self.driver.sound.aplay_init_sound()
 
@@ -237,25 +286,141 @@ class ActionPrintKnobCallback(Action):
         await asyncio.sleep(1)
 
 
+class Screensaver(Action):
+    """Fly through the starfield until a button is pressed."""
+    def __init__(self, driver, duration=30, fps=30):
+        super(Screensaver, self).__init__(driver)
+        self.duration = duration
+        self.fps = fps
+        self.pressed = False
+
+    def button_callback(self, button):
+        self.pressed = True
+
+    async def run(self):
+        loop = asyncio.get_event_loop()
+        start = loop.time()
+        frame = 0
+        while not self.pressed and frame < self.duration * self.fps:
+            await self.driver.display.amove_and_draw_strs()
+            frame += 1
+            # Sleep until the next frame is due, rather than for a fixed
+            # time, so slow frames don't slow the animation down.
+            await asyncio.sleep(max(0, start + frame / self.fps - loop.time()))
+        await self.driver.display.aclear()
+        return MainLoop
+
+
 class WeddingIsLoading(Action):
+    # Loaded on the display thread the first time, then kept.
+    animation = None
+
+    def button_callback(self, button):
+        # Any button gets back to the main loop, without waiting for the
+        # animation to finish.
+        if self.scheduler is not None:
+            self.scheduler.submit(MainLoop, priority=self.priority + 1)
+
     async def run(self):
         await self.driver.sound.aplay_init_sound()
+        animation = WeddingIsLoading.animation
+        if animation is None:
+            loading = asyncio.ensure_future(
+                self.driver.display.aload_animation([
+                    RESOURCES / "4_B_wedding-generating-1.png",
+                    RESOURCES / "4_B_wedding-generating-2.png",
+                    RESOURCES / "4_B_wedding-generating-3.png",
+                    RESOURCES / "4_B_wedding-generating-4.png"], fps=1))
         await self.driver.sound.aplay_speech("Thank you for using our service. Your wedding is generating")
-        self.driver.display.draw_image(RESOURCES / "4_B_wedding-generating-1.png")
-        await asyncio.sleep(1)
-        self.driver.display.draw_image(RESOURCES / "4_B_wedding-generating-2.png")
-        await asyncio.sleep(1)
-        self.driver.display.draw_image(RESOURCES / "4_B_wedding-generating-3.png")
-        await asyncio.sleep(1)
-        self.driver.display.draw_image(RESOURCES / "4_B_wedding-generating-4.png")
-        await asyncio.sleep(1)
+        if animation is None:
+            animation = WeddingIsLoading.animation = await loading
+        await play_animation(self.driver.display, animation)
 
 
 class DanceParty(Action):
+    """Dance to `SONG`, moving, flashing and blinking on its beats.
+
+    The beats are analysed once and cached next to the song (bundle builds
+    do this ahead of time). Without the song, dance to a few tones.
+    """
     tags = ['random']
 
+    SONG = SoundFile(RESOURCES / "dance.wav")
+    TONES = [Tone(freq=400, dur=.2),
+             Tone(freq=800, dur=.2),
+             Tone(freq=400, dur=.2),
+             Tone(freq=800, dur=.2)]
+    COLOURS = [(255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 0, 255)]
+    MAX_LATENESS = 0.05
+
+    def on_beat(self, i):
+        self.driver.set_servo_position('left_arm', .3 + .3 * (i % 2))
+        self.driver.set_servo_position('left_shoulder', .1 + .1 * (i % 2))
+        asyncio.ensure_future(self.driver.display.afill_rgb(
+            *self.COLOURS[i % len(self.COLOURS)]))
+
+    def on_onset(self, i):
+        self.driver.toggle_all_leds()
+
+    async def choreograph(self, beats, onsets):
+        loop = asyncio.get_event_loop()
+        start = loop.time()
+        cues = sorted([(t, self.on_beat) for t in beats] +
+                      [(t, self.on_onset) for t in onsets],
+                      key=lambda cue: cue[0])
+        counts = collections.Counter()
+
+        for t, cue in cues:
+            delay = start + t - loop.time()
+            if delay < -self.MAX_LATENESS:
+                # Behind; skip the cue rather than drift, but count it so
+                # the moves stay in phase with the beat.
+                counts[cue] += 1
+                continue
+            await asyncio.sleep(max(0, delay))
+            cue(counts[cue])
+            counts[cue] += 1
+
     async def run(self):
-        await self.driver.sound.aplay_sin(freq=400, dur=.2)
-        await self.driver.sound.aplay_sin(freq=800, dur=.2)
-        await self.driver.sound.aplay_sin(freq=400, dur=.2)
-        await self.driver.sound.aplay_sin(freq=800, dur=.2)
+        if self.SONG.path.exists():
+            analysis = dsp.cached_beats(self.SONG.path)
+            logger.info(f"Dancing to {self.SONG.path.name}: {analysis}")
+            beats, onsets = analysis.beats, analysis.onsets
+            playback = self.driver.sound.aplay_file(self.SONG.path,
+                                                    category='music')
+        else:
+            beats = np.cumsum([0] + [t.dur for t in self.TONES[:-1]])
+            onsets = []
+            playback = self.driver.sound.aplay_sequence(self.TONES)
+
+        choreography = asyncio.ensure_future(self.choreograph(beats, onsets))
+        try:
+            await playback
+        finally:
+            choreography.cancel()
+
+        await self.driver.display.aclear()
+        self.driver.clear_all_leds()
+
+
+class KnobSynth(Action):
+    """Play the robot from the knobs: the first knob sets the pitch, the
+    second the volume, and any button switches waveform."""
+    def __init__(self, driver, duration=20):
+        super(KnobSynth, self).__init__(driver)
+        self.duration = duration
+        self.synth = StreamingSynth(sr=driver.sound.backend.sr)
+        self.waveforms = itertools.cycle(Waveform)
+
+    def button_callback(self, button):
+        self.synth.set_waveform(next(self.waveforms))
+        self.synth.note_on()
+
+    def knob_callback(self, knob):
+        self.synth.knob_callback(knob)
+
+    async def run(self):
+        await self.driver.display.adraw_text("Play me!")
+        self.synth.note_on()
+        await self.driver.sound.astream(self.synth, duration=self.duration)
+        return MainLoop
@@ -0,0 +1,239 @@
+"""Precompiled asset bundles.
+
+Every registered `Action` is scanned for the static speech, images and
+sounds it references. Speech is rendered to WAV files and images to
+device-ready frames ahead of time, and a manifest describing them is
+written alongside, so the first run of an action is as fast as a warm one.
+
+    bundle/
+        manifest.json
+        speech/<sha1>.wav
+        speech/<sha1>.env50.npy
+        display.pack
+
+`display.pack` holds the actions' images and every image in `resources/`
+as RGB565 frames (see `robot.outputs.resource_pack`).
+"""
+import ast
+import hashlib
+import inspect
+import json
+import logging
+import pathlib
+import textwrap
+from typing import Iterable, Mapping, NamedTuple, Set, Tuple
+
+import numpy as np
+
+import robot.actions
+import robot.dsp as dsp
+import robot.outputs.display as robot_display
+import robot.outputs.resource_pack as resource_pack
+import robot.outputs.sound as robot_sound
+from robot.outputs.rgb565 import encode_rgb565
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUNDLE = pathlib.Path(__file__).resolve().parent.parent / "build" / "bundle"
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 2
+PACK_NAME = "display.pack"
+IMAGE_SUFFIXES = {'.png', '.jpg', '.jpeg', '.gif', '.bmp'}
+
+SPEECH_CALLS = {'play_speech', 'aplay_speech', 'prefetch_speech',
+                'aplay_speech_sequence', 'Speech'}
+IMAGE_CALLS = {'draw_image', 'adraw_image'}
+ANIMATION_CALLS = {'load_animation', 'aload_animation'}
+SOUND_CALLS = {'play_file', 'aplay_file', 'SoundFile'}
+INIT_SOUND_CALLS = {'play_init_sound', 'aplay_init_sound'}
+
+
+class ActionAssets(NamedTuple):
+    speech: Set[str]
+    images: Set[Tuple[str, int]]
+    sounds: Set[str]
+
+
+def _literal(node):
+    """Evaluate `node` if it is a literal, else None."""
+    try:
+        return ast.literal_eval(node)
+    except ValueError:
+        return None
+
+
+def _resource_path(node):
+    """Resolve a `RESOURCES / "name"` expression, else None."""
+    if (isinstance(node, ast.BinOp) and isinstance(node.op, ast.Div) and
+            isinstance(node.left, ast.Name) and node.left.id == 'RESOURCES'):
+        name = _literal(node.right)
+        if isinstance(name, str):
+            return str(robot_display.RESOURCES / name)
+    return None
+
+
+def extract_assets(actions: Iterable[type]) -> ActionAssets:
+    """Find the static assets referenced by the given `Action` classes.
+
+    Only literal arguments are collected; phrases built at runtime (such
+    as f-strings) are left to be synthesized on demand.
+    """
+    assets = ActionAssets(set(), set(), set())
+
+    for action in actions:
+        try:
+            source = textwrap.dedent(inspect.getsource(action))
+        except (OSError, TypeError):
+            logger.warning(f"No source available for {action}")
+            continue
+
+        for node in ast.walk(ast.parse(source)):
+            if not isinstance(node, ast.Call):
+                continue
+            if isinstance(node.func, ast.Attribute):
+                name = node.func.attr
+            elif isinstance(node.func, ast.Name):
+                name = node.func.id
+            else:
+                continue
+            args = node.args
+
+            if name in SPEECH_CALLS:
+                for arg in args:
+                    value = _literal(arg)
+                    if isinstance(value, str):
+                        assets.speech.add(value)
+                    elif isinstance(value, (list, tuple)):
+                        assets.speech.update(
+                            x for x in value if isinstance(x, str))
+
+            elif name in IMAGE_CALLS and args:
+                path = _resource_path(args[0])
+                angle = _literal(args[1]) if len(args) > 1 else 0
+                for kw in node.keywords:
+                    if kw.arg == 'angle':
+                        angle = _literal(kw.value)
+                if path and isinstance(angle, int):
+                    assets.images.add((path, angle))
+
+            elif name in ANIMATION_CALLS and args:
+                if isinstance(args[0], (ast.List, ast.Tuple)):
+                    for element in args[0].elts:
+                        path = _resource_path(element)
+                        if path:
+                            assets.images.add((path, 0))
+
+            elif name in SOUND_CALLS and args:
+                path = _resource_path(args[0])
+                if path:
+                    assets.sounds.add(path)
+
+            elif name in INIT_SOUND_CALLS:
+                assets.sounds.add(str(robot_sound.wav_files[0]))
+
+    return assets
+
+
+def _digest(*parts) -> str:
+    return hashlib.sha1(
+        "\0".join(str(x) for x in parts).encode('utf-8')).hexdigest()
+
+
+def build_resource_pack(path: pathlib.Path,
+                        images: Iterable[Tuple[str, int]],
+                        display_size: Tuple[int, int] = (128, 128)
+                        ) -> pathlib.Path:
+    """Render `(path, angle)` images to RGB565 and pack them into `path`."""
+    frames = []
+    for image_path, angle in images:
+        image_path = pathlib.Path(image_path)
+        if not image_path.exists():
+            logger.warning(f"Skipping missing image {image_path}")
+            continue
+        logger.info(f"Packing frame: {image_path} (angle={angle})")
+        frame = robot_display.render_image(image_path, display_size, 'RGB',
+                                           angle)
+        frames.append(resource_pack.PackedFrame(
+            str(image_path.resolve()), angle, image_path.stat().st_mtime,
+            encode_rgb565(np.asarray(frame))))
+    return resource_pack.write_resource_pack(path, frames, display_size)
+
+
+def build_bundle(output_dir: pathlib.Path = DEFAULT_BUNDLE,
+                 actions: Iterable[type] = None,
+                 display_size: Tuple[int, int] = (128, 128),
+                 resources: pathlib.Path = robot_display.RESOURCES
+                 ) -> pathlib.Path:
+    """Render all static assets of `actions` into a bundle directory.
+
+    Returns the path of the written manifest.
+    """
+    if actions is None:
+        actions = robot.actions.registry.values()
+    assets = extract_assets(actions)
+
+    output_dir = pathlib.Path(output_dir)
+    (output_dir / "speech").mkdir(parents=True, exist_ok=True)
+
+    manifest = {'version': MANIFEST_VERSION,
+                'speech': {},
+                'sounds': sorted(assets.sounds)}
+
+    for text in sorted(assets.speech):
+        relpath = f"speech/{_digest(text)}.wav"
+        logger.info(f"Rendering speech: '{text}'")
+        if robot_sound.speech_to_wav(text, output_dir / relpath):
+            manifest['speech'][text] = relpath
+            dsp.cached_envelope(output_dir / relpath)
+
+    packed = {(str(p), 0) for p in pathlib.Path(resources).iterdir()
+              if p.suffix.lower() in IMAGE_SUFFIXES}
+    packed.update(assets.images)
+    build_resource_pack(output_dir / PACK_NAME, sorted(packed), display_size)
+    manifest['pack'] = PACK_NAME
+
+    for path in manifest['sounds']:
+        if pathlib.Path(path).exists():
+            logger.info(f"Analysing beats: {path}")
+            dsp.cached_beats(path)
+
+    manifest_path = output_dir / MANIFEST_NAME
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    logger.info(f"Wrote bundle with {len(manifest['speech'])} phrases and "
+                f"{len(packed)} images to {output_dir}")
+    return manifest_path
+
+
+class AssetBundle(object):
+    """A loaded asset bundle.
+
+    `speech` maps text to rendered wav paths; `pack` is the path of the
+    display resource pack, which holds the images, if one was built.
+    """
+    def __init__(self, root: pathlib.Path, speech: Mapping,
+                 sounds: Iterable[str], pack: pathlib.Path = None):
+        self.root = root
+        self.speech = speech
+        self.sounds = list(sounds)
+        self.pack = pack
+
+    def __repr__(self):
+        return (f"{self.__class__.__name__}(root={self.root}, "
+                f"n_speech={len(self.speech)}, pack={self.pack})")
+
+    @classmethod
+    def load(cls, root: pathlib.Path = DEFAULT_BUNDLE) -> 'AssetBundle':
+        root = pathlib.Path(root)
+        with open(root / MANIFEST_NAME) as f:
+            manifest = json.load(f)
+
+        if manifest.get('version') != MANIFEST_VERSION:
+            raise ValueError(
+                f"Unsupported bundle version: {manifest.get('version')}")
+
+        speech = {text: root / relpath
+                  for text, relpath in manifest['speech'].items()}
+        pack = root / manifest['pack'] if manifest.get('pack') else None
+        return cls(root, speech, manifest['sounds'], pack)
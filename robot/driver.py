@@ -13,8 +13,12 @@ try:
 except ImportError:
     import robot.dummyGPIO as GPIO
 
+import robot.bundle as robot_bundle
+import robot.events as robot_events
 import robot.sensors.buttons as buttons
 import robot.sensors.adc as robot_adc
+import robot.sensors.microphone as robot_microphone
+import robot.outputs.compositor as robot_compositor
 import robot.outputs.display as robot_display
 import robot.outputs.servos as servos
 import robot.outputs.sound as robot_sound
@@ -48,14 +52,29 @@ class RobotDriver:
         self.servos = servos.servo_factory(self.config.get('servos', []))
 
         self.adc = robot_adc.ADCPoller(**self.config.get('adc'))
+        self.microphone = robot_microphone.microphone_factory(
+            self.config.get('microphone'))
 
-        # Clear/reset the callbacks
-        self.deregister_callbacks()
+        # Sensors publish to the event bus; actions subscribe to it.
+        self.events = robot_events.EventBus()
+        self.connect_publishers()
 
         self.displays = robot_display.display_factory(
             self.config.get('display'))
+        self.display_group = None
+        if len(self.displays) > 1:
+            self.display_group = robot_display.DisplayGroup(
+                self.displays, **self.config.get('display_group', {}))
+        self.compositor_config = self.config.get('compositor')
+        self.compositor = None
 
-        self.sound = robot_sound.SoundResource()
+        self.sound = robot_sound.SoundResource(**self.config.get('sound', {}))
+        self.lip_sync = self.config.get('lip_sync')
+        if self.lip_sync:
+            self.sound.envelope_callback = self.move_lips
+
+        self.bundle_path = pathlib.Path(
+            self.config.get('bundle', robot_bundle.DEFAULT_BUNDLE))
 
     def __enter__(self) -> 'RobotDriver':
         self.setup()
@@ -73,21 +92,35 @@ class RobotDriver:
                 f"n_leds={self.get_n_leds()},"
                 f"n_servos={len(self.servos)})")
 
-    def register_button_callback(self, callback):
-        self.adc.set_button_callback(callback)
+    def connect_publishers(self):
+        """Point every sensor's callback at the event bus. This is done
+        once; actions only change the bus's subscriptions."""
+        Topic = robot_events.Topic
+        self.adc.set_button_callback(self.events.publisher(Topic.BUTTON))
+        self.adc.set_knob_callback(self.events.publisher(Topic.KNOB))
+        if self.microphone:
+            self.microphone.set_loudness_callback(
+                self.events.publisher(Topic.LOUDNESS))
+            self.microphone.set_clap_callback(
+                self.events.publisher(Topic.CLAP))
 
         for button in self.buttons:
-            button.register_callback(callback)
-            logger.info(f"Button: {button}, {callback}, {button.callback}")
+            button.register_callback(self.events.publisher(Topic.BUTTON))
+
+    def register_button_callback(self, callback):
+        self.events.subscribe(robot_events.Topic.BUTTON, callback)
 
     def register_knob_callback(self, callback):
-        self.adc.set_knob_callback(callback)
+        self.events.subscribe(robot_events.Topic.KNOB, callback)
 
-    def deregister_callbacks(self):
-        self.adc.clear_callbacks()
+    def register_loudness_callback(self, callback):
+        self.events.subscribe(robot_events.Topic.LOUDNESS, callback)
 
-        for button in self.buttons:
-            button.clear_callback()
+    def register_clap_callback(self, callback):
+        self.events.subscribe(robot_events.Topic.CLAP, callback)
+
+    def deregister_callbacks(self):
+        self.events.clear()
 
     def get_n_leds(self) -> int:
         return len(self.leds)
@@ -110,6 +143,8 @@ class RobotDriver:
 
     def trigger_button_cb(self, index: int) -> None:
         logger.info(f"Trigger button {index} callback.")
+        if 0 <= index < len(self.buttons):
+            self.events.publish(robot_events.Topic.BUTTON, self.buttons[index])
 
     def set_servo_position(self, label: str, position: float) -> None:
         logger.info(f"Set Servo {label}: {position}")
@@ -124,9 +159,20 @@ class RobotDriver:
         if servo:
             servo.set_position_stepped(position, duration, steps)
 
+    def move_lips(self, level: float) -> None:
+        """Move the lip-sync servo to follow the level (0-1) of speech."""
+        servo = self.servos.get(self.lip_sync.get('servo', 'head'))
+        if servo:
+            servo.set_position_norm(self.lip_sync.get('rest', 0.5) +
+                                    self.lip_sync.get('depth', 0.15) * level)
+
     def read_adc(self) -> np.ndarray:
         return self.adc.poll()
 
+    def read_microphone(self):
+        if self.microphone:
+            return self.microphone.poll()
+
     def read_adc_with_buttons(self) -> np.ndarray:
         adc_vals = self.adc.poll()
         ADC_BUTTON_THRESHOLD = 700
@@ -135,6 +181,12 @@ class RobotDriver:
 
     @property
     def display(self) -> Optional[robot_display.OLEDDisplay]:
+        if self.compositor is not None:
+            return self.compositor
+
+        if self.display_group is not None:
+            return self.display_group
+
         if not self.displays:
             return None
 
@@ -146,9 +198,43 @@ class RobotDriver:
         for s in self.servos.values():
             s.setup()
         self.adc.setup()
+        if self.microphone:
+            try:
+                self.microphone.setup()
+            except (RuntimeError, OSError) as e:
+                logger.warning(f"Microphone unavailable ({e}); not listening")
+                self.microphone = None
         for d in self.displays:
             d.setup()
         self.sound.setup()
+        self.load_bundle()
+
+        if self.compositor_config is not None and self.displays:
+            self.compositor = robot_compositor.Compositor(
+                self.display_group or self.displays[0],
+                **self.compositor_config)
+            self.compositor.start()
+
+    def load_bundle(self) -> None:
+        """Load the precompiled asset bundle, if one has been built."""
+        if not (self.bundle_path / robot_bundle.MANIFEST_NAME).exists():
+            logger.info(f"No asset bundle at {self.bundle_path}")
+            return
+
+        try:
+            bundle = robot_bundle.AssetBundle.load(self.bundle_path)
+        except ValueError as e:
+            logger.warning(f"Ignoring asset bundle at {self.bundle_path} "
+                           f"({e}); rebuild it with the bundle mode")
+            return
+        logger.info(f"Loaded {bundle}")
+        self.sound.load_bundle(bundle)
+        for d in self.displays:
+            d.load_bundle(bundle)
 
     def cleanup(self) -> None:
+        if self.compositor is not None:
+            self.compositor.stop()
+        if self.microphone:
+            self.microphone.cleanup()
         GPIO.cleanup()
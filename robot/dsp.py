@@ -0,0 +1,216 @@
+"""Signal analysis helpers, vectorized with NumPy.
+
+These run offline or once per asset where possible, with the results
+cached next to the source file, so the Pi only pays for them once.
+"""
+import logging
+import pathlib
+
+import numpy as np
+
+from robot.outputs.audio import read_wav
+
+logger = logging.getLogger(__name__)
+
+
+def frame_signal(x: np.ndarray, frame_length: int, hop: int) -> np.ndarray:
+    """View a 1-D signal as overlapping frames of shape
+    (n_frames, frame_length), without copying.
+
+    The signal is zero padded so the last partial frame is kept.
+    """
+    if len(x) < frame_length:
+        x = np.pad(x, (0, frame_length - len(x)))
+    else:
+        remainder = (len(x) - frame_length) % hop
+        if remainder:
+            x = np.pad(x, (0, hop - remainder))
+    n_frames = 1 + (len(x) - frame_length) // hop
+    stride = x.strides[0]
+    return np.lib.stride_tricks.as_strided(
+        x, shape=(n_frames, frame_length), strides=(hop * stride, stride),
+        writeable=False)
+
+
+def to_mono_float(samples: np.ndarray) -> np.ndarray:
+    """Convert int16 samples of shape (frames,) or (frames, channels) to
+    mono floats in [-1, 1]."""
+    samples = np.asarray(samples, dtype=np.float32)
+    if samples.ndim > 1:
+        samples = samples.mean(axis=1)
+    return samples / 32768.0
+
+
+def rms_envelope(samples: np.ndarray, sr: int, rate: int = 50) -> np.ndarray:
+    """Downsample a signal to its RMS level at `rate` frames per second,
+    normalized so the loudest frame is 1."""
+    hop = max(1, int(sr // rate))
+    frames = frame_signal(to_mono_float(samples), hop, hop)
+    rms = np.sqrt(np.mean(np.square(frames), axis=1))
+    peak = rms.max() if len(rms) else 0.0
+    if peak > 0:
+        rms /= peak
+    return rms.astype(np.float32)
+
+
+def envelope_path(path: pathlib.Path, rate: int) -> pathlib.Path:
+    path = pathlib.Path(path)
+    return path.with_name(f"{path.stem}.env{rate}.npy")
+
+
+def cached_envelope(path: pathlib.Path, rate: int = 50) -> np.ndarray:
+    """The RMS envelope of a wav file, computed once and cached next to
+    it."""
+    path = pathlib.Path(path)
+    cache_path = envelope_path(path, rate)
+    if (cache_path.exists() and
+            cache_path.stat().st_mtime >= path.stat().st_mtime):
+        return np.load(cache_path)
+
+    samples, sr = read_wav(path)
+    envelope = rms_envelope(samples, sr, rate)
+    try:
+        np.save(cache_path, envelope)
+    except OSError:
+        logger.warning(f"Could not cache envelope at {cache_path}")
+    return envelope
+
+
+def stft_magnitude(x: np.ndarray, n_fft: int = 1024,
+                   hop: int = 512) -> np.ndarray:
+    """Magnitude spectrogram of shape (n_frames, n_fft // 2 + 1)."""
+    frames = frame_signal(x, n_fft, hop)
+    return np.abs(np.fft.rfft(frames * np.hanning(n_fft), axis=1))
+
+
+def spectral_flux(magnitude: np.ndarray, compression: float = 100.0) -> np.ndarray:
+    """Onset strength per frame: the summed, half-wave rectified increase
+    in log-compressed magnitude from the previous frame, normalized to a
+    peak of 1."""
+    log_mag = np.log1p(compression * magnitude)
+    flux = np.maximum(np.diff(log_mag, axis=0), 0.0).sum(axis=1)
+    flux = np.concatenate([[0.0], flux])
+    peak = flux.max() if len(flux) else 0.0
+    return flux / peak if peak > 0 else flux
+
+
+def moving_average(x: np.ndarray, width: int) -> np.ndarray:
+    """Centred moving average, the same length as `x`."""
+    width = max(1, int(width))
+    return np.convolve(x, np.ones(width) / width, mode='same')
+
+
+def pick_onsets(flux: np.ndarray, frame_rate: float, delta: float = 0.07,
+                window: float = 0.1, min_interval: float = 0.05) -> np.ndarray:
+    """Frame indices of onsets: local maxima of `flux` which exceed its
+    local average by `delta`."""
+    if len(flux) < 3:
+        return np.zeros(0, dtype=int)
+    threshold = moving_average(flux, window * frame_rate) + delta
+    peaks = np.flatnonzero((flux[1:-1] > flux[:-2]) &
+                           (flux[1:-1] >= flux[2:]) &
+                           (flux[1:-1] > threshold[1:-1])) + 1
+
+    # Drop onsets closer than min_interval to the previous kept one.
+    min_frames = min_interval * frame_rate
+    kept = []
+    for p in peaks:
+        if not kept or p - kept[-1] >= min_frames:
+            kept.append(p)
+    return np.array(kept, dtype=int)
+
+
+def estimate_tempo(flux: np.ndarray, frame_rate: float,
+                   min_bpm: float = 60.0, max_bpm: float = 180.0,
+                   prior_bpm: float = 120.0) -> float:
+    """Estimate the tempo in BPM from the autocorrelation of the onset
+    strength, weighted towards `prior_bpm` to avoid settling on half or
+    double the tempo. Returns 0 if the signal is too short."""
+    x = moving_average(flux, 3)
+    x = x - x.mean()
+    n = len(x)
+    min_lag = int(np.floor(60.0 * frame_rate / max_bpm))
+    max_lag = int(np.ceil(60.0 * frame_rate / min_bpm))
+    if n <= max_lag or min_lag < 1:
+        return 0.0
+
+    spectrum = np.fft.rfft(x, 2 * n)
+    autocorr = np.fft.irfft(spectrum * np.conj(spectrum))[:n]
+    lags = np.arange(min_lag, max_lag + 1)
+    prior = np.exp(-0.5 * np.log2(60.0 * frame_rate / lags / prior_bpm) ** 2)
+    weighted = autocorr[lags] * prior
+    i = int(np.argmax(weighted))
+    lag = float(lags[i])
+    if 0 < i < len(lags) - 1:
+        # Parabolic interpolation for a fractional lag.
+        a, b, c = weighted[i - 1:i + 2]
+        denominator = a - 2 * b + c
+        if denominator != 0:
+            lag += 0.5 * (a - c) / denominator
+    return 60.0 * frame_rate / lag
+
+
+def track_beats(flux: np.ndarray, frame_rate: float,
+                tempo: float) -> np.ndarray:
+    """Frame indices of a regular beat grid at `tempo`, phase aligned to
+    where the onset strength is greatest."""
+    if tempo <= 0:
+        return np.zeros(0, dtype=int)
+    period = 60.0 * frame_rate / tempo
+    n_beats = int((len(flux) - 1) // period) + 1
+    offsets = np.arange(int(np.ceil(period)))
+    grid = np.round(offsets[:, np.newaxis] +
+                    period * np.arange(n_beats)).astype(int)
+    scores = np.where(grid < len(flux), flux[np.minimum(grid, len(flux) - 1)],
+                      0.0).sum(axis=1)
+    beats = grid[int(np.argmax(scores))]
+    return beats[beats < len(flux)]
+
+
+class BeatAnalysis(object):
+    """Tempo (BPM), and beat and onset times (seconds) of a piece."""
+    def __init__(self, tempo: float, beats: np.ndarray, onsets: np.ndarray):
+        self.tempo = float(tempo)
+        self.beats = np.asarray(beats, dtype=float)
+        self.onsets = np.asarray(onsets, dtype=float)
+
+    def __repr__(self):
+        return (f"{self.__class__.__name__}(tempo={self.tempo:.1f}, "
+                f"n_beats={len(self.beats)}, n_onsets={len(self.onsets)})")
+
+
+def analyse_beats(samples: np.ndarray, sr: int, n_fft: int = 1024,
+                  hop: int = 512) -> BeatAnalysis:
+    """Detect the onsets, tempo and beats of int16 samples."""
+    frame_rate = sr / hop
+    flux = spectral_flux(stft_magnitude(to_mono_float(samples), n_fft, hop))
+    tempo = estimate_tempo(flux, frame_rate)
+    beats = track_beats(flux, frame_rate, tempo)
+    onsets = pick_onsets(flux, frame_rate)
+    return BeatAnalysis(tempo, beats / frame_rate, onsets / frame_rate)
+
+
+def beats_path(path: pathlib.Path) -> pathlib.Path:
+    path = pathlib.Path(path)
+    return path.with_name(f"{path.stem}.beats.npz")
+
+
+def cached_beats(path: pathlib.Path) -> BeatAnalysis:
+    """The beat analysis of a wav file, computed once and cached next to
+    it."""
+    path = pathlib.Path(path)
+    cache_path = beats_path(path)
+    if (cache_path.exists() and
+            cache_path.stat().st_mtime >= path.stat().st_mtime):
+        with np.load(cache_path) as cached:
+            return BeatAnalysis(cached['tempo'], cached['beats'],
+                                cached['onsets'])
+
+    samples, sr = read_wav(path)
+    analysis = analyse_beats(samples, sr)
+    try:
+        np.savez(cache_path, tempo=analysis.tempo, beats=analysis.beats,
+                 onsets=analysis.onsets)
+    except OSError:
+        logger.warning(f"Could not cache beats at {cache_path}")
+    return analysis
@@ -0,0 +1,142 @@
+"""Route sensor input to actions through a publish/subscribe event bus.
+
+Publishers (the ADC poller, buttons, microphone, HTTP server and timers)
+are wired to the bus once, when the driver is created. Actions subscribe
+to the topics they handle when they start and unsubscribe when they end,
+which only touches the bus, never the sensors.
+
+Events published from another thread (e.g. GPIO edge callbacks) are
+handed to the event loop, so subscribers always run on the loop.
+"""
+import asyncio
+import enum
+import logging
+import threading
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+@enum.unique
+class Topic(str, enum.Enum):
+    BUTTON = ('button', 'button_callback')
+    KNOB = ('knob', 'knob_callback')
+    LOUDNESS = ('loudness', 'loudness_callback')
+    CLAP = ('clap', 'clap_callback')
+    TIMER = ('timer', 'timer_callback')
+
+    def __new__(cls, value, handler_name):
+        # Topics key the subscriber dict, so they need their string value.
+        obj = str.__new__(cls, value)
+        obj._value_ = value
+        obj.handler_name = handler_name
+        return obj
+
+    def __str__(self):
+        return self.value
+
+
+class Tick(NamedTuple):
+    """A timer event."""
+    name: str
+    count: int
+    time: float
+
+
+class EventBus(object):
+    """Deliver events to the subscribers of their topic.
+
+    Subscribers are kept as a tuple per topic, replaced on (un)subscribe,
+    so publishing is a dict lookup and one call per subscriber.
+    Coroutine functions are scheduled as tasks rather than called.
+    """
+    def __init__(self):
+        self._subscribers = {}
+        self.loop = None
+        self._loop_thread = None
+
+    def attach(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Deliver events on `loop`, which must run on this thread."""
+        self.loop = loop
+        self._loop_thread = threading.get_ident()
+
+    def subscribe(self, topic: Topic, callback: Callable) -> Callable:
+        topic = Topic(topic)
+        self._subscribers[topic] = (self._subscribers.get(topic, ()) +
+                                    (callback,))
+        return callback
+
+    def unsubscribe(self, topic: Topic, callback: Callable) -> bool:
+        topic = Topic(topic)
+        subscribers = self._subscribers.get(topic, ())
+        if callback not in subscribers:
+            return False
+        subscribers = list(subscribers)
+        subscribers.remove(callback)
+        self._subscribers[topic] = tuple(subscribers)
+        return True
+
+    def subscribe_handlers(self, obj) -> List[Tuple[Topic, Callable]]:
+        """Subscribe `obj`'s `<topic>_callback` methods to their topics,
+        returning the subscriptions."""
+        subscriptions = []
+        for topic in Topic:
+            handler = getattr(obj, topic.handler_name, None)
+            if handler is not None:
+                subscriptions.append((topic, self.subscribe(topic, handler)))
+        return subscriptions
+
+    def subscribers(self, topic: Topic) -> Tuple[Callable, ...]:
+        return self._subscribers.get(Topic(topic), ())
+
+    def clear(self) -> None:
+        self._subscribers = {}
+
+    def publisher(self, topic: Topic) -> Callable:
+        """A callback which publishes its argument to `topic`, for wiring
+        up sensors which take a single callback."""
+        topic = Topic(topic)
+        return lambda event: self.publish(topic, event)
+
+    def publish(self, topic: Topic, event=None) -> None:
+        if (self.loop is not None and
+                threading.get_ident() != self._loop_thread):
+            self.loop.call_soon_threadsafe(self._dispatch, Topic(topic), event)
+        else:
+            self._dispatch(Topic(topic), event)
+
+    def _dispatch(self, topic, event):
+        for callback in self._subscribers.get(topic, ()):
+            try:
+                if asyncio.iscoroutinefunction(callback):
+                    asyncio.ensure_future(callback(event))
+                else:
+                    callback(event)
+            except Exception:
+                logger.exception(f"{callback} failed handling {topic}")
+
+    async def wait_for(self, topic: Topic, timeout: Optional[float] = None):
+        """Wait for the next event on `topic`."""
+        future = asyncio.get_event_loop().create_future()
+
+        def resolve(event):
+            if not future.done():
+                future.set_result(event)
+
+        self.subscribe(topic, resolve)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self.unsubscribe(topic, resolve)
+
+    async def run_timer(self, name: str, interval: float,
+                        count: Optional[int] = None) -> None:
+        """Publish a `Tick` to the timer topic every `interval` seconds,
+        `count` times (forever if None)."""
+        loop = asyncio.get_event_loop()
+        start = loop.time()
+        i = 0
+        while count is None or i < count:
+            i += 1
+            await asyncio.sleep(max(0.0, start + i * interval - loop.time()))
+            self.publish(Topic.TIMER, Tick(name, i, loop.time() - start))
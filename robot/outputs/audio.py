@@ -0,0 +1,386 @@
+"""Audio output backends.
+
+`SoundResource` and `ChannelManager` talk to the mixer only through one of
+these, so the sound pipeline can run without a sound card:
+
+- `PygameBackend` plays through `pygame.mixer`.
+- `FileSinkBackend` plays nothing, but records every sound with the time
+  it would have started, and can mix the recording down to a NumPy buffer
+  or a WAV file for tests and benchmarks.
+
+Sounds are opaque handles created by the backend (`load`/`make_sound`).
+"""
+import abc
+import enum
+import logging
+import pathlib
+import time
+import wave
+from typing import Callable, List, NamedTuple, Optional
+
+import numpy as np
+
+try:
+    import pygame
+except ImportError:
+    pygame = None
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_DTYPES = {1: np.uint8, 2: np.int16, 4: np.int32}
+
+
+def read_wav(path) -> (np.ndarray, int):
+    """Read a PCM wav file as an int16 array of shape (frames, channels),
+    along with its sample rate."""
+    with wave.open(str(path), 'rb') as f:
+        n_channels = f.getnchannels()
+        width = f.getsampwidth()
+        sr = f.getframerate()
+        frames = f.readframes(f.getnframes())
+
+    if width not in SAMPLE_DTYPES:
+        raise ValueError(f"Unsupported sample width {width} in {path}")
+    samples = np.frombuffer(frames, dtype=SAMPLE_DTYPES[width])
+    if width == 1:
+        samples = (samples.astype(np.int16) - 128) << 8
+    elif width == 4:
+        samples = samples >> 16
+    return samples.astype(np.int16).reshape(-1, n_channels), sr
+
+
+def write_wav(path, samples: np.ndarray, sr: int) -> None:
+    """Write mono or (frames, channels) int16 samples to a wav file."""
+    samples = np.asarray(samples, dtype=np.int16)
+    n_channels = 1 if samples.ndim == 1 else samples.shape[1]
+    with wave.open(str(path), 'wb') as f:
+        f.setnchannels(n_channels)
+        f.setsampwidth(2)
+        f.setframerate(sr)
+        f.writeframes(samples.tobytes())
+
+
+def resample(samples: np.ndarray, sr_in: int, sr_out: int) -> np.ndarray:
+    """Linearly resample a 1-D array from `sr_in` to `sr_out`."""
+    if sr_in == sr_out or len(samples) == 0:
+        return samples
+    n_out = int(round(len(samples) * sr_out / sr_in))
+    positions = np.arange(n_out) * (sr_in / sr_out)
+    return np.interp(positions, np.arange(len(samples)),
+                     samples).astype(samples.dtype)
+
+
+def mix_segments(segments, sr):
+    """Mix `(at, samples)` segments into a single mono int16 buffer.
+
+    Each segment starts at `at` seconds, or straight after the previous
+    segment when `at` is None; overlapping segments are summed and clipped.
+    """
+    placed = []
+    cursor = 0
+    for at, samples in segments:
+        start = cursor if at is None else int(round(at * sr))
+        placed.append((start, samples))
+        cursor = start + len(samples)
+
+    length = max((start + len(x) for start, x in placed), default=0)
+    buffer = np.zeros(length, dtype=np.int32)
+    for start, samples in placed:
+        buffer[start:start + len(samples)] += samples
+
+    return np.clip(buffer, -32768, 32767).astype(np.int16)
+
+
+def load_mono(path, sr: int) -> np.ndarray:
+    """Decode a wav file to mono int16 at `sr`."""
+    samples, file_sr = read_wav(path)
+    mono = samples.mean(axis=1).astype(np.int16)
+    return resample(mono, file_sr, sr)
+
+
+class AudioBackend(abc.ABC):
+    """The mixer operations the sound pipeline needs.
+
+    Channels are addressed by index. The first `n_reserved` channels are
+    only ever used explicitly; `play_free` picks one of the others.
+    """
+    sr = None
+
+    @abc.abstractmethod
+    def setup(self, sr: int, n_reserved: int, n_free: int) -> None:
+        pass
+
+    @abc.abstractmethod
+    def load(self, path):
+        """Decode a file into a sound at the mixer's rate."""
+
+    @abc.abstractmethod
+    def make_sound(self, samples: np.ndarray):
+        """Make a sound from mono int16 samples at the mixer's rate."""
+
+    @abc.abstractmethod
+    def to_array(self, sound) -> np.ndarray:
+        """Return the mono int16 samples of a sound."""
+
+    @abc.abstractmethod
+    def get_length(self, sound) -> float:
+        pass
+
+    @abc.abstractmethod
+    def play(self, index: int, sound, maxtime: int = 0) -> None:
+        pass
+
+    @abc.abstractmethod
+    def play_free(self, sound) -> None:
+        """Play on any unreserved channel."""
+
+    @abc.abstractmethod
+    def queue(self, index: int, sound) -> None:
+        """Play `sound` on channel `index` once its current sound ends."""
+
+    @abc.abstractmethod
+    def get_queue(self, index: int):
+        pass
+
+    @abc.abstractmethod
+    def get_busy(self, index: int) -> bool:
+        pass
+
+    @abc.abstractmethod
+    def stop(self, index: int) -> None:
+        pass
+
+    def enable_end_events(self, indices) -> bool:
+        """Ask for an event when a sound ends on any of `indices`; returns
+        False if the backend can only be polled."""
+        return False
+
+    def disable_end_events(self, index: int) -> None:
+        pass
+
+    def restore_end_events(self, index: int) -> None:
+        pass
+
+    def get_end_events(self) -> List[int]:
+        """Indices of the channels which have posted end events."""
+        return []
+
+    def wait(self, seconds: float) -> None:
+        time.sleep(seconds)
+
+
+class PygameBackend(AudioBackend):
+    """Play through `pygame.mixer`."""
+    def __init__(self):
+        self._end_events = {}
+
+    def setup(self, sr, n_reserved, n_free):
+        if pygame is None:
+            raise RuntimeError("pygame is not installed")
+        pygame.mixer.pre_init(sr, -16, 1)
+        pygame.mixer.init()
+        self.sr, _, self.n_channels = pygame.mixer.get_init()
+
+        pygame.mixer.set_num_channels(n_reserved + n_free)
+        # Sound.play() only picks unreserved channels, so the sync play
+        # helpers can never take over a managed channel.
+        pygame.mixer.set_reserved(n_reserved)
+
+    def load(self, path):
+        # The mixer converts to its own rate and format when loading, so
+        # cached sounds never decode or resample at play time.
+        return pygame.mixer.Sound(str(path))
+
+    def make_sound(self, samples):
+        if self.n_channels > 1:
+            samples = np.repeat(samples[:, np.newaxis], self.n_channels,
+                                axis=1)
+        return pygame.sndarray.make_sound(np.ascontiguousarray(samples))
+
+    def to_array(self, sound):
+        samples = pygame.sndarray.array(sound)
+        if samples.ndim > 1:
+            samples = samples.mean(axis=1)
+        return samples.astype(np.int16)
+
+    def get_length(self, sound):
+        return sound.get_length()
+
+    def play(self, index, sound, maxtime=0):
+        pygame.mixer.Channel(index).play(sound, maxtime=maxtime)
+
+    def play_free(self, sound):
+        sound.play()
+
+    def queue(self, index, sound):
+        pygame.mixer.Channel(index).queue(sound)
+
+    def get_queue(self, index):
+        return pygame.mixer.Channel(index).get_queue()
+
+    def get_busy(self, index):
+        return pygame.mixer.Channel(index).get_busy()
+
+    def stop(self, index):
+        pygame.mixer.Channel(index).stop()
+
+    def enable_end_events(self, indices):
+        try:
+            if not pygame.display.get_init():
+                pygame.display.init()
+            pygame.event.set_blocked(None)
+        except pygame.error:
+            logger.info("No pygame event queue; polling mixer channels")
+            return False
+
+        for i in indices:
+            self._end_events[pygame.USEREVENT + i] = i
+            pygame.mixer.Channel(i).set_endevent(pygame.USEREVENT + i)
+        pygame.event.set_allowed(list(self._end_events))
+        return True
+
+    def disable_end_events(self, index):
+        pygame.mixer.Channel(index).set_endevent()
+
+    def restore_end_events(self, index):
+        if pygame.USEREVENT + index in self._end_events:
+            pygame.mixer.Channel(index).set_endevent(pygame.USEREVENT + index)
+
+    def get_end_events(self):
+        return [self._end_events[event.type]
+                for event in pygame.event.get(list(self._end_events))]
+
+    def wait(self, seconds):
+        pygame.time.wait(int(seconds * 1000))
+
+
+class Playback(NamedTuple):
+    """A sound recorded by the `FileSinkBackend`."""
+    time: float
+    channel: Optional[int]
+    samples: np.ndarray
+
+
+class FileSinkBackend(AudioBackend):
+    """Record what would have played, with timestamps, instead of playing it.
+
+    Channel state follows a clock (real time by default), so code waiting
+    on sounds to finish behaves as it would with a sound card. Call
+    `render()` or `write()` to mix the recording down.
+    """
+    def __init__(self, path: Optional[str] = None,
+                 clock: Callable[[], float] = time.monotonic,
+                 n_channels: int = 1):
+        self.path = path
+        self.clock = clock
+        self.n_channels = n_channels
+        self.playbacks = []
+        self._playing = {}
+        self._queued = {}
+        self._start = None
+
+    def setup(self, sr, n_reserved, n_free):
+        self.sr = sr
+        self.n_reserved = n_reserved
+        self.n_free = n_free
+        self._start = self.clock()
+
+    def now(self) -> float:
+        """Seconds since setup."""
+        return self.clock() - self._start
+
+    def load(self, path):
+        return load_mono(path, self.sr)
+
+    def make_sound(self, samples):
+        return np.array(samples, dtype=np.int16)
+
+    def to_array(self, sound):
+        return sound
+
+    def get_length(self, sound):
+        return len(sound) / self.sr
+
+    def _start_playback(self, index, samples, at):
+        self.playbacks.append(Playback(at, index, samples))
+        self._playing[index] = (at, len(self.playbacks) - 1)
+
+    def _truncate(self, index, at):
+        """Cut a recorded playback short at time `at`."""
+        start, i = self._playing.pop(index)
+        playback = self.playbacks[i]
+        n = max(0, int(round((at - start) * self.sr)))
+        if n < len(playback.samples):
+            self.playbacks[i] = playback._replace(samples=playback.samples[:n])
+
+    def _update(self, index):
+        """Advance channel `index` to the current time, starting any
+        queued sound where the previous one ended."""
+        now = self.now()
+        while index in self._playing:
+            start, i = self._playing[index]
+            end = start + len(self.playbacks[i].samples) / self.sr
+            if end > now:
+                break
+            del self._playing[index]
+            if index in self._queued:
+                self._start_playback(index, self._queued.pop(index), end)
+
+    def play(self, index, sound, maxtime=0):
+        self.stop(index)
+        if maxtime:
+            sound = sound[:int(self.sr * maxtime / 1000)]
+        self._start_playback(index, sound, self.now())
+
+    def play_free(self, sound):
+        self.playbacks.append(Playback(self.now(), None, sound))
+
+    def queue(self, index, sound):
+        self._update(index)
+        if index in self._playing:
+            self._queued[index] = sound
+        else:
+            self._start_playback(index, sound, self.now())
+
+    def get_queue(self, index):
+        self._update(index)
+        return self._queued.get(index)
+
+    def get_busy(self, index):
+        self._update(index)
+        return index in self._playing
+
+    def stop(self, index):
+        self._update(index)
+        self._queued.pop(index, None)
+        if index in self._playing:
+            self._truncate(index, self.now())
+
+    def render(self) -> np.ndarray:
+        """Mix everything recorded so far into one mono int16 buffer."""
+        return mix_segments([(p.time, p.samples) for p in self.playbacks],
+                            self.sr)
+
+    def write(self, path=None) -> pathlib.Path:
+        path = pathlib.Path(path or self.path)
+        write_wav(path, self.render(), self.sr)
+        return path
+
+
+@enum.unique
+class AudioBackendType(str, enum.Enum):
+    PYGAME = ('pygame', PygameBackend)
+    FILE = ('file', FileSinkBackend)
+
+    def __new__(cls, value, backend_cls):
+        obj = str.__new__(cls)
+        obj._value_ = value
+        obj.backend_cls = backend_cls
+        return obj
+
+    def __str__(self):
+        return self.value
+
+
+def backend_factory(backend_type: str = 'pygame', **kwargs) -> AudioBackend:
+    return AudioBackendType(backend_type).backend_cls(**kwargs)
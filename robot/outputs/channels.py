@@ -0,0 +1,181 @@
+"""Mixer channel management.
+
+Channels of the mixer are reserved per category (speech, sfx,
+music). A sound played through the `ChannelManager` gets a future which
+resolves when the channel reports that it has finished, rather than
+sleeping for a guessed duration. When every channel of a category is busy,
+the lowest priority (then oldest) voice is stolen if the new sound's
+priority is at least as high.
+"""
+import asyncio
+import collections
+import itertools
+import logging
+from typing import Mapping, Optional
+
+from robot.outputs.audio import AudioBackend
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RESERVATIONS = {'speech': 1, 'sfx': 4, 'music': 1}
+
+
+class Voice(object):
+    """A sound playing on a reserved channel."""
+    def __init__(self, index, category, priority, order, future):
+        self.index = index
+        self.category = category
+        self.priority = priority
+        self.order = order
+        self.future = future
+
+    def __repr__(self):
+        return (f"{self.__class__.__name__}(channel={self.index}, "
+                f"category={self.category}, priority={self.priority})")
+
+
+class ChannelManager(object):
+    """Reserve mixer channels per category and track when sounds finish.
+
+    Completion is driven by the channels' end events when the backend
+    provides them, falling back to polling `get_busy()` otherwise. Either
+    way this runs on the event loop; no extra threads are used.
+    """
+    def __init__(self, backend: AudioBackend,
+                 reservations: Optional[Mapping[str, int]] = None,
+                 n_free_channels: int = 8, poll_interval: float = 0.005):
+        self.backend = backend
+        self.reservations = dict(reservations or DEFAULT_RESERVATIONS)
+        self.n_free_channels = n_free_channels
+        self.poll_interval = poll_interval
+
+        self.categories = {}
+        self.voices = {}
+        self.held = set()
+        self.use_events = False
+        self._stale_events = collections.Counter()
+        self._order = itertools.count()
+        self._watcher = None
+
+    @property
+    def n_reserved(self) -> int:
+        return sum(self.reservations.values())
+
+    def setup(self) -> None:
+        """Lay out the reserved channels; the backend must already be set
+        up with at least `n_reserved` reserved channels."""
+        index = 0
+        for category, count in self.reservations.items():
+            self.categories[category] = list(range(index, index + count))
+            index += count
+
+        self.use_events = self.backend.enable_end_events(
+            range(self.n_reserved))
+
+    def _choose_channel(self, category: str, priority: int) -> Optional[int]:
+        indices = [i for i in self.categories[category] if i not in self.held]
+        for i in indices:
+            if i not in self.voices and not self.backend.get_busy(i):
+                return i
+
+        # Steal the lowest priority, then oldest, voice.
+        victim = min((self.voices[i] for i in indices if i in self.voices),
+                     key=lambda v: (v.priority, v.order), default=None)
+        if victim is not None and victim.priority <= priority:
+            logger.debug(f"Stealing {victim} for priority {priority}")
+            self._halt(victim)
+            self._finish(victim.index, completed=False)
+            return victim.index
+
+        return None
+
+    def play(self, sound, category: str = 'sfx', priority: int = 0,
+             maxtime: int = 0) -> asyncio.Future:
+        """Play `sound` on a channel reserved for `category`.
+
+        Returns a future which resolves to True when the sound finishes,
+        or False if it was stolen by a higher priority sound or could not
+        be played. Cancelling the future stops the sound.
+        """
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+
+        index = self._choose_channel(category, priority)
+        if index is None:
+            logger.debug(f"No {category} channel free for priority {priority}")
+            future.set_result(False)
+            return future
+
+        voice = Voice(index, category, priority, next(self._order), future)
+        self.voices[index] = voice
+        future.add_done_callback(lambda f: self._on_done(voice))
+        self.backend.play(index, sound, maxtime=maxtime)
+
+        if self._watcher is None or self._watcher.done():
+            self._watcher = asyncio.ensure_future(self._watch())
+        return future
+
+    def acquire(self, category: str = 'music',
+                priority: int = 0) -> Optional[int]:
+        """Take exclusive use of a channel of `category`, e.g. to stream
+        into it with `AudioBackend.queue`. Returns the channel index, or
+        None if no channel can be taken.
+
+        The channel posts no end events until it is `release`d.
+        """
+        index = self._choose_channel(category, priority)
+        if index is None:
+            return None
+        self.held.add(index)
+        if self.use_events:
+            self.backend.disable_end_events(index)
+        return index
+
+    def release(self, index: int) -> None:
+        self.backend.stop(index)
+        self.held.discard(index)
+        if self.use_events:
+            self.backend.restore_end_events(index)
+
+    def stop(self, category: Optional[str] = None) -> None:
+        """Stop all voices, or only those of `category`."""
+        for voice in list(self.voices.values()):
+            if category is None or voice.category == category:
+                self._halt(voice)
+                self._finish(voice.index, completed=False)
+
+    def _halt(self, voice: Voice) -> None:
+        # Every voice posts exactly one end event, whether it finished or
+        # was halted; once the voice is gone that event is stale and must not
+        # be taken as the end of the channel's next sound.
+        if self.use_events:
+            self._stale_events[voice.index] += 1
+        self.backend.stop(voice.index)
+
+    def _on_done(self, voice: Voice) -> None:
+        if voice.future.cancelled() and self.voices.get(voice.index) is voice:
+            self._halt(voice)
+            del self.voices[voice.index]
+
+    def _finish(self, index: int, completed: bool) -> None:
+        voice = self.voices.pop(index, None)
+        if voice is not None and not voice.future.done():
+            voice.future.set_result(completed)
+
+    def poll(self) -> None:
+        """Resolve the futures of any voices which have finished."""
+        if self.use_events:
+            for index in self.backend.get_end_events():
+                if self._stale_events[index] > 0:
+                    self._stale_events[index] -= 1
+                else:
+                    self._finish(index, completed=True)
+        else:
+            for index, voice in list(self.voices.items()):
+                if not self.backend.get_busy(index):
+                    self._finish(index, completed=True)
+
+    async def _watch(self) -> None:
+        while self.voices:
+            await asyncio.sleep(self.poll_interval)
+            self.poll()
@@ -0,0 +1,192 @@
+"""Run display drawing on its own thread.
+
+SPI transfers to the OLED take milliseconds, and draw calls come from ADC
+knob callbacks and coroutines on the event loop. A `Compositor` owns a
+display on a dedicated thread instead: draw calls return immediately,
+only the latest command per layer is kept until the next frame, and
+frames are presented at most `fps` times a second, in one transfer
+however many layers were drawn.
+"""
+import asyncio
+import collections
+import logging
+import threading
+import time
+from typing import Callable, Hashable
+
+logger = logging.getLogger(__name__)
+
+
+class Compositor(object):
+    """Coalesce draw commands for a display and present them on a thread.
+
+    Each command replaces any pending command on the same layer (by
+    default, the name of the draw method). Pending layers are drawn in the
+    order they were last submitted.
+    """
+    def __init__(self, display, fps: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.display = display
+        self.fps = fps
+        self.clock = clock
+
+        self._pending = collections.OrderedDict()
+        self._condition = threading.Condition()
+        self._busy = False
+        self._running = False
+        self._thread = None
+        self.n_frames = 0
+        self.n_dropped = 0
+
+    def __getattr__(self, name):
+        # Anything that isn't a draw call (e.g. `device`) comes from the
+        # display itself.
+        return getattr(self.display, name)
+
+    def __repr__(self):
+        return (f"{self.__class__.__name__}(display={self.display}, "
+                f"fps={self.fps}, n_frames={self.n_frames}, "
+                f"n_dropped={self.n_dropped})")
+
+    def start(self) -> None:
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="compositor",
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, layer: Hashable, fn: Callable, *args, **kwargs) -> None:
+        """Queue `fn(*args, **kwargs)` to draw on `layer` at the next frame."""
+        with self._condition:
+            if layer in self._pending:
+                self.n_dropped += 1
+                del self._pending[layer]
+            self._pending[layer] = (fn, args, kwargs)
+            self._condition.notify_all()
+
+    def flush(self, timeout: float = None) -> bool:
+        """Wait until every pending command has been drawn."""
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: not self._pending and not self._busy, timeout)
+
+    def _run(self) -> None:
+        min_interval = 1.0 / self.fps if self.fps else 0.0
+        while True:
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: self._pending or not self._running)
+                if not self._running:
+                    return
+                commands = list(self._pending.values())
+                self._pending.clear()
+                self._busy = True
+
+            start = self.clock()
+            # Draw every layer into the back buffer, then send the frame.
+            self.display.auto_present = False
+            try:
+                for fn, args, kwargs in commands:
+                    try:
+                        fn(*args, **kwargs)
+                    except Exception:
+                        logger.exception(f"Display command {fn} failed")
+            finally:
+                self.display.auto_present = True
+            try:
+                self.display.present()
+            except Exception:
+                logger.exception(f"Presenting {self.display} failed")
+
+            self.n_frames += 1
+            with self._condition:
+                self._busy = False
+                self._condition.notify_all()
+
+            # Cap the frame rate; commands arriving meanwhile coalesce.
+            remaining = start + min_interval - self.clock()
+            if remaining > 0:
+                time.sleep(remaining)
+
+    def clear(self, layer='clear'):
+        self.submit(layer, self.display.clear)
+
+    def draw_text(self, text, layer='text'):
+        self.submit(layer, self.display.draw_text, text)
+
+    def draw_image(self, path, angle=0, layer='image'):
+        self.submit(layer, self.display.draw_image, path, angle)
+
+    def draw_frame(self, frame, layer='frame'):
+        self.submit(layer, self.display.draw_frame, frame)
+
+    def draw_rgb565(self, data, layer='frame'):
+        self.submit(layer, self.display.draw_rgb565, data)
+
+    def fill_rgb(self, r, g, b, layer='fill'):
+        self.submit(layer, self.display.fill_rgb, r, g, b)
+
+    def draw_bars(self, param1, param2, margin=5, layer='bars'):
+        self.submit(layer, self.display.draw_bars, param1, param2, margin)
+
+    def move_and_draw_strs(self, layer='stars'):
+        self.submit(layer, self.display.move_and_draw_strs)
+
+    # The compositor never blocks, so the async draw calls just submit.
+    async def aclear(self):
+        self.clear()
+        return True
+
+    async def adraw_text(self, text):
+        self.draw_text(text)
+        return True
+
+    async def adraw_image(self, path, angle=0):
+        self.draw_image(path, angle)
+        return True
+
+    async def adraw_frame(self, frame):
+        self.draw_frame(frame)
+        return True
+
+    async def adraw_rgb565(self, data):
+        self.draw_rgb565(data)
+        return True
+
+    async def aload_animation(self, paths, fps=None, angle=0):
+        """Load an animation for the display on the compositor thread,
+        which owns it."""
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+
+        def load():
+            try:
+                animation = self.display.load_animation(paths, fps, angle)
+            except Exception as e:
+                loop.call_soon_threadsafe(future.set_exception, e)
+            else:
+                loop.call_soon_threadsafe(future.set_result, animation)
+
+        self.submit(('load', id(future)), load)
+        return await future
+
+    async def afill_rgb(self, r, g, b):
+        self.fill_rgb(r, g, b)
+        return True
+
+    async def adraw_bars(self, param1, param2, margin=5):
+        self.draw_bars(param1, param2, margin)
+        return True
+
+    async def amove_and_draw_strs(self):
+        self.move_and_draw_strs()
+        return True
@@ -4,29 +4,473 @@ Display text on an OLED screen.
 """
 from typing import Mapping, List
 
+import asyncio
 import click
+import collections
+import concurrent.futures
+import functools
 import logging
-from random import randrange
+import re
+import string
 import textwrap
+import threading
 import time
-from PIL import Image
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont, ImageSequence
 import pathlib
 
+from robot.outputs.resource_pack import ResourcePack
+from robot.outputs.rgb565 import RGB565Encoder, decode_rgb565
+from robot.outputs.virtual_display import VirtualDevice
+
 # ignore PIL debug messages
 logging.getLogger('PIL').setLevel(logging.ERROR)
 logger = logging.getLogger(__name__)
 
 RESOURCES = pathlib.Path(__file__).resolve().parent.parent.parent / "resources"
 
-try:
-    from luma.core.render import canvas
-    from luma.core.virtual import viewport
-except ImportError:
-    logger.error("No luma display libraries located")
-    luma = None
+def fit_image(image, size, mode, angle=0):
+    """Make a device-ready frame from an image: scaled to fit `size`,
+    centred on a white background and converted to the device's `mode`."""
+    width, height = size
+    image = image.convert("RGBA")
+    image.thumbnail((width, height))
+    fff = Image.new(image.mode, image.size, (255,) * 4)
+
+    background = Image.new("RGBA", size, "white")
+    posn = ((width - image.width) // 2, 0)
+
+    rot = image.rotate(angle, resample=Image.BILINEAR)
+    img = Image.composite(rot, fff, rot)
+    background.paste(img, posn)
+    return background.convert(mode)
+
+
+def render_image(path, size, mode, angle=0):
+    """Render an image file to a device-ready frame (see `fit_image`)."""
+    return fit_image(Image.open(path), size, mode, angle)
+
+
+class FrameCache(object):
+    """Bounded LRU cache of device-ready image frames.
+
+    Frames are keyed by path, mtime, angle and the device's size and mode,
+    so an image is re-rendered if the file changes or it is drawn on a
+    different device.
+    """
+    def __init__(self, max_size=16):
+        self.max_size = max_size
+        self._entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, path, size, mode, angle=0):
+        """Return the frame for `path`, rendering it if it isn't cached.
+
+        Raises FileNotFoundError if the file does not exist.
+        """
+        path = pathlib.Path(path)
+        key = (str(path.resolve()), path.stat().st_mtime, angle,
+               tuple(size), mode)
+
+        frame = self._entries.get(key)
+        if frame is not None:
+            self._entries.move_to_end(key)
+            return frame
+
+        frame = render_image(path, size, mode, angle)
+        self._entries[key] = frame
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        return frame
+
+    def clear(self):
+        self._entries.clear()
+
+
+@functools.lru_cache(maxsize=64)
+def layout_text(text, char_width):
+    """Split text into lines, wrapping each at `char_width` characters."""
+    lines = []
+    for line in text.split('\n'):
+        lines.extend(textwrap.wrap(line, char_width))
+    return tuple(lines)
+
+
+class GlyphAtlas(object):
+    """Glyph tiles for one font and colour, rendered once and blitted
+    into RGB frames."""
+    LINE_HEIGHT = 12
+
+    def __init__(self, font=None, fill=(255, 255, 255)):
+        self.font = font or ImageFont.load_default()
+        self.fill = np.array(fill, dtype=np.float32) / 255
+        self._glyphs = {}
+        for char in string.printable:
+            self.glyph(char)
+
+    def _advance(self, char):
+        if hasattr(self.font, 'getlength'):
+            return int(round(self.font.getlength(char)))
+        return self.font.getsize(char)[0]
+
+    def glyph(self, char):
+        """The (tile, advance) of a character."""
+        glyph = self._glyphs.get(char)
+        if glyph is None:
+            advance = self._advance(char)
+            if hasattr(self.font, 'getbbox'):
+                right = self.font.getbbox(char)[2]
+            else:
+                right = advance
+            mask = Image.new('L', (max(1, advance, right), self.LINE_HEIGHT))
+            ImageDraw.Draw(mask).text((0, 0), char, fill=255, font=self.font)
+            tile = (np.asarray(mask)[..., np.newaxis] * self.fill)
+            glyph = self._glyphs[char] = (tile.astype(np.uint8), advance)
+        return glyph
+
+    def offset(self, line, n):
+        """The x position of the `n`th character of `line`."""
+        return sum(self.glyph(c)[1] for c in line[:n])
+
+    def blit(self, frame, line, x, y):
+        """Draw `line` into `frame` with its top left at (x, y)."""
+        height, width = frame.shape[:2]
+        for char in line:
+            if x >= width:
+                break
+            tile, advance = self.glyph(char)
+            h = min(tile.shape[0], height - y)
+            w = min(tile.shape[1], width - x)
+            region = frame[y:y + h, x:x + w]
+            np.maximum(region, tile[:h, :w], out=region)
+            x += advance
+
+
+@functools.lru_cache(maxsize=8)
+def glyph_atlas(fill=(255, 255, 255)) -> GlyphAtlas:
+    return GlyphAtlas(fill=fill)
+
+
+class Starfield(object):
+    """Stars flying towards the viewer, kept in NumPy arrays between
+    frames.
+
+    Closer stars are drawn larger and (unless `mono`) brighter.
+    """
+    def __init__(self, size, n_stars=512, max_depth=32, speed=0.19,
+                 spread=25, mono=False, seed=None):
+        self.width, self.height = size
+        self.max_depth = max_depth
+        self.speed = speed
+        self.spread = spread
+        self.mono = mono
+        self.rng = np.random.RandomState(seed)
+
+        self.xy = self._random_xy(n_stars)
+        self.z = self.rng.uniform(1, max_depth, n_stars)
+        self.frame = np.zeros((self.height, self.width, 3), dtype=np.uint8)
+        self._shade = np.zeros((self.height, self.width), dtype=np.uint8)
+        offsets = np.arange(5)
+        self._dx, self._dy = [o.ravel() for o in np.meshgrid(offsets, offsets)]
+
+    def _random_xy(self, n):
+        return self.rng.randint(-self.spread, self.spread,
+                                (n, 2)).astype(np.float32)
+
+    def step(self, frames=1):
+        """Move the stars closer, respawning any which have passed the
+        screen far away again."""
+        self.z -= self.speed * frames
+        passed = self.z <= 0
+        n_passed = np.count_nonzero(passed)
+        if n_passed:
+            self.xy[passed] = self._random_xy(n_passed)
+            self.z[passed] = self.max_depth
+
+    def render(self) -> np.ndarray:
+        """Rasterize the stars into the frame and return it."""
+        # Perspective projection.
+        k = 128.0 / self.z
+        x = (self.xy[:, 0] * k + self.width // 2).astype(int)
+        y = (self.xy[:, 1] * k + self.height // 2).astype(int)
+        visible = (x >= 0) & (x < self.width) & (y >= 0) & (y < self.height)
+        x, y = x[visible], y[visible]
+
+        nearness = 1 - self.z[visible] / self.max_depth
+        size = (nearness * 4).astype(int)
+        if self.mono:
+            shade = np.full(len(x), 255, dtype=np.uint8)
+        else:
+            shade = (100 + nearness * 155).astype(np.uint8)
+
+        # Each star is a square of (size + 1) pixels; paint every offset
+        # within it at once, keeping the brightest star on overlaps.
+        covered = ((self._dx[:, np.newaxis] <= size) &
+                   (self._dy[:, np.newaxis] <= size))
+        px = (x + self._dx[:, np.newaxis])[covered]
+        py = (y + self._dy[:, np.newaxis])[covered]
+        values = np.broadcast_to(shade, covered.shape)[covered]
+        inside = (px < self.width) & (py < self.height)
+
+        self._shade[:] = 0
+        np.maximum.at(self._shade, (py[inside], px[inside]), values[inside])
+        self.frame[:] = self._shade[..., np.newaxis]
+        return self.frame
+
+
+class Animation(object):
+    """Frames predecoded to RGB arrays (or, with `rgb565`, to a display's
+    own format), with how long to show each for (in seconds)."""
+    def __init__(self, frames: List[np.ndarray], durations: List[float],
+                 rgb565=False):
+        if len(frames) != len(durations):
+            raise ValueError("Need a duration for every frame")
+        self.frames = frames
+        self.durations = durations
+        self.rgb565 = rgb565
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __repr__(self):
+        return (f"{self.__class__.__name__}(n_frames={len(self)}, "
+                f"duration={self.duration:.2f})")
+
+    @property
+    def duration(self) -> float:
+        return float(sum(self.durations))
+
+    def indices(self, loop=False, pingpong=False):
+        """Yield frame indices in playback order; forever if `loop`."""
+        order = list(range(len(self)))
+        if pingpong:
+            order += order[-2:0:-1]
+        while order:
+            yield from order
+            if not loop:
+                return
+
+
+def _natural_key(path):
+    return [int(x) if x.isdigit() else x
+            for x in re.split(r'(\d+)', str(path))]
+
+
+def load_animation(source, size=(128, 128), fps=None, angle=0) -> Animation:
+    """Load and predecode an animation.
+
+    `source` is an animated GIF, a glob pattern of numbered images
+    (e.g. ``"frames/*.png"``) or a list of image paths. Frames are shown
+    for `1 / fps` seconds, or for a GIF, its own frame durations.
+    """
+    durations = None
+    if isinstance(source, (str, pathlib.Path)):
+        path = pathlib.Path(source)
+        if path.suffix.lower() == '.gif' and path.exists():
+            with Image.open(path) as gif:
+                images = []
+                durations = []
+                for frame in ImageSequence.Iterator(gif):
+                    images.append(fit_image(frame, size, 'RGB', angle))
+                    durations.append(frame.info.get('duration', 100) / 1000)
+        else:
+            paths = sorted(path.parent.glob(path.name), key=_natural_key)
+            images = [render_image(p, size, 'RGB', angle) for p in paths]
+    else:
+        images = [render_image(p, size, 'RGB', angle) for p in source]
+
+    if not images:
+        raise FileNotFoundError(f"No frames found for {source}")
+    if fps or durations is None:
+        durations = [1.0 / (fps or 10)] * len(images)
+    return Animation([np.asarray(image) for image in images], durations)
+
+
+async def play_animation(display, animation: Animation, loop=False,
+                         pingpong=False, fps=None) -> int:
+    """Play an animation on a display (or compositor).
+
+    Each frame is due at a fixed time from the start, so slow frames
+    don't accumulate drift; a frame whose time has already passed is
+    skipped. Cancel the task to stop a looping animation. Returns the
+    number of frames skipped.
+    """
+    event_loop = asyncio.get_event_loop()
+    draw = display.adraw_rgb565 if animation.rgb565 else display.adraw_frame
+    start = event_loop.time()
+    due = 0.0
+    skipped = 0
+    for index in animation.indices(loop, pingpong):
+        duration = 1.0 / fps if fps else animation.durations[index]
+        if event_loop.time() - start < due + duration:
+            await draw(animation.frames[index])
+        else:
+            skipped += 1
+        due += duration
+        await asyncio.sleep(max(0.0, start + due - event_loop.time()))
+    if skipped:
+        logger.debug(f"Skipped {skipped} frames of {animation}")
+    return skipped
+
+
+class Marquee(object):
+    """A message rasterized once into a strip, to be scrolled across a
+    display a window at a time.
+
+    Vertical marquees wrap the text into lines and scroll up; horizontal
+    ones put it on a single line and scroll left. The strip starts and
+    ends with a blank screen, so the message scrolls in and out.
+    """
+    def __init__(self, text, size=(128, 128), vertical=True,
+                 char_width=None, fill=(255, 255, 255)):
+        self.width, self.height = size
+        self.vertical = vertical
+        atlas = glyph_atlas(fill)
+        line_height = atlas.LINE_HEIGHT
+
+        if vertical:
+            lines = layout_text(text, char_width or self.width // 6)
+            self.length = len(lines) * line_height + self.height
+            strip = np.zeros((self.length + self.height, self.width, 3),
+                             dtype=np.uint8)
+            for i, line in enumerate(lines):
+                atlas.blit(strip[self.height:], line, 0, i * line_height)
+        else:
+            line = " ".join(text.split())
+            self.length = atlas.offset(line, len(line)) + self.width
+            strip = np.zeros((self.height, self.length + self.width, 3),
+                             dtype=np.uint8)
+            atlas.blit(strip[:, self.width:], line, 0,
+                       (self.height - line_height) // 2)
+        self.strip = strip
+
+    def __len__(self):
+        return self.length
+
+    def window(self, offset) -> np.ndarray:
+        """The screen at `offset` pixels into the scroll, as a view into
+        the strip."""
+        offset = int(offset) % self.length
+        if self.vertical:
+            return self.strip[offset:offset + self.height]
+        return self.strip[:, offset:offset + self.width]
+
+
+async def play_marquee(display, marquee: Marquee, speed=40.0, fps=30.0,
+                       loops=1):
+    """Scroll a marquee across a display (or compositor) at `speed`
+    pixels per second, `loops` times (forever if None).
+
+    The offset follows the clock, not the number of frames drawn, so the
+    scroll keeps its speed when frames are slow.
+    """
+    event_loop = asyncio.get_event_loop()
+    start = event_loop.time()
+    duration = None if loops is None else loops * len(marquee) / speed
+    frame = 0
+    while True:
+        elapsed = event_loop.time() - start
+        if duration is not None and elapsed >= duration:
+            break
+        await display.adraw_frame(marquee.window(elapsed * speed))
+        frame += 1
+        await asyncio.sleep(max(0.0, start + frame / fps - event_loop.time()))
+    await display.adraw_frame(marquee.window(0))
+
+
+class AsyncDrawMixin(object):
+    """Async variants of the draw calls, run on a dedicated display thread.
+
+    Only one call per layer waits to run: a newer call replaces it, and
+    the replaced call returns False without drawing. Every layer draws to
+    the same panel, so waiting calls run in the order they were made; a
+    replacement takes its place at the back of the queue.
+    """
+    def _init_async_draw(self):
+        self._draw_executor = None
+        self._draw_lock = threading.Lock()
+        self._queued_draws = collections.OrderedDict()
+        self.n_dropped = 0
+
+    def _executor(self):
+        if self._draw_executor is None:
+            self._draw_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix='display')
+        return self._draw_executor
+
+    def _run_queued(self, loop):
+        # There is one job per queued call, so there is always one to run.
+        with self._draw_lock:
+            _, (fn, args, future) = self._queued_draws.popitem(last=False)
+
+        def resolve(result=None, error=None):
+            if future.done():
+                return
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+        try:
+            fn(*args)
+        except Exception as e:
+            loop.call_soon_threadsafe(resolve, None, e)
+        else:
+            loop.call_soon_threadsafe(resolve, True)
+
+    async def _adraw(self, layer, fn, *args) -> bool:
+        """Run a draw call on the display thread."""
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        with self._draw_lock:
+            queued = self._queued_draws.pop(layer, None)
+            self._queued_draws[layer] = (fn, args, future)
+        if queued is None:
+            loop.run_in_executor(self._executor(), self._run_queued, loop)
+        else:
+            self.n_dropped += 1
+            if not queued[2].done():
+                queued[2].set_result(False)
+        return await future
+
+    async def aload_animation(self, paths, fps=None, angle=0) -> Animation:
+        """Load an animation for this display (see `load_animation`) on
+        the display thread, between draws."""
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            self._executor(), self.load_animation, paths, fps, angle)
+
+    async def aclear(self):
+        return await self._adraw('clear', self.clear)
 
+    async def adraw_text(self, text):
+        return await self._adraw('text', self.draw_text, text)
+
+    async def adraw_image(self, path, angle=0):
+        return await self._adraw('image', self.draw_image, path, angle)
+
+    async def adraw_frame(self, frame):
+        return await self._adraw('frame', self.draw_frame, frame)
+
+    async def adraw_rgb565(self, data):
+        return await self._adraw('frame', self.draw_rgb565, data)
+
+    async def afill_rgb(self, r, g, b):
+        return await self._adraw('fill', self.fill_rgb, r, g, b)
+
+    async def adraw_bars(self, param1, param2, margin=5):
+        return await self._adraw('bars', self.draw_bars, param1, param2,
+                                 margin)
+
+    async def amove_and_draw_strs(self):
+        return await self._adraw('stars', self.move_and_draw_strs)
+
+
+class OLEDDisplay(AsyncDrawMixin):
+    MAX_DIRTY_RECTS = 4
 
-class OLEDDisplay(object):
     _settings = {'backlight_active': 'low',
                  'bgr': False,
                  'block_orientation': 0,
@@ -54,21 +498,42 @@ class OLEDDisplay(object):
                  'v_offset': 0,
                  'width': 128}
 
-    def __init__(self, echo_result=True, **kwargs):
+    def __init__(self, echo_result=True, max_cached_frames=16, virtual=False,
+                 snapshot_dir=None, max_encoded_frames=8, **kwargs):
         self.echo_result = echo_result
-        self._settings.update(**kwargs)
+        self.virtual = virtual
+        self.snapshot_dir = snapshot_dir
+        self._settings = dict(self._settings, **kwargs)
+        self.char_width = int(self._settings['width'] / 6)
+        self.frame_cache = FrameCache(max_cached_frames)
+        self.encoder = RGB565Encoder(max_encoded_frames)
+        self._frame_key = None
+        self._native_frame = None
+        self.pack = None
+        self._text_frame = None
+        self._text_lines = ()
+        self.frame = None
+        self._dirty = []
+        self.starfield = None
+        self.auto_present = True
+        self._init_async_draw()
 
     def setup(self):
-        try:
-            import luma.oled.device
-            Device = getattr(luma.oled.device, self._settings['display'])
-            self.device = Device(OLEDDisplay.make_spi(self._settings),
-                                 **self._settings)
+        if not self.virtual:
+            try:
+                import luma.oled.device
+                Device = getattr(luma.oled.device, self._settings['display'])
+                self.device = Device(OLEDDisplay.make_spi(self._settings),
+                                     **self._settings)
+                return
+            except ImportError:
+                logger.warning("No luma display libraries; using a virtual "
+                               "display")
 
-            self.char_width = int(self._settings['width'] / 6)
-        except ImportError:
-            self.device = None
-            self.char_width = None
+        self.device = VirtualDevice(self._settings['width'],
+                                    self._settings['height'],
+                                    self._settings['mode'],
+                                    snapshot_dir=self.snapshot_dir)
 
     @staticmethod
     def make_spi(settings):
@@ -83,10 +548,111 @@ class OLEDDisplay(object):
                    gpio_RST=settings['gpio_reset'],
                    gpio=None)
 
+    @property
+    def native(self) -> bool:
+        """Whether RGB565 data can be written straight to the controller."""
+        return (self.device is not None and
+                self._settings['display'] == 'ssd1351' and
+                self._settings['rotate'] == 0)
+
+    def _invalidate_framebuffer(self):
+        """Make luma redraw the whole frame next time, after the panel
+        has been written to behind its back."""
+        framebuffer = getattr(self.device, 'framebuffer', None)
+        if hasattr(framebuffer, 'prev_image'):
+            framebuffer.prev_image = None
+
+    def write_window(self, left, top, right, bottom, data):
+        """Write RGB565 `data` to the window [left, right) x [top, bottom)
+        of an ssd1351."""
+        h_offset = self._settings['h_offset']
+        v_offset = self._settings['v_offset']
+        self.device.command(0x15, left + h_offset, right - 1 + h_offset)
+        self.device.command(0x75, top + v_offset, bottom - 1 + v_offset)
+        self.device.command(0x5C)
+        # luma passes the buffer through to spidev in transfer-size
+        # slices, so there is no need to build a list of ints.
+        self.device.data(data)
+        self._invalidate_framebuffer()
+
+    def _buffer(self) -> np.ndarray:
+        """The back buffer: an RGB copy of what is on the panel."""
+        if self.frame is None:
+            self.frame = np.zeros((self.device.height, self.device.width, 3),
+                                  dtype=np.uint8)
+        return self.frame
+
+    def _invalidate(self):
+        """Mark the whole panel dirty, after drawing to it through luma."""
+        frame = self._buffer()
+        self._dirty = [(0, 0, frame.shape[1], frame.shape[0])]
+
+    def _update(self, new, regions=None, key=None):
+        """Copy a full RGB frame into the back buffer.
+
+        The bounding box of the pixels which changed within each
+        (left, top, right, bottom) region is marked dirty. If the frame is
+        always the same for `key`, its encoding is cached.
+        """
+        self._frame_key = key
+        frame = self._buffer()
+        height, width = frame.shape[:2]
+        for left, top, right, bottom in regions or [(0, 0, width, height)]:
+            changed = np.any(frame[top:bottom, left:right] !=
+                             new[top:bottom, left:right], axis=2)
+            rows = np.flatnonzero(changed.any(axis=1))
+            if len(rows) == 0:
+                continue
+            cols = np.flatnonzero(changed.any(axis=0))
+            x0, x1 = int(left + cols[0]), int(left + cols[-1] + 1)
+            y0, y1 = int(top + rows[0]), int(top + rows[-1] + 1)
+            frame[y0:y1, x0:x1] = new[y0:y1, x0:x1]
+            self._dirty.append((x0, y0, x1, y1))
+
+    def present(self):
+        """Push the dirty parts of the back buffer to the panel."""
+        if self._native_frame is not None:
+            height, width = self.frame.shape[:2]
+            self.write_window(0, 0, width, height, self._native_frame)
+            self._native_frame = None
+        if not self._dirty:
+            return
+
+        if self.native:
+            rects = self._dirty
+            lefts, tops, rights, bottoms = zip(*rects)
+            bounds = (min(lefts), min(tops), max(rights), max(bottoms))
+            # Several draws between presents can leave overlapping rects;
+            # send their bounding box when it's no bigger than they are.
+            area = sum((r - l) * (b - t) for l, t, r, b in rects)
+            if (len(rects) > self.MAX_DIRTY_RECTS or
+                    area >= (bounds[2] - bounds[0]) * (bounds[3] - bounds[1])):
+                rects = [bounds]
+            height, width = self.frame.shape[:2]
+            if self._frame_key is not None and len(rects) == 1:
+                left, top, right, bottom = rects[0]
+                if right - left == width and bottom - top == height:
+                    rects = [(0, 0, width, height, self._frame_key)]
+            for left, top, right, bottom, *key in rects:
+                data = self.encoder.encode(self.frame[top:bottom, left:right],
+                                           key=key[0] if key else None)
+                self.write_window(left, top, right, bottom, data)
+        else:
+            self.device.display(
+                Image.fromarray(self.frame).convert(self.device.mode))
+        self._dirty = []
+
+    def _flush(self):
+        if self.auto_present:
+            self.present()
+
     def clear(self):
         logger.debug("Display clear")
         if self.device is not None:
             self.device.clear()
+            self._buffer()[:] = 0
+            self._dirty = []
+            self._native_frame = None
 
     def draw_text(self, text):
         logger.debug(f"Drawing: '{text}'")
@@ -95,123 +661,320 @@ class OLEDDisplay(object):
             print(text)
 
         if self.device is not None:
-            virtual = viewport(self.device,
-                               width=self.device.width,
-                               height=self._settings['height'])
-
-            lines = []
-            for line in text.split('\n'):
-                wrapped_lines = textwrap.wrap(line, self.char_width)
-                lines.extend(wrapped_lines)
-
-            with canvas(virtual) as draw:
-                for i, line in enumerate(lines):
-                    draw.text((0, i * 12), text=line, fill="white")
+            self._update(self.render_text(text))
+            self._flush()
         else:
             logger.warning(
                 f"Cannot draw text - no OLED library found; text={text}")
 
+    def render_text(self, text) -> np.ndarray:
+        """Render text into the persistent text frame and return it.
+
+        Only the characters from the first difference with the previous
+        text on each line are redrawn.
+        """
+        if self._text_frame is None:
+            self._text_frame = np.zeros(
+                (self.device.height, self.device.width, 3), dtype=np.uint8)
+            self._text_lines = ()
+        frame = self._text_frame
+        atlas = glyph_atlas()
+        line_height = atlas.LINE_HEIGHT
+
+        lines = layout_text(text, self.char_width)
+        previous = self._text_lines
+        for i in range(min(max(len(lines), len(previous)),
+                           -(-frame.shape[0] // line_height))):
+            new = lines[i] if i < len(lines) else ''
+            old = previous[i] if i < len(previous) else ''
+            if new == old:
+                continue
+
+            # Redraw from one character before the first difference, in
+            # case that glyph overhangs its advance.
+            n = 0
+            while n < min(len(new), len(old)) and new[n] == old[n]:
+                n += 1
+            n = max(0, n - 1)
+            x = atlas.offset(new, n)
+            y = i * line_height
+            frame[y:y + line_height, x:] = 0
+            atlas.blit(frame, new[n:], x, y)
+
+        self._text_lines = lines
+        return frame
+
+    def load_bundle(self, bundle):
+        """Use the resource pack from a precompiled asset bundle."""
+        if bundle.pack is not None and bundle.pack.exists():
+            self.load_pack(bundle.pack)
+
+    def load_pack(self, path):
+        """Memory-map a resource pack to draw images from."""
+        pack = ResourcePack(path)
+        if self.device is not None and pack.size != tuple(self.device.size):
+            logger.warning(f"Ignoring {pack}: display is {self.device.size}")
+            pack.close()
+            return
+        logger.info(f"Loaded {pack}")
+        self.pack = pack
+
+    def _update_rgb565(self, data, key=None):
+        width, height = self.device.size
+        if self.native:
+            # The frame is already in the panel's format, so the bytes
+            # are sent as they are; the back buffer just keeps up.
+            self._buffer()[:] = decode_rgb565(data, width, height)
+            self._frame_key = key
+            self._dirty = []
+            self._native_frame = data
+        else:
+            self._update(decode_rgb565(data, width, height), key=key)
+
+    def _draw_packed(self, path, angle) -> bool:
+        data = self.pack.get(path, angle) if self.pack else None
+        if data is None:
+            return False
+
+        self._update_rgb565(
+            data, key=('packed', str(pathlib.Path(path).resolve()), angle))
+        return True
+
+    def load_animation(self, paths, fps=None, angle=0) -> Animation:
+        """Load images as an animation of RGB565 frames for this display.
+
+        Packed images are used straight from the resource pack; the rest
+        are rendered through the frame cache and encoded once, through
+        the encoder's cache. This decodes images, so on the event loop
+        use `aload_animation`.
+        """
+        if self.device is None:
+            raise RuntimeError("No display to load an animation for")
+
+        frames = []
+        for path in paths:
+            data = self.pack.get(path, angle) if self.pack else None
+            if data is None:
+                path = pathlib.Path(path)
+                frame = self.frame_cache.get(path, self.device.size,
+                                             self.device.mode, angle)
+                data = self.encoder.encode(
+                    np.asarray(frame.convert('RGB')),
+                    key=('animation', str(path.resolve()),
+                         path.stat().st_mtime, angle))
+                if not self.encoder.max_cached:
+                    # Otherwise it's the encoder's reused buffer.
+                    data = bytes(data)
+            frames.append(data)
+        if not frames:
+            raise FileNotFoundError("No frames for an animation")
+        return Animation(frames, [1.0 / (fps or 10)] * len(frames),
+                         rgb565=True)
+
+    def copy_frame(self, other: 'OLEDDisplay'):
+        """Draw another display's back buffer, passing on a native frame
+        it hasn't presented yet rather than re-encoding it."""
+        if other._native_frame is not None and self.native:
+            self._buffer()[:] = other.frame
+            self._frame_key = other._frame_key
+            self._dirty = []
+            self._native_frame = other._native_frame
+        else:
+            self._update(other.frame)
+
     def draw_image(self, path, angle=0):
         if self.device is None:
             return
 
-        image = Image.open(path).convert("RGBA")
-        image.thumbnail((self.device.width, self.device.height))
-        fff = Image.new(image.mode, image.size, (255,) * 4)
+        if not self._draw_packed(path, angle):
+            path = pathlib.Path(path)
+            key = (str(path.resolve()), angle,
+                   self.device.size, self.device.mode)
+            frame = self.frame_cache.get(path, self.device.size,
+                                         self.device.mode, angle)
+            self._update(np.asarray(frame.convert('RGB')),
+                         key=key + (path.stat().st_mtime,))
+        self._flush()
 
-        background = Image.new("RGBA", self.device.size, "white")
-        posn = ((self.device.width - image.width) // 2, 0)
+    def draw_frame(self, frame: np.ndarray):
+        """Draw an RGB array of the device's size."""
+        if self.device is not None:
+            self._update(frame)
+            self._flush()
 
-        rot = image.rotate(angle, resample=Image.BILINEAR)
-        img = Image.composite(rot, fff, rot)
-        background.paste(img, posn)
-        self.device.display(background.convert(self.device.mode))
+    def draw_rgb565(self, data):
+        """Draw RGB565 bytes of the device's size, e.g. a frame of an
+        animation from `load_animation`."""
+        if self.device is not None:
+            self._update_rgb565(data)
+            self._flush()
 
     def fill_rgb(self, r, g, b):
         if self.device is not None:
-            virtual = viewport(self.device,
-                               width=self.device.width,
-                               height=self._settings['height'])
-            with canvas(virtual) as draw:
-                draw.rectangle([
-                    (0, 0), (self.device.width, self.device.height)],
-                    fill=f"rgb({int(r)},{int(g)},{int(b)})")
+            self._update(np.full_like(self._buffer(),
+                                      (int(r), int(g), int(b))))
+            self._flush()
 
     def draw_bars(self, param1 : float, param2 : float, margin=5):
         if self.device is None:
             logger.warning(f"Cannot draw - no OLED")
             return
 
-        with canvas(self.device) as draw:
-            width = self.device.width
-            height = self.device.height
+        width = self.device.width
+        height = self.device.height
+        image = Image.new('RGB', (width, height), 'black')
+        draw = ImageDraw.Draw(image)
 
-            rect_bottom = height - margin
-            rect_max = (rect_bottom - margin)
-            rect_left = margin
-            rect_right = width - margin
+        rect_bottom = height - margin
+        rect_max = (rect_bottom - margin)
+        rect_left = margin
+        rect_right = width - margin
 
-            halfway = (rect_right - rect_left) // 2
+        halfway = (rect_right - rect_left) // 2
 
-            left_rect_height = rect_max * param1
-            l_rect_top = rect_max - left_rect_height
-            right_rect_height = rect_max * param2
-            r_rect_top = rect_max - right_rect_height
+        left_rect_height = rect_max * param1
+        l_rect_top = rect_max - left_rect_height
+        right_rect_height = rect_max * param2
+        r_rect_top = rect_max - right_rect_height
 
-            # left rect
-            draw.rectangle((rect_left, l_rect_top,
-                            halfway, rect_bottom), fill="red")
-            # right rect
-            draw.rectangle((halfway, r_rect_top,
-                            rect_right, rect_bottom), fill="blue")
-
-    def move_and_draw_strs(self):
-        def init_stars(num_stars, max_depth):
-            stars = []
-            for i in range(num_stars):
-                # A star is represented as a list with this format: [X,Y,Z]
-                star = [randrange(-25, 25), randrange(-25, 25), randrange(1, max_depth)]
-                stars.append(star)
-            return stars
+        # left rect
+        draw.rectangle((rect_left, l_rect_top,
+                        halfway, rect_bottom), fill="red")
+        # right rect
+        draw.rectangle((halfway, r_rect_top,
+                        rect_right, rect_bottom), fill="blue")
 
-        origin_x = self.device.width // 2
-        origin_y = self.device.height // 2
+        # Each bar is its own dirty region, so moving one knob only
+        # sends the rows of its bar which changed.
+        self._update(np.asarray(image), [(0, 0, halfway, height),
+                                         (halfway, 0, width, height)])
+        self._flush()
 
+    def move_and_draw_strs(self):
+        """Advance and draw one frame of the starfield."""
         if self.device is None:
             logger.warning(f"Cannot draw - no OLED")
             return
 
-        with canvas(self.device) as draw:
-            max_depth = 32
-            stars = init_stars(512, max_depth)
-            for star in stars:
-                # The Z component is decreased on each frame.
-                star[2] -= 0.19
-
-                # If the star has past the screen (I mean Z<=0) then we
-                # reposition it far away from the screen (Z=max_depth)
-                # with random X and Y coordinates.
-                if star[2] <= 0:
-                    star[0] = randrange(-25, 25)
-                    star[1] = randrange(-25, 25)
-                    star[2] = max_depth
-
-                # Convert the 3D coordinates to 2D using perspective projection.
-                k = 128.0 / star[2]
-                x = int(star[0] * k + origin_x)
-                y = int(star[1] * k + origin_y)
-
-                # Draw the star (if it is visible in the screen).
-                # We calculate the size such that distant stars are smaller than
-                # closer stars. Similarly, we make sure that distant stars are
-                # darker than closer stars. This is done using Linear Interpolation.
-                if 0 <= x < self.device.width and 0 <= y < self.device.height:
-                    size = (1 - float(star[2]) / max_depth) * 4
-                    if (self.device.mode == "RGB"):
-                        shade = (int(100 + (1 - float(star[2]) / max_depth) * 155),) * 3
-                    else:
-                        shade = "white"
-                        draw.rectangle((x, y, x + size, y + size), fill=shade)
+        if self.starfield is None:
+            self.starfield = Starfield(self.device.size,
+                                       mono=self.device.mode != "RGB")
+        self.starfield.step()
+        self._update(self.starfield.render())
+        self._flush()
+
+
+class DisplayGroup(AsyncDrawMixin):
+    """Several displays driven together.
+
+    With `mirror`, every draw is rendered once, on the first display, and
+    the frame is copied to the others (which must be the same size and
+    mode; otherwise each renders it itself). Without it, draws go to the
+    first display and the others are drawn to individually, as
+    `group[i]`. Each display presents on its own thread, so transfers to
+    separate SPI devices overlap.
+    """
+    def __init__(self, displays: List[OLEDDisplay], mirror: bool = True):
+        if not displays:
+            raise ValueError("A display group needs at least one display")
+        self.displays = list(displays)
+        self.mirror = mirror
+        self._transfer_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=len(self.displays), thread_name_prefix='display-group')
+        self._auto_present = True
+        self._init_async_draw()
+
+    def __getitem__(self, index) -> OLEDDisplay:
+        return self.displays[index]
+
+    def __len__(self):
+        return len(self.displays)
+
+    def __repr__(self):
+        return (f"{self.__class__.__name__}(n_displays={len(self)}, "
+                f"mirror={self.mirror})")
+
+    @property
+    def device(self):
+        return self.displays[0].device
+
+    @property
+    def auto_present(self) -> bool:
+        return self._auto_present
+
+    @auto_present.setter
+    def auto_present(self, value: bool):
+        self._auto_present = value
+        for display in self.displays:
+            display.auto_present = value
+
+    def _each(self, fn, displays=None):
+        """Call `fn(display)` for each display concurrently."""
+        list(self._transfer_executor.map(fn, displays or self.displays))
+
+    def _same_format(self, display) -> bool:
+        """Whether `display` can show the primary's frames as they are:
+        the same size and mode."""
+        primary = self.displays[0].device
+        return (display.device is not None and primary is not None and
+                tuple(display.device.size) == tuple(primary.size) and
+                display.device.mode == primary.mode)
+
+    def _draw(self, method, *args):
+        primary = self.displays[0]
+        if not self.mirror:
+            getattr(primary, method)(*args)
+            return
+
+        copies = [d for d in self.displays[1:] if self._same_format(d)]
+        others = [d for d in self.displays[1:] if d not in copies]
+
+        primary.auto_present = False
+        try:
+            getattr(primary, method)(*args)
+        finally:
+            primary.auto_present = self.auto_present
+        if primary.frame is not None:
+            for display in copies:
+                display.copy_frame(primary)
+
+        def present(display):
+            if display in others:
+                getattr(display, method)(*args)
+            elif self.auto_present:
+                display.present()
+        self._each(present)
+
+    def present(self):
+        self._each(lambda d: d.present())
+
+    def clear(self):
+        self._each(lambda d: d.clear(),
+                   None if self.mirror else self.displays[:1])
+
+    def draw_text(self, text):
+        self._draw('draw_text', text)
+
+    def draw_image(self, path, angle=0):
+        self._draw('draw_image', path, angle)
+
+    def draw_frame(self, frame):
+        self._draw('draw_frame', frame)
+
+    def draw_rgb565(self, data):
+        self._draw('draw_rgb565', data)
+
+    def load_animation(self, paths, fps=None, angle=0) -> Animation:
+        return self.displays[0].load_animation(paths, fps, angle)
+
+    def fill_rgb(self, r, g, b):
+        self._draw('fill_rgb', r, g, b)
+
+    def draw_bars(self, param1, param2, margin=5):
+        self._draw('draw_bars', param1, param2, margin)
+
+    def move_and_draw_strs(self):
+        self._draw('move_and_draw_strs')
 
 
 def display_factory(config: Mapping) -> List[OLEDDisplay]:
@@ -0,0 +1,125 @@
+"""Packed display resources.
+
+Every image is rendered once, at build time, to a device-ready RGB565
+frame, and the frames are written back to back into a single file:
+
+    b'RPAK' | uint32 index length | JSON index | padding | frame data
+
+The index records each frame's source path, angle, source mtime and
+offset into the frame data. At runtime the file is memory-mapped, so
+frames are paged in by the OS when they are drawn, nothing is decoded at
+startup and memory use doesn't grow with the number of images.
+"""
+import json
+import logging
+import mmap
+import pathlib
+import struct
+from typing import Iterable, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'RPAK'
+PACK_VERSION = 1
+HEADER = struct.Struct('<4sI')
+ALIGNMENT = 16
+
+
+class PackedFrame(NamedTuple):
+    """A frame to be packed: the source image, its angle and RGB565
+    bytes."""
+    path: str
+    angle: int
+    mtime: float
+    data: np.ndarray
+
+
+def write_resource_pack(path: pathlib.Path, frames: Iterable[PackedFrame],
+                        size: Tuple[int, int]) -> pathlib.Path:
+    """Write RGB565 frames of `size` into a resource pack at `path`."""
+    width, height = size
+    frame_bytes = width * height * 2
+    frames = list(frames)
+    index = {'version': PACK_VERSION,
+             'format': 'rgb565',
+             'width': width,
+             'height': height,
+             'frames': [{'path': frame.path,
+                         'angle': frame.angle,
+                         'mtime': frame.mtime,
+                         'offset': i * frame_bytes}
+                        for i, frame in enumerate(frames)]}
+
+    index_bytes = json.dumps(index).encode('utf-8')
+    data_offset = HEADER.size + len(index_bytes)
+    padding = -data_offset % ALIGNMENT
+
+    path = pathlib.Path(path)
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(index_bytes)))
+        f.write(index_bytes)
+        f.write(b'\0' * padding)
+        for frame in frames:
+            data = np.ascontiguousarray(frame.data, dtype=np.uint8)
+            if data.nbytes != frame_bytes:
+                raise ValueError(f"Frame for {frame.path} is not {size}")
+            f.write(data.tobytes())
+
+    logger.info(f"Packed {len(frames)} frames into {path}")
+    return path
+
+
+class ResourcePack(object):
+    """A memory-mapped resource pack."""
+    def __init__(self, path: pathlib.Path):
+        self.path = pathlib.Path(path)
+        with open(self.path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, index_length = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"Not a resource pack: {self.path}")
+        index = json.loads(
+            self._mmap[HEADER.size:HEADER.size + index_length].decode('utf-8'))
+        if index.get('version') != PACK_VERSION:
+            raise ValueError(
+                f"Unsupported resource pack version: {index.get('version')}")
+
+        self.size = (index['width'], index['height'])
+        self.frame_bytes = index['width'] * index['height'] * 2
+        data_offset = HEADER.size + index_length
+        data_offset += -data_offset % ALIGNMENT
+
+        self._view = memoryview(self._mmap)
+        self._frames = {
+            (entry['path'], entry['angle']):
+                (data_offset + entry['offset'], entry['mtime'])
+            for entry in index['frames']}
+
+    def __len__(self):
+        return len(self._frames)
+
+    def __repr__(self):
+        return (f"{self.__class__.__name__}(path={self.path}, "
+                f"size={self.size}, n_frames={len(self)})")
+
+    def get(self, path, angle=0) -> Optional[memoryview]:
+        """The RGB565 bytes of an image, as a view into the mapping, or
+        None if it isn't packed or has changed since it was packed."""
+        path = pathlib.Path(path)
+        entry = self._frames.get((str(path.resolve()), angle))
+        if entry is None:
+            return None
+        offset, mtime = entry
+        try:
+            if path.stat().st_mtime > mtime:
+                return None
+        except FileNotFoundError:
+            pass
+        return self._view[offset:offset + self.frame_bytes]
+
+    def close(self):
+        self._view.release()
+        self._mmap.close()
@@ -0,0 +1,78 @@
+"""RGB565, the native pixel format of the ssd1351.
+
+Each pixel is two bytes on the wire, high byte first:
+``rrrrrggg gggbbbbb``.
+"""
+import collections
+
+import numpy as np
+
+
+def encode_rgb565(rgb: np.ndarray) -> np.ndarray:
+    """Encode a (height, width, 3) uint8 RGB array to (height, width, 2)
+    uint8 RGB565 bytes."""
+    rgb = np.asarray(rgb, dtype=np.uint8)
+    out = np.empty(rgb.shape[:2] + (2,), dtype=np.uint8)
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    out[..., 0] = (r & 0xF8) | (g >> 5)
+    out[..., 1] = ((g << 3) & 0xE0) | (b >> 3)
+    return out
+
+
+def decode_rgb565(data, width: int, height: int) -> np.ndarray:
+    """Decode RGB565 bytes to a (height, width, 3) uint8 RGB array."""
+    pixels = np.frombuffer(data, dtype='>u2', count=width * height)
+    pixels = pixels.reshape(height, width)
+    rgb = np.empty((height, width, 3), dtype=np.uint8)
+    rgb[..., 0] = (pixels >> 8) & 0xF8
+    rgb[..., 1] = (pixels >> 3) & 0xFC
+    rgb[..., 2] = (pixels << 3) & 0xF8
+    return rgb
+
+
+class RGB565Encoder(object):
+    """Encode RGB frames to RGB565 in one vectorized pass.
+
+    Output goes into buffers which are reused for every frame of the same
+    shape, so the returned view is only valid until the next `encode` of
+    that shape. With `max_cached` set, frames encoded with a `key` are
+    also kept (as copies) in an LRU cache.
+    """
+    def __init__(self, max_cached: int = 0):
+        self.max_cached = max_cached
+        self._buffers = {}
+        self._cache = collections.OrderedDict()
+
+    def _buffer(self, shape):
+        buffers = self._buffers.get(shape)
+        if buffers is None:
+            buffers = self._buffers[shape] = (np.empty(shape, dtype='>u2'),
+                                              np.empty(shape, dtype=np.uint16))
+        return buffers
+
+    def encode(self, rgb: np.ndarray, key=None) -> memoryview:
+        """Encode a (height, width, 3) uint8 array; returns the big-endian
+        pixel bytes."""
+        if key is not None and key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        out, scratch = self._buffer(rgb.shape[:2])
+        np.bitwise_and(rgb[..., 0], 0xF8, out=scratch, casting='unsafe')
+        np.left_shift(scratch, 8, out=scratch)
+        out[...] = scratch
+        np.bitwise_and(rgb[..., 1], 0xFC, out=scratch, casting='unsafe')
+        np.left_shift(scratch, 3, out=scratch)
+        np.bitwise_or(out, scratch, out=out, casting='unsafe')
+        np.right_shift(rgb[..., 2], 3, out=scratch, casting='unsafe')
+        np.bitwise_or(out, scratch, out=out, casting='unsafe')
+        data = memoryview(out.reshape(-1)).cast('B')
+
+        if key is not None and self.max_cached:
+            data = self._cache[key] = memoryview(bytes(data))
+            while len(self._cache) > self.max_cached:
+                self._cache.popitem(last=False)
+        return data
+
+    def clear(self):
+        self._cache.clear()
@@ -1,11 +1,17 @@
 import asyncio
+import collections
 import logging
 import numpy as np
 import pathlib
-import pygame
 import subprocess
 import tempfile
 import uuid
+from typing import NamedTuple, Optional, Sequence
+
+import robot.dsp as dsp
+from robot.outputs.audio import (AudioBackend, FileSinkBackend,
+                                 backend_factory, mix_segments)
+from robot.outputs.channels import ChannelManager
 
 logger = logging.getLogger(__name__)
 
@@ -26,39 +32,262 @@ def speech_to_wav(text, output_file):
     return pathlib.Path(output_file).exists()
 
 
+class Tone(NamedTuple):
+    """A sine tone of `dur` seconds."""
+    freq: float
+    dur: float
+    amplitude: float = 4096
+    at: Optional[float] = None
+
+
+class SoundFile(NamedTuple):
+    """The full contents of a sound file."""
+    path: pathlib.Path
+    at: Optional[float] = None
+
+
+class Speech(NamedTuple):
+    """A phrase synthesized with flite."""
+    text: str
+    at: Optional[float] = None
+
+
+class Silence(NamedTuple):
+    """A gap of `dur` seconds."""
+    dur: float
+    at: Optional[float] = None
+
+
+def render_tone(freq, dur, sr, amplitude=4096):
+    """Render a sine tone as an int16 array."""
+    t = np.arange(int(round(dur * sr))) / sr
+    return (amplitude * np.sin(2.0 * np.pi * freq * t)).astype(np.int16)
+
+
+async def aspeech_to_wav(text, output_file):
+    """Render speech to a wav file in a flite subprocess, without blocking
+    the event loop while it runs."""
+    try:
+        process = await asyncio.create_subprocess_exec(
+            "flite", "-t", text, "-o", str(output_file))
+        await process.wait()
+    except FileNotFoundError:
+        logger.error("No flite to run")
+    return pathlib.Path(output_file).exists()
+
+
+class SoundCache(object):
+    """Bounded LRU cache of decoded sounds, keyed by path and mtime.
+
+    `loader` decodes a path into a playable sound; an entry is reloaded if
+    the file has been modified since it was cached.
+    """
+    def __init__(self, loader, max_size=32):
+        self.loader = loader
+        self.max_size = max_size
+        self._entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, path):
+        """Return the decoded sound for `path`.
+
+        Raises FileNotFoundError if the file does not exist.
+        """
+        path = pathlib.Path(path)
+        mtime = path.stat().st_mtime
+        key = str(path.resolve())
+
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == mtime:
+            self._entries.move_to_end(key)
+            return entry[1]
+
+        sound = self.loader(path)
+        self._entries[key] = (mtime, sound)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        return sound
+
+    def clear(self):
+        self._entries.clear()
+
+
 class SoundResource(object):
-    def __init__(self):
+    """Plays speech, sound files, tones and sequences.
+
+    `backend` is an `AudioBackend` or the name of one ('pygame' or
+    'file'); if the pygame mixer can't be opened, e.g. on a machine with
+    no sound card, a `FileSinkBackend` is used instead.
+    """
+    def __init__(self, backend='pygame', backend_args=None, max_synth_jobs=2,
+                 max_cached_sounds=32, max_cached_sequences=16,
+                 envelope_rate=50):
+        if not isinstance(backend, AudioBackend):
+            backend = backend_factory(backend, **(backend_args or {}))
+        self.backend = backend
         self.speech_dir = tempfile.TemporaryDirectory()
         self.speech_map = dict()
+        self.speech_tasks = dict()
+        self.max_synth_jobs = max_synth_jobs
+        self._synth_semaphore = None
         self.sr = 44010
+        self.sound_cache = SoundCache(self._decode_file, max_cached_sounds)
+        self.channels = ChannelManager(self.backend)
+        self.max_cached_sequences = max_cached_sequences
+        self.sequence_cache = collections.OrderedDict()
+
+        # Called with the level (0-1) of speech as it plays, e.g. to move
+        # the head in time with it.
+        self.envelope_callback = None
+        self.envelope_rate = envelope_rate
+        self.envelopes = dict()
 
     def setup(self):
-        pygame.mixer.pre_init(self.sr, -16, 1)
-        pygame.mixer.init()
+        try:
+            self.backend.setup(self.sr, self.channels.n_reserved,
+                               self.channels.n_free_channels)
+        except RuntimeError as e:
+            logger.warning(f"Failed to open the mixer ({e}); recording to "
+                           "a file sink instead")
+            self.backend = FileSinkBackend()
+            self.backend.setup(self.sr, self.channels.n_reserved,
+                               self.channels.n_free_channels)
+            self.channels.backend = self.backend
+        self.channels.setup()
+
+    def load_bundle(self, bundle):
+        """Use the prerendered speech from a precompiled asset bundle, and
+        decode its sounds up front."""
+        self.speech_map.update(bundle.speech)
+        for path in bundle.sounds:
+            self._load_sound(path)
+
+    def _decode_file(self, path):
+        return self.backend.load(path)
+
+    def _load_sound(self, path):
+        try:
+            return self.sound_cache.get(path)
+        except FileNotFoundError:
+            return None
+
+    def _new_speech_path(self):
+        filename = f"{str(uuid.uuid4()).replace('-', '')}.wav"
+        return pathlib.Path(self.speech_dir.name) / filename
 
     def play_speech(self, text):
         if text in self.speech_map:
-            output_path = self.speech_map[hash(text)]
+            output_path = self.speech_map[text]
         else:
-            filename = f"{str(uuid.uuid4()).replace('-', '')}.wav"
-            output_path = pathlib.Path(self.speech_dir.name) / filename
+            output_path = self._new_speech_path()
 
             speech_to_wav(text, output_path)
-            self.speech_map[hash(text)] = output_path
+            self.speech_map[text] = output_path
 
         self.play_file(output_path)
 
-    async def aplay_speech(self, text):
+    async def _synthesize(self, text):
+        # Created lazily so the semaphore belongs to the running loop.
+        if self._synth_semaphore is None:
+            self._synth_semaphore = asyncio.Semaphore(self.max_synth_jobs)
+
+        output_path = self._new_speech_path()
+        async with self._synth_semaphore:
+            success = await aspeech_to_wav(text, output_path)
+
+        if success:
+            self.speech_map[text] = output_path
+        else:
+            # Allow a later request to retry the synthesis.
+            self.speech_tasks.pop(text, None)
+        return output_path
+
+    def prefetch_speech(self, *texts):
+        """Start synthesizing `texts` in the background, at most
+        `max_synth_jobs` at a time. Returns the futures for each phrase."""
+        futures = []
+        for text in texts:
+            if text not in self.speech_tasks:
+                self.speech_tasks[text] = asyncio.ensure_future(
+                    self._synthesize(text))
+            futures.append(self.speech_tasks[text])
+        return futures
+
+    def speech_envelope(self, path):
+        """The lip-sync envelope of a rendered phrase, analysed once and
+        cached next to its wav file."""
+        key = str(path)
+        if key not in self.envelopes:
+            try:
+                self.envelopes[key] = dsp.cached_envelope(
+                    path, self.envelope_rate)
+            except (OSError, EOFError, ValueError):
+                logger.warning(f"No envelope for {path}")
+                return None
+        return self.envelopes[key]
+
+    async def _follow_envelope(self, envelope):
+        loop = asyncio.get_event_loop()
+        start = loop.time()
+        try:
+            while True:
+                i = int((loop.time() - start) * self.envelope_rate)
+                if i >= len(envelope):
+                    break
+                self.envelope_callback(float(envelope[i]))
+                await asyncio.sleep(max(
+                    0, start + (i + 1) / self.envelope_rate - loop.time()))
+        finally:
+            self.envelope_callback(0.0)
+
+    async def _aplay_following(self, playback, envelope):
+        """Await `playback`, calling `envelope_callback` in time with it."""
+        if self.envelope_callback is None or envelope is None:
+            return await playback
+
+        follower = asyncio.ensure_future(self._follow_envelope(envelope))
+        try:
+            return await playback
+        finally:
+            follower.cancel()
+
+    async def aplay_speech(self, text, priority=1):
         if text in self.speech_map:
-            output_path = self.speech_map[hash(text)]
+            output_path = self.speech_map[text]
         else:
-            filename = f"{str(uuid.uuid4()).replace('-', '')}.wav"
-            output_path = pathlib.Path(self.speech_dir.name) / filename
+            # Shielded so a cancelled playback doesn't throw away the
+            # synthesis; the phrase stays cached for next time.
+            future, = self.prefetch_speech(text)
+            output_path = await asyncio.shield(future)
 
-            speech_to_wav(text, output_path)
-            self.speech_map[hash(text)] = output_path
+        envelope = None
+        if self.envelope_callback is not None:
+            envelope = self.speech_envelope(output_path)
+        return await self._aplay_following(
+            self.aplay_file(output_path, category='speech',
+                            priority=priority),
+            envelope)
 
-        await self.aplay_file(output_path)
+    async def aplay_speech_sequence(self, texts, pause=0.0, lookahead=1,
+                                    priority=1):
+        """Speak `texts` in order, `pause` seconds apart, synthesizing the
+        next `lookahead` phrases while the current one plays.
+
+        Unlike `aplay_sequence`, the first phrase starts as soon as it is
+        ready, but the pauses are only as exact as the event loop.
+        Returns False if a phrase was interrupted, leaving the rest unsaid.
+        """
+        texts = list(texts)
+        for i, text in enumerate(texts):
+            if i and pause:
+                await asyncio.sleep(pause)
+            self.prefetch_speech(*texts[i:i + 1 + lookahead])
+            if await self.aplay_speech(text, priority) is False:
+                return False
+        return True
 
     def play_init_sound(self):
         # if wav_files[0].exists():
@@ -73,64 +302,137 @@ class SoundResource(object):
         self.play_file(wav_files[0])
 
     async def aplay_init_sound(self):
-        await self.aplay_file(wav_files[0])
+        return await self.aplay_file(wav_files[0])
 
     def play_file(self, path):
-        if path.exists():
-            sound = pygame.mixer.Sound(str(path))
-            duration = sound.get_length()
-            sound.play()
-            pygame.time.wait(int(duration * 1000))
+        sound = self._load_sound(path)
+        if sound is not None:
+            self.backend.play_free(sound)
+            self.backend.wait(self.backend.get_length(sound))
 
         else:
             logger.info("failed to play; file does not exist")
 
-    async def aplay_file(self, path):
-        if path.exists():
-            sound = pygame.mixer.Sound(str(path))
-            duration = sound.get_length()
-            sound.play()
-            await asyncio.sleep(duration)
+    async def aplay_file(self, path, category='sfx', priority=0):
+        """Play a file on a `category` channel, returning once it has
+        finished (True) or been interrupted (False)."""
+        sound = self._load_sound(path)
+        if sound is not None:
+            return await self.channels.play(sound, category, priority)
 
         else:
             logger.info("failed to play; file does not exist")
 
+    def _render_event(self, event, sr):
+        if isinstance(event, Tone):
+            return render_tone(event.freq, event.dur, sr, event.amplitude)
+        elif isinstance(event, Silence):
+            return np.zeros(int(round(event.dur * sr)), dtype=np.int16)
+
+        if isinstance(event, Speech):
+            path = self.speech_map.get(event.text)
+        else:
+            path = event.path
+        sound = self._load_sound(path) if path is not None else None
+        if sound is None:
+            logger.warning(f"Nothing to sequence for {event}")
+            return None
+        return self.backend.to_array(sound)
+
+    async def arender_sequence(self, events: Sequence):
+        """Mix a sequence of `Tone`, `SoundFile`, `Speech` and `Silence`
+        events into one sound, sample-accurately.
+
+        Returns the sound and its RMS envelope, both cached by the content
+        of the sequence. Speech or files which couldn't be loaded are
+        left silent, and then the result isn't cached, so that they're
+        tried again next time.
+        """
+        key = tuple(events)
+        if key in self.sequence_cache:
+            self.sequence_cache.move_to_end(key)
+            return self.sequence_cache[key]
+
+        speech = [e.text for e in events if isinstance(e, Speech)]
+        if speech:
+            await asyncio.gather(
+                *(asyncio.shield(f) for f in self.prefetch_speech(*speech)))
+
+        sr = self.backend.sr
+        segments = [(e.at, self._render_event(e, sr)) for e in events]
+        complete = all(samples is not None for _, samples in segments)
+        samples = mix_segments(
+            [(at, np.zeros(0, dtype=np.int16) if samples is None else samples)
+             for at, samples in segments], sr)
+        rendered = (self.backend.make_sound(samples),
+                    dsp.rms_envelope(samples, sr, self.envelope_rate))
+        if not complete:
+            return rendered
+
+        self.sequence_cache[key] = rendered
+        while len(self.sequence_cache) > self.max_cached_sequences:
+            self.sequence_cache.popitem(last=False)
+        return rendered
+
+    async def aplay_sequence(self, events: Sequence, category='sfx',
+                             priority=0):
+        """Play a sequence of events as a single sound. Speech sequences
+        drive `envelope_callback` as they play."""
+        sound, envelope = await self.arender_sequence(events)
+        return await self._aplay_following(
+            self.channels.play(sound, category, priority),
+            envelope if category == 'speech' else None)
+
+    async def astream(self, synth, duration=None, category='music',
+                      priority=0):
+        """Stream blocks from a `StreamingSynth` to a mixer channel until
+        `duration` seconds have passed or the task is cancelled.
+
+        One block plays while the next waits in the channel's queue, so the
+        output latency is bounded to about two blocks.
+        """
+        index = self.channels.acquire(category, priority)
+        if index is None:
+            logger.warning(f"No {category} channel free to stream synth")
+            return False
+
+        loop = asyncio.get_event_loop()
+        end_time = None if duration is None else loop.time() + duration
+        try:
+            self.backend.play(index,
+                              self.backend.make_sound(synth.render_block()))
+            while end_time is None or loop.time() < end_time:
+                if self.backend.get_queue(index) is None:
+                    self.backend.queue(
+                        index, self.backend.make_sound(synth.render_block()))
+                await asyncio.sleep(synth.block_duration / 4)
+        finally:
+            self.channels.release(index)
+        return True
+
+    def _noise(self, dur):
+        n = int(self.backend.sr * dur)
+        return (4096 * np.random.random(n)).astype(np.int16)
+
     def play_sin(self, freq=440, dur=1):
-        arr = np.array([
-            4096 * np.sin(2.0 * np.pi * freq * x / self.sr)
-            for x in range(0, self.sr)]).astype(np.int16)
-        sound = pygame.sndarray.make_sound(arr)
-        sound.play()
-        pygame.time.delay(dur * 1000)
-        sound.stop()
-
-    async def aplay_sin(self, freq=440, dur=1):
-        arr = np.array([
-            4096 * np.sin(2.0 * np.pi * freq * x / self.sr)
-            for x in range(0, self.sr)]).astype(np.int16)
-        sound = pygame.sndarray.make_sound(arr)
-        sound.play()
-        await asyncio.sleep(dur)
-        sound.stop()
-
-    def play_noise(self):
-        arr = np.array([
-            4096 * np.random.random()
-            for x in range(0, self.sr)]).astype(np.int16)
-        sound = pygame.sndarray.make_sound(arr)
-        sound.play()
-        pygame.time.delay(1000)
-        sound.stop()
-
-    async def aplay_noise(self, ):
+        sound = self.backend.make_sound(
+            render_tone(freq, dur, self.backend.sr))
+        self.backend.play_free(sound)
+        self.backend.wait(dur)
+
+    async def aplay_sin(self, freq=440, dur=1, priority=0):
+        sound = self.backend.make_sound(
+            render_tone(freq, dur, self.backend.sr))
+        return await self.channels.play(sound, 'sfx', priority)
+
+    def play_noise(self, dur=1):
+        self.backend.play_free(self.backend.make_sound(self._noise(dur)))
+        self.backend.wait(dur)
+
+    async def aplay_noise(self, dur=1, priority=0):
         """play noise with async wait"""
-        arr = np.array([
-            4096 * np.random.random()
-            for x in range(0, self.sr)]).astype(np.int16)
-        sound = pygame.sndarray.make_sound(arr)
-        sound.play()
-        await asyncio.sleep(dur)
-        sound.stop()
+        sound = self.backend.make_sound(self._noise(dur))
+        return await self.channels.play(sound, 'sfx', priority)
 
 
 def run_test():
@@ -0,0 +1,217 @@
+"""Block-based streaming synthesizer.
+
+Audio is generated in fixed size blocks with NumPy, so the cost per block
+is constant and small enough to share the Pi with the ADC and display
+loops. Parameters can be changed at any time (e.g. from knob callbacks)
+and are smoothed across the next block to avoid zipper noise.
+
+`SoundResource.astream` feeds the blocks to a mixer channel.
+"""
+import enum
+import logging
+from typing import NamedTuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+@enum.unique
+class Waveform(str, enum.Enum):
+    SINE = 'sine'
+    SQUARE = 'square'
+    SAW = 'saw'
+    TRIANGLE = 'triangle'
+    NOISE = 'noise'
+
+    def __str__(self):
+        return self.value
+
+
+def oscillate(waveform: Waveform, phase: np.ndarray) -> np.ndarray:
+    """Evaluate `waveform` at `phase` (in cycles) in [-1, 1]."""
+    if waveform == Waveform.SINE:
+        return np.sin(2.0 * np.pi * phase)
+    frac = phase % 1.0
+    if waveform == Waveform.SQUARE:
+        return np.where(frac < 0.5, 1.0, -1.0)
+    elif waveform == Waveform.SAW:
+        return 2.0 * frac - 1.0
+    elif waveform == Waveform.TRIANGLE:
+        return 1.0 - 4.0 * np.abs(frac - 0.5)
+    elif waveform == Waveform.NOISE:
+        return np.random.uniform(-1.0, 1.0, len(phase))
+    raise ValueError(f"Unknown waveform: {waveform}")
+
+
+class ADSR(object):
+    """A linear attack/decay/sustain/release envelope, rendered per block.
+
+    Times are in seconds, `sustain` is a level in [0, 1].
+    """
+    IDLE, ATTACK, DECAY, SUSTAIN, RELEASE = range(5)
+
+    def __init__(self, attack=0.01, decay=0.1, sustain=0.7, release=0.3):
+        self.attack = attack
+        self.decay = decay
+        self.sustain = sustain
+        self.release = release
+
+        self.stage = self.IDLE
+        self.level = 0.0
+        self._release_step = 0.0
+
+    @property
+    def active(self) -> bool:
+        return self.stage != self.IDLE
+
+    def note_on(self) -> None:
+        self.stage = self.ATTACK
+
+    def note_off(self) -> None:
+        if self.stage != self.IDLE:
+            self.stage = self.RELEASE
+            self._release_step = None
+
+    def _ramp(self, out, start, n, step, target):
+        """Ramp linearly towards `target` for at most `n` samples.
+
+        Returns the number of samples written.
+        """
+        if step <= 0:
+            k = n
+        else:
+            k = min(n, max(1, int(np.ceil(abs(target - self.level) / step))))
+        direction = 1.0 if target >= self.level else -1.0
+        ramp = self.level + direction * step * np.arange(1, k + 1)
+        out[start:start + k] = (np.minimum(ramp, target) if direction > 0
+                                else np.maximum(ramp, target))
+        self.level = out[start + k - 1]
+        return k
+
+    def render(self, n: int, sr: int) -> np.ndarray:
+        """Render the next `n` envelope levels."""
+        out = np.empty(n)
+        i = 0
+        while i < n:
+            if self.stage == self.ATTACK:
+                i += self._ramp(out, i, n - i,
+                                1.0 / max(self.attack * sr, 1), 1.0)
+                if self.level >= 1.0:
+                    self.stage = self.DECAY
+            elif self.stage == self.DECAY:
+                i += self._ramp(out, i, n - i,
+                                (1.0 - self.sustain) / max(self.decay * sr, 1),
+                                self.sustain)
+                if self.level <= self.sustain:
+                    self.stage = self.SUSTAIN
+            elif self.stage == self.SUSTAIN:
+                self.level = self.sustain
+                out[i:] = self.sustain
+                i = n
+            elif self.stage == self.RELEASE:
+                if self._release_step is None:
+                    self._release_step = (self.level /
+                                          max(self.release * sr, 1))
+                i += self._ramp(out, i, n - i, self._release_step, 0.0)
+                if self.level <= 0.0:
+                    self.stage = self.IDLE
+            else:
+                self.level = 0.0
+                out[i:] = 0.0
+                i = n
+        return out
+
+
+class KnobMapping(NamedTuple):
+    """Map an ADC knob (0-1023) onto a synth parameter range.
+
+    With `log` set the range is mapped exponentially, which suits
+    frequencies.
+    """
+    pin: int
+    param: str
+    low: float
+    high: float
+    log: bool = False
+
+    def scale(self, value: float) -> float:
+        norm = float(np.clip(value / 1023.0, 0.0, 1.0))
+        if self.log:
+            return self.low * (self.high / self.low) ** norm
+        return self.low + norm * (self.high - self.low)
+
+
+DEFAULT_KNOB_MAPPINGS = [
+    KnobMapping(pin=2, param='freq', low=110.0, high=880.0, log=True),
+    KnobMapping(pin=3, param='volume', low=0.0, high=1.0),
+]
+
+
+class StreamingSynth(object):
+    """A monophonic synth voice which renders fixed size int16 blocks."""
+    PARAMS = ('freq', 'volume', 'detune')
+
+    def __init__(self, sr: int = 44010, block_size: int = 1024,
+                 waveform: Waveform = Waveform.SINE, freq: float = 220.0,
+                 volume: float = 0.5, detune: float = 0.0,
+                 envelope: ADSR = None, knob_mappings=None,
+                 amplitude: int = 8192):
+        self.sr = sr
+        self.block_size = block_size
+        self.waveform = Waveform(waveform)
+        self.envelope = envelope or ADSR()
+        self.knob_mappings = {m.pin: m for m in
+                              (knob_mappings or DEFAULT_KNOB_MAPPINGS)}
+        self.amplitude = amplitude
+
+        self.params = {'freq': freq, 'volume': volume, 'detune': detune}
+        self._current = dict(self.params)
+        self._phase = 0.0
+        self._ramp = np.arange(1, block_size + 1) / block_size
+        self._out = np.empty(block_size, dtype=np.int16)
+
+    @property
+    def block_duration(self) -> float:
+        return self.block_size / self.sr
+
+    def set_param(self, name: str, value: float) -> None:
+        if name not in self.PARAMS:
+            raise KeyError(f"Unknown synth parameter: {name}")
+        self.params[name] = value
+
+    def set_waveform(self, waveform: Waveform) -> None:
+        self.waveform = Waveform(waveform)
+
+    def knob_callback(self, knob) -> None:
+        mapping = self.knob_mappings.get(knob.pin)
+        if mapping is not None:
+            self.set_param(mapping.param, mapping.scale(knob.value))
+
+    def note_on(self) -> None:
+        self.envelope.note_on()
+
+    def note_off(self) -> None:
+        self.envelope.note_off()
+
+    def _smoothed(self, name: str) -> np.ndarray:
+        """Ramp a parameter from its last value to its target over a block."""
+        start = self._current[name]
+        target = self.params[name]
+        self._current[name] = target
+        return start + (target - start) * self._ramp
+
+    def render_block(self) -> np.ndarray:
+        """Render the next block of samples.
+
+        The returned array is reused by the next call.
+        """
+        freq = self._smoothed('freq') * 2.0 ** (self._smoothed('detune') / 12)
+        phase = self._phase + np.cumsum(freq) / self.sr
+        self._phase = phase[-1] % 1.0
+
+        signal = oscillate(self.waveform, phase)
+        signal *= self.envelope.render(self.block_size, self.sr)
+        signal *= self._smoothed('volume') * self.amplitude
+        np.copyto(self._out, signal, casting='unsafe')
+        return self._out
@@ -0,0 +1,181 @@
+"""Stream video to a display.
+
+Frames come from a video file (with OpenCV, if it's installed), an
+animated GIF or a directory of numbered images, through a generator
+which advances one frame at a time but leaves decoding each frame until
+it's asked for. Playback presents frames on the display clock; frames
+which are already late are skipped without being decoded, and the rest
+are decoded and downsampled with NumPy on a worker thread, so the event
+loop is never blocked. Only the frame being shown is held in memory,
+however long the clip is.
+"""
+import asyncio
+import concurrent.futures
+import functools
+import logging
+import pathlib
+from typing import Callable, Iterator, Tuple
+
+import numpy as np
+from PIL import Image, ImageSequence
+
+from robot.outputs.display import _natural_key
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+logger = logging.getLogger(__name__)
+
+IMAGE_SUFFIXES = {'.png', '.jpg', '.jpeg', '.bmp', '.gif'}
+
+# A (decode, duration in seconds) pair; decode() returns the frame as an
+# RGB array.
+Frame = Tuple[Callable[[], np.ndarray], float]
+
+
+def _decode_image(path: pathlib.Path) -> np.ndarray:
+    with Image.open(path) as image:
+        return np.asarray(image.convert('RGB'))
+
+
+def _directory_frames(path: pathlib.Path, fps: float) -> Iterator[Frame]:
+    paths = sorted((p for p in path.iterdir()
+                    if p.suffix.lower() in IMAGE_SUFFIXES), key=_natural_key)
+    if not paths:
+        raise FileNotFoundError(f"No frames found in {path}")
+    for p in paths:
+        yield functools.partial(_decode_image, p), 1.0 / fps
+
+
+def _gif_rgb(frame: Image.Image) -> np.ndarray:
+    return np.asarray(frame.convert('RGB'))
+
+
+def _gif_frames(path: pathlib.Path, fps=None) -> Iterator[Frame]:
+    with Image.open(path) as gif:
+        for frame in ImageSequence.Iterator(gif):
+            duration = (1.0 / fps if fps else
+                        frame.info.get('duration', 100) / 1000)
+            # Frames of a GIF depend on the ones before, so each is
+            # decoded as it's reached; only the RGB conversion is left.
+            yield functools.partial(_gif_rgb, frame.copy()), duration
+
+
+def _video_frames(path: pathlib.Path, fps=None) -> Iterator[Frame]:
+    if cv2 is None:
+        raise RuntimeError(f"OpenCV is not installed; can't decode {path}")
+    capture = cv2.VideoCapture(str(path))
+    if not capture.isOpened():
+        raise FileNotFoundError(f"Can't open video {path}")
+    duration = 1.0 / (fps or capture.get(cv2.CAP_PROP_FPS) or 25)
+
+    def retrieve():
+        ok, frame = capture.retrieve()
+        if not ok:
+            raise IOError(f"Can't decode a frame of {path}")
+        return frame[..., ::-1]
+
+    try:
+        # grab() only demuxes the next frame; it's decoded by retrieve()
+        # if it's going to be shown.
+        while capture.grab():
+            yield retrieve, duration
+    finally:
+        capture.release()
+
+
+def read_frames(source, fps=None) -> Iterator[Frame]:
+    """Generate `(decode, duration)` pairs from a video file, an animated
+    GIF or a directory of numbered images. Call `decode()` for the frame,
+    before moving on to the next.
+
+    `fps` overrides the source's own frame rate; a directory of images
+    plays at 10 fps unless it's given.
+    """
+    path = pathlib.Path(source)
+    if path.is_dir():
+        return _directory_frames(path, fps or 10)
+    if not path.exists():
+        raise FileNotFoundError(f"No video at {path}")
+    if path.suffix.lower() == '.gif':
+        return _gif_frames(path, fps)
+    return _video_frames(path, fps)
+
+
+def downsample(frame: np.ndarray, size=(128, 128)) -> np.ndarray:
+    """Crop an RGB frame to the aspect ratio of `size` and shrink it to
+    `size` by averaging blocks of pixels."""
+    width, height = size
+    h, w = frame.shape[:2]
+
+    # Crop the centre to the target aspect ratio.
+    if w * height > h * width:
+        crop = h * width // height
+        frame = frame[:, (w - crop) // 2:(w - crop) // 2 + crop]
+    else:
+        crop = w * height // width
+        frame = frame[(h - crop) // 2:(h - crop) // 2 + crop]
+    h, w = frame.shape[:2]
+
+    # Sample to a whole multiple of the target size, then average blocks.
+    factor = max(1, min(h // height, w // width))
+    rows = (np.arange(height * factor) * h) // (height * factor)
+    cols = (np.arange(width * factor) * w) // (width * factor)
+    frame = frame[rows[:, np.newaxis], cols]
+    if factor > 1:
+        frame = frame.reshape(height, factor, width, factor, -1).mean(
+            axis=(1, 3))
+    return frame.astype(np.uint8)
+
+
+async def play_video(display, source, size=(128, 128), fps=None,
+                     loop=False) -> int:
+    """Play a video on a display (or compositor).
+
+    Each frame is due at a fixed time from the start; a frame whose time
+    has already passed is dropped without being decoded, so slow playback
+    skips ahead rather than drifting. Reading and decoding run on a
+    worker thread. Cancel the task to stop a looping video. Returns the
+    number of frames dropped.
+    """
+    event_loop = asyncio.get_event_loop()
+    executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers=1, thread_name_prefix='video')
+
+    def decode(load):
+        return downsample(load(), size)
+
+    start = event_loop.time()
+    due = 0.0
+    n_frames = 0
+    dropped = 0
+    frames = None
+    try:
+        while True:
+            frames = read_frames(source, fps)
+            while True:
+                item = await event_loop.run_in_executor(executor, next,
+                                                        frames, None)
+                if item is None:
+                    break
+                load, duration = item
+                n_frames += 1
+                if event_loop.time() - start < due + duration:
+                    frame = await event_loop.run_in_executor(executor,
+                                                             decode, load)
+                    await display.adraw_frame(frame)
+                else:
+                    dropped += 1
+                due += duration
+                await asyncio.sleep(max(0.0, start + due - event_loop.time()))
+            if not loop or not n_frames:
+                break
+    finally:
+        if frames is not None:
+            executor.submit(frames.close)
+        executor.shutdown(wait=False)
+    if dropped:
+        logger.debug(f"Dropped {dropped} of {n_frames} frames of {source}")
+    return dropped
@@ -0,0 +1,112 @@
+"""A display device which draws into memory instead of a panel.
+
+`VirtualDevice` has the parts of the luma device API that `OLEDDisplay`
+uses, including the ssd1351 window commands, so all display code runs
+without the hardware (or luma). It counts the frames and bytes that would
+have been sent, and can save snapshots and a frame log for tests and
+benchmarks.
+"""
+import json
+import logging
+import pathlib
+import time
+from typing import Callable, Optional
+
+import numpy as np
+from PIL import Image
+
+from robot.outputs.rgb565 import decode_rgb565
+
+logger = logging.getLogger(__name__)
+
+BITS_PER_PIXEL = {'1': 1, 'L': 8, 'RGB': 16}
+
+
+class VirtualDevice(object):
+    """An in-memory display of `width` x `height` pixels in `mode`.
+
+    `n_frames` counts whole frames and windows written, and `n_bytes`
+    the bytes that would have been sent for them. With `snapshot_dir` set,
+    the display is saved there as a numbered PNG after every write.
+    """
+    def __init__(self, width: int = 128, height: int = 128,
+                 mode: str = 'RGB', snapshot_dir: Optional[str] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.width = width
+        self.height = height
+        self.size = (width, height)
+        self.mode = mode
+        self.snapshot_dir = (pathlib.Path(snapshot_dir) if snapshot_dir
+                             else None)
+        self.clock = clock
+
+        self.frame = np.zeros((height, width, 3), dtype=np.uint8)
+        self.n_frames = 0
+        self.n_bytes = 0
+        self.frame_log = []
+        self._window = (0, 0, width, height)
+        self._command = None
+
+        if self.snapshot_dir is not None:
+            self.snapshot_dir.mkdir(parents=True, exist_ok=True)
+
+    def __repr__(self):
+        return (f"{self.__class__.__name__}(size={self.size}, "
+                f"mode={self.mode}, n_frames={self.n_frames}, "
+                f"n_bytes={self.n_bytes})")
+
+    def _frame_done(self, window, n_bytes):
+        self.n_frames += 1
+        self.n_bytes += n_bytes
+        self.frame_log.append({'time': self.clock(), 'window': [int(x) for x in window],
+                               'bytes': n_bytes})
+        if self.snapshot_dir is not None:
+            self.snapshot(self.snapshot_dir / f"{self.n_frames:06d}.png")
+
+    def display(self, image: Image.Image) -> None:
+        """Show a whole frame, as luma would."""
+        self.frame[:] = np.asarray(image.convert('RGB'))
+        n_bytes = self.width * self.height * BITS_PER_PIXEL[self.mode] // 8
+        self._frame_done((0, 0, self.width, self.height), n_bytes)
+
+    def clear(self) -> None:
+        self.display(Image.new(self.mode, self.size))
+
+    def command(self, cmd, *args) -> None:
+        """Handle the ssd1351 column (0x15), row (0x75) and write RAM
+        (0x5C) commands."""
+        self.n_bytes += 1 + len(args)
+        left, top, right, bottom = self._window
+        if cmd == 0x15:
+            left, right = args[0], args[1] + 1
+        elif cmd == 0x75:
+            top, bottom = args[0], args[1] + 1
+        self._window = (left, top, right, bottom)
+        self._command = cmd
+
+    def data(self, data) -> None:
+        """Write RGB565 pixels into the current window."""
+        if self._command != 0x5C:
+            self.n_bytes += len(data)
+            return
+        left, top, right, bottom = self._window
+        pixels = decode_rgb565(bytes(data), right - left, bottom - top)
+        self.frame[top:bottom, left:right] = pixels
+        self._frame_done(self._window, len(data))
+
+    def image(self) -> Image.Image:
+        """The current contents of the display."""
+        return Image.fromarray(self.frame).convert(self.mode)
+
+    def snapshot(self, path) -> pathlib.Path:
+        path = pathlib.Path(path)
+        self.image().save(path)
+        return path
+
+    def write_frame_log(self, path) -> pathlib.Path:
+        """Write the frame log as JSON lines."""
+        path = pathlib.Path(path)
+        with open(path, 'w') as f:
+            for entry in self.frame_log:
+                f.write(json.dumps(entry) + '\n')
+        return path
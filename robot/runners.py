@@ -8,6 +8,7 @@ from typing import Callable
 from queue import Queue
 
 import robot.actions
+from robot.scheduler import ActionScheduler
 
 logger = logging.getLogger(__name__)
 
@@ -124,9 +125,14 @@ class TestAsyncRunner(object):
 class RobotScriptRunner(object):
     """Class which manages the main event loop of the 'real' robot mode.
     """
-    def __init__(self, driver, adc_poll_interval=0.05):
+    def __init__(self, driver, adc_poll_interval=0.05,
+                 microphone_poll_interval=0.05, timer_interval=1.0):
         self.driver = driver
         self.adc_poll_interval = adc_poll_interval
+        self.microphone_poll_interval = microphone_poll_interval
+        # Actions with a `timer_callback` get a 'clock' Tick this often.
+        self.timer_interval = timer_interval
+        self.scheduler = None
 
     def _get_main_loop(self) -> robot.actions.Action:
         return robot.actions.MainLoop
@@ -138,11 +144,16 @@ class RobotScriptRunner(object):
         logger.info("Beggining State Machine")
         try:
             loop = asyncio.get_event_loop()
+            self.driver.events.attach(loop)
 
             tasks = [
                 asyncio.ensure_future(self.poll_adc()),
                 asyncio.ensure_future(self.run_action_loop()),
+                asyncio.ensure_future(self.driver.events.run_timer(
+                    'clock', self.timer_interval)),
             ]
+            if self.driver.microphone:
+                tasks.append(asyncio.ensure_future(self.poll_microphone()))
 
             loop.run_until_complete(asyncio.wait(tasks))
 
@@ -159,24 +170,14 @@ class RobotScriptRunner(object):
             # adc_values = adc_values / 1024
             await asyncio.sleep(self.adc_poll_interval)
 
+    async def poll_microphone(self) -> None:
+        while True:
+            level = self.driver.read_microphone()
+            if level is not None:
+                logger.debug(f"Sound level: {level}")
+            await asyncio.sleep(self.microphone_poll_interval)
+
     async def run_action_loop(self) -> None:
         logger.info("Beginning action loop")
-        action_queue = []
-
-        while True:
-            if len(action_queue) == 0:
-                logger.info("Going to main loop")
-                action_queue.append(self._get_main_loop())
-
-            action = action_queue.pop(0)(self.driver)
-            logger.info(f"Action chosen: {action}")
-            logger.info(f"Remaining Actions: {len(action_queue)}")
-
-            # Activates the callbacks
-            with action:
-                new_actions = await action.run()
-
-                if new_actions is not None and isinstance(new_actions, list):
-                    action_queue.extend(new_actions)
-                elif new_actions is not None:
-                    action_queue.append(new_actions)
+        self.scheduler = ActionScheduler(self.driver, self._get_main_loop)
+        await self.scheduler.run()
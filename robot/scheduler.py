@@ -0,0 +1,147 @@
+"""Schedule actions by priority.
+
+Actions wait in a heap ordered by priority, then by submission order.
+Submitting an action that is already queued merges the two, keeping the
+higher priority. Submitting an action more urgent than the one running
+cancels the running one, so a button press doesn't have to wait for a
+long action to finish sleeping.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ActionScheduler(object):
+    """Run actions one at a time, most urgent first.
+
+    Priorities are numbers, higher is more urgent; they default to the
+    action's `priority` attribute (0 if unset). An action runs for at most
+    its `timeout` seconds, if it has one. Whatever `run()` returns (an
+    action, or a list of them) is submitted next. When nothing is queued,
+    `idle_action()` is run.
+    """
+    def __init__(self, driver, idle_action: Callable,
+                 default_timeout: Optional[float] = None):
+        self.driver = driver
+        self.idle_action = idle_action
+        self.default_timeout = default_timeout
+
+        self._heap = []
+        self._queued = {}
+        self._counter = itertools.count()
+        self._task = None
+        self.current = None
+        self.current_priority = None
+
+    def __len__(self):
+        return len(self._queued)
+
+    @property
+    def queued(self) -> List:
+        """The queued actions, in the order they will run."""
+        return [entry[2] for entry in sorted(self._queued.values())]
+
+    def submit(self, action, priority: Optional[float] = None,
+               timeout: Optional[float] = None, preempt: bool = True) -> bool:
+        """Queue an action class.
+
+        If it is already queued, the two are merged and False is returned.
+        If `preempt` is set and it is more urgent than the running action,
+        the running action is cancelled.
+        """
+        if priority is None:
+            priority = getattr(action, 'priority', 0)
+        if timeout is None:
+            timeout = getattr(action, 'timeout', None) or self.default_timeout
+
+        existing = self._queued.get(action)
+        if existing is not None and -existing[0] >= priority:
+            merged = True
+        else:
+            if existing is not None:
+                # Leave the old entry in the heap, marked as removed.
+                existing[-1] = False
+            entry = [-priority, next(self._counter), action, timeout, True]
+            heapq.heappush(self._heap, entry)
+            self._queued[action] = entry
+            merged = existing is not None
+
+        if merged:
+            logger.debug(f"Coalesced {action} with the queued one")
+        if (preempt and self._task is not None and not self._task.done() and
+                priority > self.current_priority):
+            logger.info(f"{action} (priority {priority}) preempts "
+                        f"{self.current}")
+            self._task.cancel()
+        return not merged
+
+    def cancel(self) -> bool:
+        """Cancel the running action, if any."""
+        if self._task is None or self._task.done():
+            return False
+        return self._task.cancel()
+
+    def clear(self) -> None:
+        """Drop every queued action."""
+        self._heap = []
+        self._queued = {}
+
+    def _pop(self):
+        while self._heap:
+            entry = heapq.heappop(self._heap)
+            if entry[-1]:
+                del self._queued[entry[2]]
+                return entry
+        return None
+
+    async def run_next(self):
+        """Run the most urgent queued action (or the idle action) and
+        queue what it returns. Returns the action's result, or None if it
+        was cancelled or timed out."""
+        entry = self._pop()
+        if entry is None:
+            logger.info("Going to main loop")
+            entry = [0, next(self._counter), self.idle_action(), None, True]
+        neg_priority, _, action_cls, timeout, _ = entry
+
+        action = action_cls(self.driver)
+        action.scheduler = self
+        self.current = action
+        self.current_priority = -neg_priority
+        logger.info(f"Action chosen: {action}")
+        logger.info(f"Remaining Actions: {len(self)}")
+
+        result = None
+        # Activates the callbacks
+        with action:
+            self._task = asyncio.ensure_future(
+                asyncio.wait_for(action.run(), timeout))
+            try:
+                await asyncio.wait([self._task])
+            except asyncio.CancelledError:
+                self._task.cancel()
+                raise
+            finally:
+                self.current = None
+
+            if self._task.cancelled():
+                logger.info(f"{action} was cancelled")
+            elif isinstance(self._task.exception(), asyncio.TimeoutError):
+                logger.warning(f"{action} timed out after {timeout}s")
+            else:
+                result = self._task.result()
+
+        if isinstance(result, list):
+            for next_action in result:
+                self.submit(next_action, preempt=False)
+        elif result is not None:
+            self.submit(result, preempt=False)
+        return result
+
+    async def run(self) -> None:
+        while True:
+            await self.run_next()
@@ -0,0 +1,272 @@
+"""Ambient sound sensing.
+
+Audio is read in fixed size blocks from a microphone (or a wav file
+standing in for one) and reduced with NumPy to an RMS level and a few
+band energies per block. Loudness and clap callbacks fire from those, in
+the same way the `ADCPoller` fires knob callbacks.
+
+Only the current block and a short history of levels are kept, so memory
+use doesn't grow however long the robot listens.
+"""
+import collections
+import enum
+import logging
+import time
+import wave
+from typing import Callable, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import sounddevice
+except ImportError:
+    sounddevice = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BANDS = ((20, 300), (300, 2000), (2000, 8000))
+
+
+class WavFileSource(object):
+    """Stream blocks from a wav file in real time, as a microphone would.
+
+    Frames are read from disk as they are needed.
+    """
+    def __init__(self, path: str, block_size: int = 1024, loop: bool = True,
+                 clock: Callable[[], float] = time.monotonic):
+        self.path = path
+        self.block_size = block_size
+        self.loop = loop
+        self.clock = clock
+        self._wav = None
+
+    def start(self) -> None:
+        self._wav = wave.open(str(self.path), 'rb')
+        if self._wav.getsampwidth() != 2:
+            raise ValueError(f"Only 16 bit wav files are supported: {self.path}")
+        self.sr = self._wav.getframerate()
+        self._channels = self._wav.getnchannels()
+        self._start = self.clock()
+        self._blocks_read = 0
+
+    def stop(self) -> None:
+        if self._wav is not None:
+            self._wav.close()
+            self._wav = None
+
+    def _read_block(self) -> Optional[np.ndarray]:
+        frames = self._wav.readframes(self.block_size)
+        if len(frames) < self.block_size * 2 * self._channels and self.loop:
+            self._wav.rewind()
+            frames += self._wav.readframes(
+                self.block_size - len(frames) // (2 * self._channels))
+        if not frames:
+            return None
+
+        block = np.frombuffer(frames, dtype=np.int16)
+        block = block.reshape(-1, self._channels).mean(axis=1)
+        if len(block) < self.block_size:
+            block = np.pad(block, (0, self.block_size - len(block)))
+        return block.astype(np.int16)
+
+    def read(self) -> Optional[np.ndarray]:
+        """The next block if it would have been recorded by now, else
+        None."""
+        if self._wav is None:
+            return None
+        due = int((self.clock() - self._start) * self.sr / self.block_size)
+        if self._blocks_read >= due:
+            return None
+        self._blocks_read += 1
+        return self._read_block()
+
+
+class MicrophoneSource(object):
+    """Stream blocks from a microphone with `sounddevice`.
+
+    Blocks arrive on the audio thread into a short queue; if they aren't
+    read in time the oldest are dropped.
+    """
+    def __init__(self, block_size: int = 1024, sr: int = 16000,
+                 device: Optional[str] = None, max_blocks: int = 4):
+        self.block_size = block_size
+        self.sr = sr
+        self.device = device
+        self._blocks = collections.deque(maxlen=max_blocks)
+        self._stream = None
+
+    def _callback(self, indata, frames, time_info, status):
+        if status:
+            logger.debug(f"Microphone status: {status}")
+        self._blocks.append(indata[:, 0].copy())
+
+    def start(self) -> None:
+        if sounddevice is None:
+            raise RuntimeError("sounddevice is not installed")
+        self._stream = sounddevice.InputStream(
+            samplerate=self.sr, blocksize=self.block_size, device=self.device,
+            channels=1, dtype='int16', callback=self._callback)
+        self._stream.start()
+
+    def stop(self) -> None:
+        if self._stream is not None:
+            self._stream.stop()
+            self._stream.close()
+            self._stream = None
+
+    def read(self) -> Optional[np.ndarray]:
+        try:
+            return self._blocks.popleft()
+        except IndexError:
+            return None
+
+
+class SoundLevel(object):
+    """The level of one block of ambient sound.
+
+    `high_fraction` is the share of its energy above the clap frequency.
+    """
+    def __init__(self, rms: float, db: float, bands: np.ndarray,
+                 background_db: float, high_fraction: float = 0.0):
+        self.rms = rms
+        self.db = db
+        self.bands = bands
+        self.background_db = background_db
+        self.high_fraction = high_fraction
+
+    def __repr__(self):
+        return (f"{self.__class__.__name__}(db={self.db:.1f}, "
+                f"background_db={self.background_db:.1f}, "
+                f"bands={np.round(self.bands, 4)})")
+
+
+class AmbientSoundSensor(object):
+    """Compute per-block levels from an audio source and raise loudness and
+    clap callbacks.
+
+    - The loudness callback fires when the level rises above
+      `loud_db` (dBFS), and again only after it has dropped
+      `hysteresis_db` below it.
+    - The clap callback fires on a sudden block `clap_db` above the
+      background level whose energy is mostly above `clap_min_freq`.
+    """
+    def __init__(self, source, bands: Sequence[Tuple[float, float]] = DEFAULT_BANDS,
+                 loud_db: float = -20.0, hysteresis_db: float = 6.0,
+                 clap_db: float = 20.0, clap_min_freq: float = 2000.0,
+                 clap_ratio: float = 0.5, clap_refractory: float = 0.3,
+                 history: int = 50) -> None:
+        self.source = source
+        self.bands = bands
+        self.loud_db = loud_db
+        self.hysteresis_db = hysteresis_db
+        self.clap_db = clap_db
+        self.clap_min_freq = clap_min_freq
+        self.clap_ratio = clap_ratio
+        self.clap_refractory = clap_refractory
+
+        self.history = collections.deque(maxlen=history)
+        self.level = None
+        self.is_loud = False
+        self._last_clap = None
+        self._time = 0.0
+        self._loudness_callback = None
+        self._clap_callback = None
+
+    def set_loudness_callback(self, callback: Callable):
+        self._loudness_callback = callback
+
+    def set_clap_callback(self, callback: Callable):
+        self._clap_callback = callback
+
+    def clear_callbacks(self):
+        self._loudness_callback = None
+        self._clap_callback = None
+
+    def setup(self) -> None:
+        self.source.start()
+        block_size = self.source.block_size
+        sr = self.source.sr
+        self.block_duration = block_size / sr
+
+        self._window = np.hanning(block_size)
+        freqs = np.fft.rfftfreq(block_size, 1.0 / sr)
+        self._band_masks = np.array([(freqs >= lo) & (freqs < hi)
+                                     for lo, hi in self.bands], dtype=float)
+        self._high_mask = freqs >= self.clap_min_freq
+
+    def cleanup(self) -> None:
+        self.source.stop()
+
+    def analyse(self, block: np.ndarray) -> SoundLevel:
+        """Reduce a block to its RMS level and band energies."""
+        x = block.astype(np.float32) / 32768.0
+        rms = float(np.sqrt(np.mean(np.square(x))))
+        db = 20.0 * np.log10(max(rms, 1e-6))
+
+        power = np.square(np.abs(np.fft.rfft(x * self._window)))
+        total = power.sum()
+        bands = self._band_masks @ power / max(total, 1e-12)
+        high_fraction = float(power[self._high_mask].sum() / max(total, 1e-12))
+
+        background_db = (float(np.median(self.history)) if self.history
+                         else db)
+        return SoundLevel(rms, db, bands, background_db, high_fraction)
+
+    def _process(self, block: np.ndarray) -> SoundLevel:
+        level = self.analyse(block)
+        self._time += self.block_duration
+
+        if not self.is_loud and level.db > self.loud_db:
+            self.is_loud = True
+            if self._loudness_callback:
+                self._loudness_callback(level)
+        elif self.is_loud and level.db < self.loud_db - self.hysteresis_db:
+            self.is_loud = False
+
+        if (level.db - level.background_db > self.clap_db and
+                level.high_fraction > self.clap_ratio and
+                (self._last_clap is None or
+                 self._time - self._last_clap > self.clap_refractory)):
+            self._last_clap = self._time
+            if self._clap_callback:
+                self._clap_callback(level)
+
+        self.history.append(level.db)
+        self.level = level
+        return level
+
+    def poll(self) -> Optional[SoundLevel]:
+        """Process every block available from the source, returning the
+        latest level (or None if there were no new blocks)."""
+        level = None
+        while True:
+            block = self.source.read()
+            if block is None:
+                return level
+            level = self._process(block)
+
+
+@enum.unique
+class AudioSourceType(str, enum.Enum):
+    MICROPHONE = ('microphone', MicrophoneSource)
+    WAV = ('wav', WavFileSource)
+
+    def __new__(cls, value, source_cls):
+        obj = str.__new__(cls)
+        obj._value_ = value
+        obj.source_cls = source_cls
+        return obj
+
+    def __str__(self):
+        return self.value
+
+
+def microphone_factory(config) -> Optional[AmbientSoundSensor]:
+    """Create an ambient sound sensor from the `microphone` config."""
+    if not config:
+        return None
+    config = dict(config)
+    source_type = config.pop('source', 'microphone')
+    source_args = config.pop('source_args', {})
+    source = AudioSourceType(source_type).source_cls(**source_args)
+    return AmbientSoundSensor(source, **config)
@@ -0,0 +1,24 @@
+"""Helpers shared by the tests; import them with `from conftest import ...`."""
+import asyncio
+
+
+class FakeClock:
+    """A clock which only moves when `now` is set."""
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def run(coro):
+    """Run `coro` on a fresh event loop, cancelling anything it leaves
+    running (e.g. a channel manager's watcher) before closing the loop."""
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        for task in asyncio.all_tasks(loop):
+            task.cancel()
+        loop.run_until_complete(asyncio.sleep(0))
+        loop.close()
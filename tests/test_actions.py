@@ -0,0 +1,167 @@
+import asyncio
+
+import pytest
+
+import robot.actions as actions
+import robot.dsp as dsp
+from robot.events import EventBus, Topic
+from robot.outputs.audio import read_wav
+from robot.scheduler import ActionScheduler
+from robot.sensors.adc import ADCKnob
+from conftest import run
+
+
+class FakeDisplay:
+    def __init__(self):
+        self.calls = []
+        self.device = FakeDevice()
+
+    def __getattr__(self, name):
+        async def draw(*args):
+            self.calls.append((name, args))
+            return True
+        return draw
+
+
+class FakeDevice:
+    size = (128, 128)
+
+
+class FakeBackend:
+    sr = 16000
+
+
+class FakeSound:
+    backend = FakeBackend()
+
+    def __getattr__(self, name):
+        async def play(*args, **kwargs):
+            pass
+        return play
+
+
+class FakeADC:
+    change_tolerance = 5
+    last_read = [0] * 8
+
+
+class FakeDriver:
+    def __init__(self):
+        self.display = FakeDisplay()
+        self.sound = FakeSound()
+        self.adc = FakeADC()
+        self.events = EventBus()
+        self.servos = []
+
+    def set_servo_position(self, label, position):
+        self.servos.append((label, position))
+
+    def toggle_all_leds(self):
+        pass
+
+    def clear_all_leds(self):
+        pass
+
+
+def test_dance_song_is_shipped():
+    assert actions.DanceParty.SONG.path.exists()
+    analysis = dsp.analyse_beats(*read_wav(actions.DanceParty.SONG.path))
+    assert analysis.tempo == pytest.approx(120, abs=5)
+
+
+def test_skipped_beats_keep_the_phase():
+    driver = FakeDriver()
+    dance = actions.DanceParty(driver)
+    beats = []
+    dance.on_beat = beats.append
+
+    async def main():
+        # The first two beats are already too late by the time the
+        # choreography starts.
+        await dance.choreograph([-1.0, -0.5, 0.0, 0.01], [])
+
+    run(main())
+    assert beats == [2, 3]
+
+
+def test_turning_the_knobs_schedules_the_synth():
+    driver = FakeDriver()
+    scheduler = ActionScheduler(driver, lambda: actions.MainLoop)
+
+    async def main():
+        # Small jitter doesn't count as turning a knob.
+        driver.events.publish(Topic.KNOB, ADCKnob(2, 3, 0, driver.adc))
+        task = asyncio.ensure_future(scheduler.run_next())
+        await asyncio.sleep(0)
+        for value in range(0, 1100, 100):
+            driver.events.publish(Topic.KNOB, ADCKnob(2, value + 100, value,
+                                                      driver.adc))
+        return await asyncio.wait_for(task, 5)
+
+    assert run(main()) is actions.KnobSynth
+    assert scheduler.queued == [actions.KnobSynth]
+
+
+def test_idle_main_loop_starts_the_screensaver():
+    driver = FakeDriver()
+    main_loop = actions.MainLoop(driver, sleep_time=0.1)
+    with main_loop:
+        assert run(main_loop.run()) is actions.Screensaver
+
+
+def test_touched_main_loop_does_not_sleep():
+    driver = FakeDriver()
+    main_loop = actions.MainLoop(driver, sleep_time=0.1)
+
+    async def main():
+        task = asyncio.ensure_future(main_loop.run())
+        await asyncio.sleep(0)
+        driver.events.publish(Topic.KNOB, ADCKnob(3, 500, 0, driver.adc))
+        return await task
+
+    with main_loop:
+        assert run(main()) is None
+
+
+def test_leaving_early_stops_the_welcome():
+    driver = FakeDriver()
+    main_loop = actions.MainLoop(driver)
+    main_loop.heard_clap = True
+
+    async def main():
+        result = await main_loop.run()
+        await asyncio.sleep(0)
+        others = asyncio.all_tasks() - {asyncio.current_task()}
+        return result, others
+
+    with main_loop:
+        result, others = run(main())
+    assert result is actions.DanceParty
+    # The servo script and welcome speech were cancelled, not left running.
+    assert others == set()
+
+
+def test_knob_synth_uses_the_mixer_rate():
+    synth = actions.KnobSynth(FakeDriver())
+    assert synth.synth.sr == FakeBackend.sr
+
+
+def test_screensaver_stops_on_a_button():
+    driver = FakeDriver()
+    screensaver = actions.Screensaver(driver, fps=100)
+
+    async def main():
+        loop = asyncio.get_event_loop()
+        loop.call_later(0.05, driver.events.publish, Topic.BUTTON, None)
+        start = loop.time()
+        result = await asyncio.wait_for(screensaver.run(), 1)
+        return result, loop.time() - start
+
+    with screensaver:
+        result, elapsed = run(main())
+
+    assert result is actions.MainLoop
+    assert elapsed < 0.2
+    names = [name for name, _ in driver.display.calls]
+    assert names.count('amove_and_draw_strs') >= 2
+    assert names[-1] == 'aclear'
@@ -0,0 +1,49 @@
+import numpy as np
+
+import robot.actions as actions
+import robot.bundle as robot_bundle
+from robot.outputs.audio import write_wav
+from robot.outputs.display import RESOURCES
+from robot.outputs.resource_pack import ResourcePack
+
+
+def test_extract_assets():
+    assets = robot_bundle.extract_assets([actions.WeddingIsLoading,
+                                          actions.ActionPlayTwoSounds])
+
+    assert "Hello, I am the robot" in assets.speech
+    assert (str(RESOURCES / "heart1.jpg"), 0) in assets.images
+    assert (str(RESOURCES / "4_B_wedding-generating-4.png"), 0) in assets.images
+    assert len(assets.sounds) == 1
+
+
+def test_extract_assets_skips_dynamic_speech():
+    assets = robot_bundle.extract_assets([actions.MainLoop])
+
+    assert "Hello." in assets.speech
+    assert not any(x.startswith("You pushed") for x in assets.speech)
+
+
+def test_build_and_load_bundle(tmp_path, monkeypatch):
+    def fake_speech_to_wav(text, output_file):
+        write_wav(output_file, np.zeros(800), 8000)
+        return True
+
+    monkeypatch.setattr(robot_bundle.robot_sound, 'speech_to_wav',
+                        fake_speech_to_wav)
+    monkeypatch.setattr(robot_bundle.dsp, 'cached_beats', lambda path: None)
+
+    robot_bundle.build_bundle(tmp_path, [actions.ActionPlayTwoSounds],
+                              display_size=(128, 128))
+    bundle = robot_bundle.AssetBundle.load(tmp_path)
+
+    assert bundle.speech["Hello, I am the robot"].exists()
+    # Images are only in the pack.
+    assert not (tmp_path / "frames").exists()
+
+    pack = ResourcePack(bundle.pack)
+    assert pack.size == (128, 128)
+    assert pack.get(RESOURCES / "heart1.jpg") is not None
+    assert pack.get(RESOURCES / "heart2.jpg") is not None
+    assert pack.get(RESOURCES / "4_B_wedding-generating-1.png") is not None
+    pack.close()
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+import robot.dsp as dsp
+from robot.outputs.audio import write_wav
+
+
+class TestFrameSignal:
+    def test_shape(self):
+        frames = dsp.frame_signal(np.arange(10.0), 4, 2)
+        assert frames.shape == (4, 4)
+        np.testing.assert_array_equal(frames[1], [2, 3, 4, 5])
+
+    def test_pads_last_frame(self):
+        frames = dsp.frame_signal(np.arange(5.0), 4, 4)
+        assert frames.shape == (2, 4)
+        np.testing.assert_array_equal(frames[1], [4, 0, 0, 0])
+
+    def test_short_signal(self):
+        assert dsp.frame_signal(np.ones(2), 4, 2).shape == (1, 4)
+
+
+def test_rms_envelope():
+    sr = 1000
+    loud = np.full(500, 16000, dtype=np.int16)
+    quiet = np.full(500, 4000, dtype=np.int16)
+    envelope = dsp.rms_envelope(np.concatenate([loud, quiet]), sr, rate=10)
+
+    assert len(envelope) == 10
+    assert envelope[:5] == pytest.approx(1.0)
+    assert envelope[5:] == pytest.approx(0.25)
+
+
+def test_rms_envelope_silence():
+    envelope = dsp.rms_envelope(np.zeros(1000, dtype=np.int16), 1000, 10)
+    assert np.all(envelope == 0)
+
+
+def test_cached_envelope(tmp_path):
+    path = tmp_path / "phrase.wav"
+    write_wav(path, np.full(1000, 1000, dtype=np.int16), 1000)
+
+    envelope = dsp.cached_envelope(path, rate=20)
+    cache_path = dsp.envelope_path(path, 20)
+
+    assert cache_path.exists()
+    assert len(envelope) == 20
+    np.testing.assert_array_equal(np.load(cache_path), envelope)
+
+
+def click_track(bpm, seconds=8, sr=22050, offset=0.25):
+    rng = np.random.RandomState(0)
+    x = rng.randn(sr * seconds) * 300
+    decay = np.exp(-np.arange(400) / 80)
+    for t in np.arange(offset, seconds, 60.0 / bpm):
+        i = int(t * sr)
+        x[i:i + 400] += rng.randn(400) * 12000 * decay
+    return np.clip(x, -32768, 32767).astype(np.int16), sr
+
+
+@pytest.mark.parametrize('bpm', [90, 120, 150])
+def test_analyse_beats(bpm):
+    samples, sr = click_track(bpm)
+    analysis = dsp.analyse_beats(samples, sr)
+
+    assert analysis.tempo == pytest.approx(bpm, rel=0.03)
+    period = 60.0 / bpm
+    phase_error = np.abs((analysis.beats - 0.25 + period / 2) % period -
+                         period / 2)
+    assert np.median(phase_error) < 0.05
+
+
+def test_cached_beats(tmp_path):
+    samples, sr = click_track(120, seconds=4)
+    path = tmp_path / "song.wav"
+    write_wav(path, samples, sr)
+
+    analysis = dsp.cached_beats(path)
+    cached = dsp.cached_beats(path)
+
+    assert dsp.beats_path(path).exists()
+    assert cached.tempo == analysis.tempo
+    np.testing.assert_array_equal(cached.beats, analysis.beats)
@@ -0,0 +1,126 @@
+import asyncio
+import threading
+
+import pytest
+
+from robot.events import EventBus, Tick, Topic
+from conftest import run
+
+
+@pytest.fixture
+def bus():
+    return EventBus()
+
+
+def test_publish_by_topic(bus):
+    buttons, knobs = [], []
+    bus.subscribe(Topic.BUTTON, buttons.append)
+    bus.subscribe('knob', knobs.append)
+
+    bus.publish(Topic.BUTTON, 'red')
+    bus.publish(Topic.KNOB, 0.5)
+    bus.publish(Topic.CLAP, None)
+
+    assert buttons == ['red']
+    assert knobs == [0.5]
+
+
+def test_unsubscribe(bus):
+    events = []
+    bus.subscribe(Topic.BUTTON, events.append)
+    assert bus.unsubscribe(Topic.BUTTON, events.append)
+    assert not bus.unsubscribe(Topic.BUTTON, events.append)
+    bus.publish(Topic.BUTTON, 'red')
+    assert events == []
+
+
+def test_subscribe_handlers(bus):
+    class Handler:
+        def __init__(self):
+            self.events = []
+
+        def button_callback(self, button):
+            self.events.append(('button', button))
+
+        def clap_callback(self, level):
+            self.events.append(('clap', level))
+
+    handler = Handler()
+    subscriptions = bus.subscribe_handlers(handler)
+    assert [topic for topic, _ in subscriptions] == [Topic.BUTTON, Topic.CLAP]
+
+    bus.publish(Topic.BUTTON, 1)
+    bus.publish(Topic.KNOB, 2)
+    bus.publish(Topic.CLAP, 3)
+    assert handler.events == [('button', 1), ('clap', 3)]
+
+    for topic, callback in subscriptions:
+        bus.unsubscribe(topic, callback)
+    assert bus.subscribers(Topic.BUTTON) == ()
+
+
+def test_failing_subscriber(bus):
+    def fail(event):
+        raise ValueError(event)
+
+    events = []
+    bus.subscribe(Topic.BUTTON, fail)
+    bus.subscribe(Topic.BUTTON, events.append)
+    bus.publish(Topic.BUTTON, 'red')
+    assert events == ['red']
+
+
+def test_coroutine_subscriber(bus):
+    events = []
+
+    async def handler(event):
+        events.append(event)
+
+    async def main():
+        bus.subscribe(Topic.BUTTON, handler)
+        bus.publish(Topic.BUTTON, 'red')
+        await asyncio.sleep(0)
+
+    run(main())
+    assert events == ['red']
+
+
+def test_publish_from_another_thread(bus):
+    threads = []
+
+    async def main():
+        bus.attach(asyncio.get_event_loop())
+        bus.subscribe(Topic.BUTTON,
+                      lambda event: threads.append(threading.get_ident()))
+        thread = threading.Thread(target=bus.publish,
+                                  args=(Topic.BUTTON, 'red'))
+        thread.start()
+        thread.join()
+        assert threads == []
+        await asyncio.sleep(0.01)
+
+    run(main())
+    assert threads == [threading.get_ident()]
+
+
+def test_wait_for(bus):
+    async def main():
+        asyncio.get_event_loop().call_later(
+            0.01, bus.publish, Topic.CLAP, 'loud')
+        event = await bus.wait_for(Topic.CLAP, timeout=1)
+        with pytest.raises(asyncio.TimeoutError):
+            await bus.wait_for(Topic.CLAP, timeout=0.01)
+        return event
+
+    assert run(main()) == 'loud'
+    assert bus.subscribers(Topic.CLAP) == ()
+
+
+def test_timer(bus):
+    ticks = []
+    bus.subscribe(Topic.TIMER, ticks.append)
+    run(bus.run_timer('blink', 0.01, count=3))
+    assert [(t.name, t.count) for t in ticks] == [('blink', i)
+                                                  for i in range(1, 4)]
+    assert all(isinstance(t, Tick) for t in ticks)
+    assert ticks[-1].time == pytest.approx(0.03, abs=0.02)
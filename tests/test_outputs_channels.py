@@ -0,0 +1,139 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+import robot.outputs.audio as audio
+from robot.outputs.channels import ChannelManager
+from conftest import FakeClock, run
+
+
+class EventSinkBackend(audio.FileSinkBackend):
+    """A file sink whose channels post end events, like pygame's."""
+    def __init__(self, clock):
+        super().__init__(clock=clock)
+        self.end_events = []
+
+    def enable_end_events(self, indices):
+        return True
+
+    def stop(self, index):
+        if self.get_busy(index):
+            self.end_events.append(index)
+        super().stop(index)
+
+    def get_end_events(self):
+        events, self.end_events = self.end_events, []
+        return events
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def make_manager(backend):
+    backend.setup(sr=100, n_reserved=3, n_free=2)
+    manager = ChannelManager(backend, {'speech': 1, 'sfx': 2},
+                             poll_interval=0.001)
+    manager.setup()
+    return manager
+
+
+@pytest.fixture
+def manager(clock):
+    return make_manager(audio.FileSinkBackend(clock=clock))
+
+
+def tone(backend, n=100):
+    return backend.make_sound(np.ones(n))
+
+
+def test_categories(manager):
+    assert manager.categories == {'speech': [0], 'sfx': [1, 2]}
+    assert not manager.use_events
+
+
+def test_free_channels_first(manager):
+    async def main():
+        manager.play(tone(manager.backend))
+        manager.play(tone(manager.backend))
+        return sorted(manager.voices)
+
+    assert run(main()) == [1, 2]
+
+
+def test_steal_lowest_priority_then_oldest(manager):
+    async def main():
+        backend = manager.backend
+        old = manager.play(tone(backend), priority=1)
+        low = manager.play(tone(backend), priority=0)
+        stealer = manager.play(tone(backend), priority=1)
+        # Both remaining voices have priority 1, so the oldest goes.
+        second = manager.play(tone(backend), priority=1)
+        return old, low, stealer, second
+
+    old, low, stealer, second = run(main())
+    assert low.result() is False
+    assert old.result() is False
+    assert [manager.voices[i].future for i in (1, 2)] == [second, stealer]
+
+
+def test_refuse_when_busy_with_higher_priority(manager):
+    async def main():
+        manager.play(tone(manager.backend), category='speech', priority=5)
+        return manager.play(tone(manager.backend), category='speech',
+                            priority=1)
+
+    refused = run(main())
+    assert refused.result() is False
+    assert manager.voices[0].priority == 5
+
+
+def test_poll_resolves_finished(manager, clock):
+    async def main():
+        future = manager.play(tone(manager.backend, 50))
+        manager.poll()
+        assert not future.done()
+        clock.now = 0.6
+        return await asyncio.wait_for(future, 1)
+
+    assert run(main()) is True
+    assert manager.voices == {}
+
+
+def test_cancel_stops_the_sound(manager, clock):
+    async def main():
+        future = manager.play(tone(manager.backend))
+        clock.now = 0.25
+        future.cancel()
+        await asyncio.sleep(0)
+
+    run(main())
+    assert manager.voices == {}
+    assert not manager.backend.get_busy(1)
+    # The recording is cut off where it was cancelled.
+    assert len(manager.backend.playbacks[0].samples) == 25
+
+
+def test_stale_end_events_are_ignored(clock):
+    manager = make_manager(EventSinkBackend(clock))
+    assert manager.use_events
+
+    async def main():
+        backend = manager.backend
+        first = manager.play(tone(backend), category='speech')
+        second = manager.play(tone(backend), category='speech')
+        assert first.result() is False
+
+        # The stolen voice's end event must not finish the new one.
+        assert backend.end_events == [0]
+        manager.poll()
+        assert not second.done()
+
+        backend.end_events.append(0)
+        manager.poll()
+        return second.result()
+
+    assert run(main()) is True
+    assert manager.voices == {}
@@ -0,0 +1,115 @@
+import threading
+import time
+
+from robot.outputs.compositor import Compositor
+
+
+class SlowDisplay:
+    def __init__(self, delay=0.02):
+        self.delay = delay
+        self.calls = []
+        self.thread = None
+        self.device = 'device'
+        self.auto_present = True
+        self.n_presents = 0
+
+    def present(self):
+        self.n_presents += 1
+
+    def draw_bars(self, param1, param2, margin=5):
+        self.thread = threading.current_thread()
+        time.sleep(self.delay)
+        self.calls.append(('bars', param1, param2))
+
+    def draw_text(self, text):
+        self.calls.append(('text', text))
+
+    def clear(self):
+        raise RuntimeError("SPI error")
+
+
+def test_latest_command_per_layer_wins():
+    display = SlowDisplay()
+    compositor = Compositor(display, fps=0)
+    compositor.start()
+    try:
+        start = time.monotonic()
+        for i in range(20):
+            compositor.draw_bars(i / 20, 0.5)
+        assert time.monotonic() - start < display.delay
+        assert compositor.flush(timeout=1)
+    finally:
+        compositor.stop()
+
+    assert display.thread is not threading.current_thread()
+    assert display.calls[-1] == ('bars', 19 / 20, 0.5)
+    assert len(display.calls) < 20
+    assert compositor.n_dropped == 20 - len(display.calls)
+
+
+def test_layers_are_drawn_in_submission_order():
+    display = SlowDisplay(delay=0)
+    compositor = Compositor(display, fps=0)
+    compositor.draw_text("first")
+    compositor.draw_bars(0.1, 0.2)
+    compositor.draw_text("second")
+    compositor.start()
+    compositor.flush(timeout=1)
+    compositor.stop()
+
+    assert display.calls == [('bars', 0.1, 0.2), ('text', 'second')]
+    # Both layers go to the panel in a single transfer.
+    assert display.n_presents == 1
+    assert display.auto_present
+
+
+def test_frame_rate_is_capped():
+    display = SlowDisplay(delay=0)
+    compositor = Compositor(display, fps=20)
+    compositor.start()
+    try:
+        start = time.monotonic()
+        for i in range(3):
+            compositor.draw_text(str(i))
+            compositor.flush(timeout=1)
+            time.sleep(0.001)
+        compositor.draw_text("last")
+        compositor.flush(timeout=1)
+        elapsed = time.monotonic() - start
+    finally:
+        compositor.stop()
+
+    assert elapsed >= 3 / 20 * 0.9
+
+
+def test_errors_do_not_stop_the_thread():
+    display = SlowDisplay(delay=0)
+    compositor = Compositor(display, fps=0)
+    compositor.start()
+    compositor.clear()
+    compositor.draw_text("still drawing")
+    assert compositor.flush(timeout=1)
+    compositor.stop()
+
+    assert display.calls == [('text', 'still drawing')]
+    assert compositor.device == 'device'
+
+
+def test_oled_layers_are_presented_once(monkeypatch):
+    from robot.outputs.display import OLEDDisplay
+    from robot.outputs.virtual_display import VirtualDevice
+
+    oled = OLEDDisplay(echo_result=False)
+    oled.device = VirtualDevice(128, 128, 'RGB')
+    writes = []
+    monkeypatch.setattr(oled, 'write_window',
+                        lambda *args: writes.append(args[:4]))
+    compositor = Compositor(oled, fps=0)
+    compositor.fill_rgb(255, 0, 0)
+    compositor.draw_bars(0.2, 0.8)
+    compositor.start()
+    compositor.flush(timeout=1)
+    compositor.stop()
+
+    assert len(writes) == 1
+    assert oled.auto_present
@@ -0,0 +1,577 @@
+import asyncio
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import robot.outputs.display as display
+from robot.outputs.resource_pack import (PackedFrame, ResourcePack,
+                                         write_resource_pack)
+from robot.outputs.rgb565 import (RGB565Encoder, decode_rgb565,
+                                   encode_rgb565)
+
+
+class FakeDevice:
+    def __init__(self, width=128, height=128, mode='RGB'):
+        self.width = width
+        self.height = height
+        self.size = (width, height)
+        self.mode = mode
+        self.frames = []
+        self.commands = []
+        self.written = []
+
+    def command(self, *args):
+        self.commands.append(args)
+
+    def data(self, data):
+        self.written.append(bytes(data))
+
+    def display(self, image):
+        self.frames.append(image)
+
+    def clear(self):
+        self.frames.append(None)
+
+
+@pytest.fixture
+def image_path(tmp_path):
+    path = tmp_path / "heart.png"
+    Image.new("RGB", (64, 32), "red").save(path)
+    return path
+
+
+@pytest.fixture
+def oled():
+    d = display.OLEDDisplay(echo_result=False, max_cached_frames=2)
+    d.device = FakeDevice()
+    return d
+
+
+class TestFrameCache:
+    def test_hit_reuses_frame(self, oled, image_path):
+        oled.draw_image(image_path)
+        frame = oled.frame_cache.get(image_path, (128, 128), 'RGB')
+        oled.draw_image(image_path)
+
+        assert len(oled.frame_cache) == 1
+        assert oled.frame_cache.get(image_path, (128, 128), 'RGB') is frame
+        assert frame.size == (128, 128)
+        assert tuple(oled.frame[8, 64]) == (255, 0, 0)
+
+    def test_key_includes_angle(self, oled, image_path):
+        oled.draw_image(image_path)
+        oled.draw_image(image_path, angle=90)
+        assert len(oled.frame_cache) == 2
+
+    def test_reloads_modified_file(self, oled, image_path):
+        oled.draw_image(image_path)
+        Image.new("RGB", (64, 32), "blue").save(image_path)
+        stat = image_path.stat()
+        os.utime(image_path, (stat.st_atime, stat.st_mtime + 1))
+        oled.draw_image(image_path)
+
+        assert tuple(oled.frame[8, 64]) == (0, 0, 255)
+
+    def test_bounded(self, oled, tmp_path):
+        for i in range(3):
+            path = tmp_path / f"{i}.png"
+            Image.new("RGB", (8, 8)).save(path)
+            oled.draw_image(path)
+        assert len(oled.frame_cache) == 2
+
+    def test_missing_file(self, oled, tmp_path):
+        with pytest.raises(FileNotFoundError):
+            oled.draw_image(tmp_path / "missing.png")
+
+
+def test_rgb565_round_trip():
+    rgb = np.array([[[255, 0, 0], [0, 255, 0]],
+                    [[0, 0, 255], [255, 255, 255]]], dtype=np.uint8)
+    encoded = encode_rgb565(rgb)
+
+    assert encoded.shape == (2, 2, 2)
+    assert list(encoded[0, 0]) == [0xF8, 0x00]
+    assert list(encoded[1, 1]) == [0xFF, 0xFF]
+    np.testing.assert_array_equal(decode_rgb565(encoded.tobytes(), 2, 2),
+                                  rgb & [0xF8, 0xFC, 0xF8])
+
+
+class TestDirtyRects:
+    def test_only_changed_rows_are_sent(self, oled):
+        oled.draw_bars(0.4, 0.8)
+        oled.device.commands.clear()
+        oled.device.written.clear()
+
+        oled.draw_bars(0.45, 0.8)
+        columns, rows, write = oled.device.commands
+        assert columns[0] == 0x15 and columns[2] < 64
+        assert rows[0] == 0x75 and rows[2] - rows[1] < 10
+        assert len(oled.device.written[0]) < 128 * 10 * 2
+
+    def test_unchanged_frame_sends_nothing(self, oled):
+        oled.fill_rgb(0, 255, 0)
+        oled.device.commands.clear()
+        oled.fill_rgb(0, 255, 0)
+        assert oled.device.commands == []
+
+    def test_written_pixels_match_back_buffer(self, oled, image_path):
+        oled.draw_image(image_path)
+        (_, left, right), (_, top, bottom), _ = oled.device.commands[-3:]
+        window = oled.frame[top:bottom + 1, left:right + 1]
+        assert oled.device.written[-1] == encode_rgb565(window).tobytes()
+
+    def test_non_native_device_gets_whole_frame(self, image_path):
+        oled = display.OLEDDisplay(echo_result=False, display='ssd1306')
+        oled.device = FakeDevice(mode='1')
+        oled.draw_image(image_path)
+
+        assert oled.device.commands == []
+        assert oled.device.frames[-1].mode == '1'
+
+
+class TestRGB565Encoder:
+    def test_matches_reference(self):
+        rgb = np.random.RandomState(0).randint(0, 256, (16, 8, 3)).astype(
+            np.uint8)
+        encoder = RGB565Encoder()
+        assert bytes(encoder.encode(rgb)) == encode_rgb565(rgb).tobytes()
+        window = rgb[2:5, 1:7]
+        assert bytes(encoder.encode(window)) == encode_rgb565(window).tobytes()
+
+    def test_reuses_buffers(self):
+        encoder = RGB565Encoder()
+        first = encoder.encode(np.zeros((4, 4, 3), dtype=np.uint8))
+        encoder.encode(np.full((4, 4, 3), 255, dtype=np.uint8))
+        assert bytes(first) == b"\xff" * 32
+
+    def test_cache(self):
+        encoder = RGB565Encoder(max_cached=1)
+        black = np.zeros((4, 4, 3), dtype=np.uint8)
+        white = np.full((4, 4, 3), 255, dtype=np.uint8)
+        cached = encoder.encode(black, key='black')
+        encoder.encode(white)
+        assert encoder.encode(white, key='black') is cached
+        assert bytes(cached) == bytes(32)
+
+        encoder.encode(white, key='white')
+        assert bytes(encoder.encode(white, key='black')) == b"\xff" * 32
+
+    def test_display_caches_image_encodings(self, oled, image_path):
+        oled.draw_image(image_path)
+        oled.fill_rgb(0, 0, 0)
+        oled.draw_image(image_path)
+        assert len(oled.encoder._cache) == 1
+        assert oled.device.written[0] == oled.device.written[2]
+
+
+class TestResourcePack:
+    @pytest.fixture
+    def pack_path(self, tmp_path, image_path):
+        frame = np.asarray(display.render_image(image_path, (128, 128), 'RGB'))
+        return write_resource_pack(
+            tmp_path / "display.pack",
+            [PackedFrame(str(image_path.resolve()), 0,
+                         image_path.stat().st_mtime, encode_rgb565(frame))],
+            (128, 128))
+
+    def test_get(self, pack_path, image_path):
+        pack = ResourcePack(pack_path)
+        assert len(pack) == 1
+        assert pack.get(image_path, angle=90) is None
+
+        data = pack.get(image_path)
+        assert len(data) == 128 * 128 * 2
+        rgb = decode_rgb565(data, 128, 128)
+        assert tuple(rgb[8, 64]) == (248, 0, 0)
+        del data, rgb
+        pack.close()
+
+    def test_stale_frame_is_skipped(self, pack_path, image_path):
+        stat = image_path.stat()
+        os.utime(image_path, (stat.st_atime, stat.st_mtime + 1))
+        assert ResourcePack(pack_path).get(image_path) is None
+
+    def test_native_blit(self, oled, pack_path, image_path):
+        oled.load_pack(pack_path)
+        oled.draw_image(image_path)
+
+        assert oled.device.frames == []
+        assert oled.device.commands == [(0x15, 0, 127), (0x75, 0, 127),
+                                        (0x5C,)]
+        assert oled.device.written[0] == bytes(oled.pack.get(image_path))
+        assert len(oled.frame_cache) == 0
+
+    def test_native_blit_sends_mapped_bytes(self, oled, pack_path,
+                                            image_path):
+        oled.load_pack(pack_path)
+        sent = []
+        oled.device.data = sent.append
+        oled.encoder.encode = None  # Packed frames must not be re-encoded.
+        oled.draw_image(image_path)
+
+        assert len(sent) == 1
+        assert isinstance(sent[0], memoryview)
+        assert sent[0].obj is oled.pack.get(image_path).obj
+        # The back buffer still matches the panel.
+        assert tuple(oled.frame[8, 64]) == (248, 0, 0)
+
+    def test_native_blit_then_partial_draw(self, oled, pack_path, image_path):
+        oled.load_pack(pack_path)
+        oled.auto_present = False
+        oled.draw_image(image_path)
+        frame = oled.frame.copy()
+        frame[:4, :4] = 0
+        oled.draw_frame(frame)
+        oled.present()
+
+        # The whole packed frame, then just the changed corner.
+        assert [c for c in oled.device.commands if c[0] == 0x15] == [
+            (0x15, 0, 127), (0x15, 0, 3)]
+        assert len(oled.device.written[1]) == 4 * 4 * 2
+
+    def test_animation_uses_packed_frames(self, oled, pack_path, image_path):
+        oled.load_pack(pack_path)
+        animation = oled.load_animation([image_path])
+
+        assert animation.rgb565
+        assert animation.frames[0].obj is oled.pack.get(image_path).obj
+        assert len(oled.frame_cache) == 0
+
+    def test_wrong_size_is_ignored(self, pack_path):
+        oled = display.OLEDDisplay(echo_result=False)
+        oled.device = FakeDevice(width=96, height=64)
+        oled.load_pack(pack_path)
+        assert oled.pack is None
+
+
+class TestDrawText:
+    @pytest.fixture
+    def text_oled(self):
+        d = display.OLEDDisplay(echo_result=False)
+        d.device = FakeDevice()
+        d.char_width = 21
+        return d
+
+    def test_draws_text(self, text_oled):
+        text_oled.draw_text("hello\nworld")
+        frame = text_oled.frame
+
+        assert frame.shape == (128, 128, 3)
+        assert frame[:12].any() and frame[12:24].any()
+        assert not frame[24:].any()
+
+    def test_incremental_matches_fresh(self, text_oled):
+        fresh = display.OLEDDisplay(echo_result=False)
+        fresh.device = FakeDevice()
+        fresh.char_width = 21
+
+        for text in ["ADC:\n0.1 0.2\nLED:\nTrue", "ADC:\n0.1 0.9\nLED:",
+                     "a much longer line that wraps around", "ADC:"]:
+            text_oled.draw_text(text)
+            fresh._text_frame = None
+            np.testing.assert_array_equal(text_oled.render_text(text),
+                                          fresh.render_text(text))
+
+    def test_layout_is_cached(self, text_oled):
+        display.layout_text.cache_clear()
+        text_oled.draw_text("same text")
+        text_oled.draw_text("same text")
+        assert display.layout_text.cache_info().hits == 1
+
+
+class TestStarfield:
+    def test_stars_persist_and_respawn(self):
+        stars = display.Starfield((128, 128), n_stars=64, seed=0)
+        z = stars.z.copy()
+        stars.step()
+        np.testing.assert_allclose(stars.z, np.where(z - 0.19 <= 0, 32,
+                                                     z - 0.19))
+
+        for _ in range(200):
+            stars.step()
+        assert np.all(stars.z > 0)
+
+    def test_render(self):
+        stars = display.Starfield((128, 128), n_stars=4, seed=0)
+        stars.xy[:] = [[0, 0], [5, 5], [-2, 1], [1000, 1000]]
+        stars.z[:] = [32, 16, 8, 8]
+        frame = stars.render()[..., 0]
+
+        # A distant star is a single dim pixel at the origin.
+        assert frame[64, 64] == 100
+        assert frame[63:66, 63:66].sum() == 100
+        # Nearer stars are brighter, larger squares.
+        assert (frame[104:107, 104:107] == 177).all()
+        assert (frame[80:84, 32:36] == 216).all()
+        assert np.count_nonzero(frame) == 1 + 9 + 16
+
+    def test_mono_stars_are_white(self):
+        stars = display.Starfield((32, 32), n_stars=16, mono=True, seed=0)
+        frame = stars.render()
+        assert set(np.unique(frame)) <= {0, 255}
+
+    def test_move_and_draw_strs_animates(self, oled):
+        oled.move_and_draw_strs()
+        first = oled.frame.copy()
+        oled.move_and_draw_strs()
+        assert first.any()
+        assert (oled.frame != first).any()
+
+
+class TestAnimation:
+    @pytest.fixture
+    def frame_paths(self, tmp_path):
+        paths = []
+        for i, colour in enumerate(["red", "green", "blue"], start=1):
+            # Numbered so that a plain sort would put 10 before 2.
+            path = tmp_path / f"frame-{i * 5}.png"
+            Image.new("RGB", (16, 16), colour).save(path)
+            paths.append(path)
+        return paths
+
+    def test_load_numbered_frames(self, frame_paths, tmp_path):
+        animation = display.load_animation(str(tmp_path / "frame-*.png"),
+                                           size=(32, 32), fps=4)
+        assert len(animation) == 3
+        assert animation.durations == [0.25] * 3
+        assert animation.frames[0].shape == (32, 32, 3)
+        assert [tuple(f[8, 16]) for f in animation.frames] == [
+            (255, 0, 0), (0, 128, 0), (0, 0, 255)]
+
+    def test_load_gif(self, tmp_path):
+        path = tmp_path / "anim.gif"
+        frames = [Image.new("RGB", (16, 16), c) for c in ["red", "blue"]]
+        frames[0].save(path, save_all=True, append_images=frames[1:],
+                       duration=[40, 80])
+        animation = display.load_animation(path, size=(16, 16))
+
+        assert len(animation) == 2
+        assert animation.durations == pytest.approx([0.04, 0.08])
+
+    def test_indices(self, frame_paths):
+        animation = display.load_animation(frame_paths + frame_paths[:1])
+        assert list(animation.indices()) == [0, 1, 2, 3]
+        assert list(animation.indices(pingpong=True)) == [0, 1, 2, 3, 2, 1]
+        looped = animation.indices(loop=True)
+        assert [next(looped) for _ in range(6)] == [0, 1, 2, 3, 0, 1]
+
+    def test_play(self, frame_paths):
+        class Recorder:
+            def __init__(self):
+                self.frames = []
+
+            async def adraw_frame(self, frame):
+                self.frames.append(frame)
+
+        recorder = Recorder()
+        animation = display.load_animation(frame_paths, size=(8, 8))
+        loop = asyncio.new_event_loop()
+        try:
+            start = loop.time()
+            skipped = loop.run_until_complete(display.play_animation(
+                recorder, animation, pingpong=True, fps=50))
+            elapsed = loop.time() - start
+        finally:
+            loop.close()
+
+        assert skipped == 0
+        assert [f is animation.frames[i] for f, i in
+                zip(recorder.frames, [0, 1, 2, 1])] == [True] * 4
+        assert elapsed == pytest.approx(4 / 50, abs=0.015)
+
+    def test_load_for_display(self, oled, frame_paths):
+        animation = oled.load_animation(frame_paths, fps=2)
+
+        assert animation.rgb565
+        assert animation.durations == [0.5] * 3
+        assert [len(f) for f in animation.frames] == [128 * 128 * 2] * 3
+        assert len(oled.encoder._cache) == 3
+        # Loading again reuses the encodings.
+        again = oled.load_animation(frame_paths, fps=2)
+        assert [a is b for a, b in zip(animation.frames, again.frames)] == [
+            True] * 3
+
+        oled.draw_rgb565(animation.frames[2])
+        assert oled.device.written == [bytes(animation.frames[2])]
+        assert tuple(oled.frame[8, 64]) == (0, 0, 248)
+
+    def test_play_rgb565(self, oled, frame_paths):
+        async def main():
+            animation = await oled.aload_animation(frame_paths)
+            return await display.play_animation(oled, animation, fps=50)
+
+        loop = asyncio.new_event_loop()
+        try:
+            skipped = loop.run_until_complete(main())
+        finally:
+            loop.close()
+
+        assert skipped == 0
+        assert len(oled.device.written) == 3
+        assert tuple(oled.frame[8, 64]) == (0, 0, 248)
+
+    def test_play_skips_late_frames(self, frame_paths):
+        class SlowDisplay:
+            def __init__(self):
+                self.n_frames = 0
+
+            async def adraw_frame(self, frame):
+                self.n_frames += 1
+                time.sleep(0.05)
+
+        slow = SlowDisplay()
+        animation = display.load_animation(frame_paths, size=(8, 8))
+        loop = asyncio.new_event_loop()
+        try:
+            skipped = loop.run_until_complete(display.play_animation(
+                slow, animation, fps=50))
+        finally:
+            loop.close()
+
+        # The first frame overruns the second's slot, which is skipped;
+        # the third is still due so it is drawn.
+        assert skipped == 1
+        assert slow.n_frames == 2
+
+
+class TestMarquee:
+    def test_vertical_strip(self):
+        marquee = display.Marquee("a long message " * 4, size=(64, 32))
+        lines = display.layout_text("a long message " * 4, 64 // 6)
+        assert len(marquee) == len(lines) * 12 + 32
+        # It scrolls in from a blank screen.
+        assert not marquee.window(0).any()
+        assert marquee.window(32).any()
+        assert marquee.window(5).shape == (32, 64, 3)
+        assert marquee.window(len(marquee) - 1).shape == (32, 64, 3)
+
+    def test_window_is_a_view(self):
+        marquee = display.Marquee("hello world", size=(64, 32),
+                                  vertical=False)
+        window = marquee.window(70)
+        assert window.shape == (32, 64, 3)
+        assert window.base is marquee.strip
+        assert np.array_equal(marquee.window(70 + len(marquee)), window)
+
+    def test_play(self):
+        class Recorder:
+            def __init__(self):
+                self.offsets = []
+
+            async def adraw_frame(self, frame):
+                self.offsets.append(frame.__array_interface__['data'][0])
+
+        recorder = Recorder()
+        marquee = display.Marquee("hi", size=(16, 16), vertical=False)
+        loop = asyncio.new_event_loop()
+        try:
+            start = loop.time()
+            loop.run_until_complete(display.play_marquee(
+                recorder, marquee, speed=len(marquee) / 0.1, fps=50))
+            elapsed = loop.time() - start
+        finally:
+            loop.close()
+
+        assert elapsed == pytest.approx(0.1, abs=0.03)
+        assert 3 <= len(recorder.offsets) <= 8
+        # Each frame is further along the strip, then it ends where it
+        # started.
+        assert recorder.offsets[:-1] == sorted(recorder.offsets[:-1])
+        assert recorder.offsets[-1] == recorder.offsets[0]
+
+
+class TestAsyncDraw:
+    def test_draws_on_display_thread(self, oled):
+        import threading
+        threads = []
+        draw_text = oled.draw_text
+
+        def record(text):
+            threads.append(threading.current_thread())
+            draw_text(text)
+
+        oled.draw_text = record
+        loop = asyncio.new_event_loop()
+        try:
+            drawn = loop.run_until_complete(oled.adraw_text("async"))
+        finally:
+            loop.close()
+
+        assert drawn is True
+        assert threads[0] is not threading.current_thread()
+        assert oled.frame.any()
+
+    def test_stale_frames_are_dropped(self, oled):
+        bars = []
+        draw_bars = oled.draw_bars
+
+        def slow_bars(param1, param2, margin):
+            time.sleep(0.02)
+            bars.append(param1)
+            draw_bars(param1, param2, margin)
+
+        oled.draw_bars = slow_bars
+
+        async def knob_turns():
+            # The first call starts straight away; later ones queue behind
+            # it, each replacing the last.
+            return await asyncio.gather(
+                *[oled.adraw_bars(i / 10, 0.5) for i in range(5)])
+
+        loop = asyncio.new_event_loop()
+        try:
+            results = loop.run_until_complete(knob_turns())
+        finally:
+            loop.close()
+
+        assert results[-1] is True
+        assert bars[-1] == 0.4
+        assert len(bars) < 5
+        assert results.count(False) == oled.n_dropped == 5 - len(bars)
+
+    def test_mixed_layers_run_in_order(self, oled):
+        started = threading.Event()
+        release = threading.Event()
+
+        def busy():
+            started.set()
+            release.wait(1)
+
+        async def draws():
+            blocker = asyncio.ensure_future(oled._adraw('busy', busy))
+            while not started.is_set():
+                await asyncio.sleep(0.001)
+            # Queued while the display thread is busy: the blue fill
+            # replaces the red one, after the text.
+            pending = [asyncio.ensure_future(call) for call in [
+                oled.afill_rgb(255, 0, 0), oled.adraw_text("hello"),
+                oled.afill_rgb(0, 0, 255)]]
+            await asyncio.sleep(0.01)
+            release.set()
+            await blocker
+            return await asyncio.gather(*pending)
+
+        loop = asyncio.new_event_loop()
+        try:
+            results = loop.run_until_complete(draws())
+        finally:
+            loop.close()
+
+        assert results == [False, True, True]
+        assert (oled.frame == [0, 0, 255]).all()
+
+    def test_errors_are_raised_to_the_caller(self, oled):
+        def broken():
+            raise RuntimeError("SPI error")
+
+        oled.clear = broken
+        loop = asyncio.new_event_loop()
+        try:
+            with pytest.raises(RuntimeError):
+                loop.run_until_complete(oled.aclear())
+        finally:
+            loop.close()
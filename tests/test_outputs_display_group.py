@@ -0,0 +1,101 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import robot.outputs.display as display
+
+
+def virtual_oled(width=128, height=128, mode='RGB'):
+    oled = display.OLEDDisplay(echo_result=False, virtual=True, width=width,
+                               height=height, mode=mode)
+    oled.setup()
+    return oled
+
+
+def test_mirror_renders_once():
+    group = display.DisplayGroup([virtual_oled(), virtual_oled()])
+    renders = []
+    render_text = group[0].render_text
+    group[1].render_text = lambda text: renders.append(text)
+    group[0].render_text = lambda text: (renders.append(text),
+                                         render_text(text))[1]
+
+    group.draw_text("mirrored")
+    assert renders == ["mirrored"]
+    np.testing.assert_array_equal(group[0].device.frame,
+                                  group[1].device.frame)
+    assert group[1].device.frame.any()
+
+
+def test_mirror_different_sizes_render_separately():
+    group = display.DisplayGroup([virtual_oled(), virtual_oled(96, 64)])
+    group.fill_rgb(0, 0, 255)
+    assert group[1].device.frame.shape == (64, 96, 3)
+    assert (group[1].device.frame[..., 2] == 248).all()
+
+
+def test_mirror_different_modes_render_separately():
+    group = display.DisplayGroup([virtual_oled(), virtual_oled(mode='1')])
+    assert not group._same_format(group[1])
+
+    renders = []
+    render_text = group[1].render_text
+    group[1].render_text = lambda text: (renders.append(text),
+                                         render_text(text))[1]
+    group.draw_text("mono")
+    assert renders == ["mono"]
+    assert group[1].device.image().mode == '1'
+
+
+def test_split_draws_to_first_display():
+    group = display.DisplayGroup([virtual_oled(), virtual_oled()],
+                                 mirror=False)
+    group.fill_rgb(255, 0, 0)
+    group[1].draw_text("own content")
+
+    assert (group[0].device.frame == [248, 0, 0]).all()
+    assert group[1].device.frame.any()
+    assert not (group[1].device.frame == [248, 0, 0]).all(axis=2).any()
+
+
+def test_transfers_run_concurrently():
+    group = display.DisplayGroup([virtual_oled() for _ in range(3)])
+    threads = set()
+    for d in group.displays:
+        present = d.present
+
+        def slow_present(present=present):
+            threads.add(threading.current_thread())
+            time.sleep(0.05)
+            present()
+
+        d.present = slow_present
+
+    start = time.monotonic()
+    group.fill_rgb(0, 255, 0)
+    elapsed = time.monotonic() - start
+
+    assert len(threads) == 3
+    assert elapsed < 0.05 * 2
+    for d in group.displays:
+        assert (d.device.frame[..., 1] == 252).all()
+
+
+def test_empty_group():
+    with pytest.raises(ValueError):
+        display.DisplayGroup([])
+
+
+def test_deferred_present():
+    group = display.DisplayGroup([virtual_oled(), virtual_oled()])
+    group.auto_present = False
+    group.fill_rgb(255, 0, 0)
+    group.draw_bars(0.2, 0.8)
+    assert [d.device.n_frames for d in group] == [0, 0]
+
+    group.present()
+    assert [d.device.n_frames for d in group] == [1, 1]
+    np.testing.assert_array_equal(group[0].device.frame,
+                                  group[1].device.frame)
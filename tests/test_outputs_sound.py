@@ -0,0 +1,303 @@
+import asyncio
+import os
+
+import numpy as np
+import pytest
+
+import robot.outputs.audio as audio
+import robot.outputs.sound as robot_sound
+from conftest import FakeClock, run
+
+
+@pytest.fixture
+def counting_cache():
+    loads = []
+
+    def loader(path):
+        loads.append(path.name)
+        return path.read_bytes()
+
+    return robot_sound.SoundCache(loader, max_size=2), loads
+
+
+class TestSoundCache:
+    def test_cache_hit(self, tmp_path, counting_cache):
+        cache, loads = counting_cache
+        path = tmp_path / "a.wav"
+        path.write_bytes(b"a")
+
+        assert cache.get(path) == b"a"
+        assert cache.get(path) == b"a"
+        assert loads == ["a.wav"]
+
+    def test_reload_on_mtime_change(self, tmp_path, counting_cache):
+        cache, loads = counting_cache
+        path = tmp_path / "a.wav"
+        path.write_bytes(b"a")
+        cache.get(path)
+
+        path.write_bytes(b"b")
+        stat = path.stat()
+        os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+
+        assert cache.get(path) == b"b"
+        assert loads == ["a.wav", "a.wav"]
+
+    def test_bounded_lru(self, tmp_path, counting_cache):
+        cache, loads = counting_cache
+        paths = []
+        for name in "abc":
+            path = tmp_path / f"{name}.wav"
+            path.write_bytes(name.encode())
+            paths.append(path)
+
+        cache.get(paths[0])
+        cache.get(paths[1])
+        cache.get(paths[0])
+        cache.get(paths[2])
+
+        assert len(cache) == 2
+        cache.get(paths[0])
+        cache.get(paths[1])
+        assert loads == ["a.wav", "b.wav", "c.wav", "b.wav"]
+
+    def test_missing_file(self, tmp_path, counting_cache):
+        cache, loads = counting_cache
+        with pytest.raises(FileNotFoundError):
+            cache.get(tmp_path / "missing.wav")
+
+
+def test_render_tone():
+    tone = robot_sound.render_tone(441, 0.5, 44100, amplitude=1000)
+    assert tone.dtype == np.int16
+    assert len(tone) == 22050
+    assert np.abs(tone).max() <= 1000
+    assert tone[0] == 0
+
+
+class TestMixSegments:
+    def test_sequential(self):
+        a = np.ones(10, dtype=np.int16)
+        b = np.full(5, 2, dtype=np.int16)
+        mixed = robot_sound.mix_segments([(None, a), (None, b)], sr=10)
+
+        assert len(mixed) == 15
+        assert np.all(mixed[:10] == 1)
+        assert np.all(mixed[10:] == 2)
+
+    def test_overlap_is_summed_and_clipped(self):
+        a = np.full(10, 30000, dtype=np.int16)
+        b = np.full(10, 10000, dtype=np.int16)
+        mixed = robot_sound.mix_segments([(None, a), (0.5, b)], sr=10)
+
+        assert len(mixed) == 15
+        assert np.all(mixed[:5] == 30000)
+        assert np.all(mixed[5:10] == 32767)
+        assert np.all(mixed[10:] == 10000)
+
+    def test_cursor_follows_placed_segment(self):
+        a = np.ones(10, dtype=np.int16)
+        mixed = robot_sound.mix_segments(
+            [(None, a), (0.0, a[:2]), (None, a[:2] * 3)], sr=10)
+
+        assert len(mixed) == 10
+        assert np.all(mixed[:2] == 2)
+        assert np.all(mixed[2:4] == 4)
+
+    def test_empty(self):
+        assert len(robot_sound.mix_segments([], sr=10)) == 0
+
+
+class TestFileSinkBackend:
+    @pytest.fixture
+    def sink(self):
+        clock = FakeClock()
+        backend = audio.FileSinkBackend(clock=clock)
+        backend.setup(sr=100, n_reserved=2, n_free=2)
+        return backend, clock
+
+    def test_busy_follows_clock(self, sink):
+        backend, clock = sink
+        backend.play(0, backend.make_sound(np.ones(50)))
+
+        assert backend.get_busy(0)
+        clock.now = 0.6
+        assert not backend.get_busy(0)
+
+    def test_queue_starts_when_previous_ends(self, sink):
+        backend, clock = sink
+        backend.play(0, backend.make_sound(np.ones(50)))
+        backend.queue(0, backend.make_sound(np.full(50, 2)))
+        assert backend.get_queue(0) is not None
+
+        clock.now = 0.7
+        assert backend.get_queue(0) is None
+        assert backend.get_busy(0)
+        assert [p.time for p in backend.playbacks] == [0.0, 0.5]
+
+    def test_stop_truncates_recording(self, sink):
+        backend, clock = sink
+        backend.play(0, backend.make_sound(np.ones(100)))
+        clock.now = 0.25
+        backend.stop(0)
+
+        assert not backend.get_busy(0)
+        assert len(backend.render()) == 25
+
+    def test_write(self, sink, tmp_path):
+        backend, clock = sink
+        backend.play_free(backend.make_sound(np.ones(10)))
+        clock.now = 0.5
+        backend.play(1, backend.make_sound(np.full(10, 3)))
+
+        path = backend.write(tmp_path / "out.wav")
+        samples, sr = audio.read_wav(path)
+        assert sr == 100
+        assert samples.shape == (60, 1)
+        assert samples[0, 0] == 1
+        assert samples[-1, 0] == 3
+
+
+def test_resample():
+    samples = np.arange(100, dtype=np.int16)
+    resampled = audio.resample(samples, 100, 50)
+    assert len(resampled) == 50
+    assert resampled.dtype == np.int16
+    assert resampled[10] == 20
+
+
+def test_headless_sound_resource():
+    sound = robot_sound.SoundResource(backend='file')
+    sound.setup()
+
+    loop = asyncio.new_event_loop()
+    try:
+        completed = loop.run_until_complete(sound.aplay_sequence(
+            [robot_sound.Tone(440, 0.05), robot_sound.Silence(0.05),
+             robot_sound.Tone(880, 0.05)]))
+    finally:
+        loop.close()
+
+    assert completed
+    playbacks = sound.backend.playbacks
+    assert len(playbacks) == 1
+    assert len(playbacks[0].samples) == 3 * int(round(0.05 * sound.sr))
+
+
+class FakeFlite:
+    """Stands in for `aspeech_to_wav`, recording how many phrases are
+    being synthesized at once."""
+    def __init__(self, fail=(), slow=()):
+        self.fail = set(fail)
+        self.slow = set(slow)
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+
+    async def __call__(self, text, output_file):
+        self.calls.append(text)
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(0.1 if text in self.slow else 0.01)
+            if text in self.fail:
+                self.fail.discard(text)
+                return False
+            audio.write_wav(output_file, np.ones(100, dtype=np.int16), 16000)
+            return True
+        finally:
+            self.active -= 1
+
+
+class TestSpeechSynthesis:
+    @pytest.fixture
+    def sound(self):
+        sound = robot_sound.SoundResource(backend='file', max_synth_jobs=2)
+        sound.setup()
+        return sound
+
+    def test_concurrency_is_bounded(self, sound, monkeypatch):
+        flite = FakeFlite()
+        monkeypatch.setattr(robot_sound, 'aspeech_to_wav', flite)
+        texts = [f"phrase {i}" for i in range(5)]
+
+        async def main():
+            await asyncio.gather(*sound.prefetch_speech(*texts))
+
+        run(main())
+        assert flite.max_active == 2
+        assert sorted(flite.calls) == texts
+        assert all(sound.speech_map[t].exists() for t in texts)
+
+    def test_prefetch_is_shared(self, sound, monkeypatch):
+        flite = FakeFlite()
+        monkeypatch.setattr(robot_sound, 'aspeech_to_wav', flite)
+
+        async def main():
+            first, = sound.prefetch_speech("hello")
+            second, = sound.prefetch_speech("hello")
+            assert first is second
+            await first
+
+        run(main())
+        assert flite.calls == ["hello"]
+
+    def test_failed_synthesis_is_retried(self, sound, monkeypatch):
+        flite = FakeFlite(fail=["oops"])
+        monkeypatch.setattr(robot_sound, 'aspeech_to_wav', flite)
+
+        async def main():
+            await sound.prefetch_speech("oops")[0]
+            assert "oops" not in sound.speech_tasks
+            assert "oops" not in sound.speech_map
+            await sound.prefetch_speech("oops")[0]
+
+        run(main())
+        assert flite.calls == ["oops", "oops"]
+        assert sound.speech_map["oops"].exists()
+
+    def test_sequence_prefetches_every_phrase(self, sound, monkeypatch):
+        flite = FakeFlite()
+        monkeypatch.setattr(robot_sound, 'aspeech_to_wav', flite)
+        events = [robot_sound.Speech("one"), robot_sound.Silence(0.01),
+                  robot_sound.Speech("two")]
+
+        run(sound.arender_sequence(events))
+        # The second phrase is synthesized alongside the first rather
+        # than after it.
+        assert flite.calls == ["one", "two"]
+        assert flite.max_active == 2
+
+    def test_failed_speech_is_not_cached(self, sound, monkeypatch):
+        flite = FakeFlite(fail=["oops"])
+        monkeypatch.setattr(robot_sound, 'aspeech_to_wav', flite)
+        events = [robot_sound.Speech("oops")]
+
+        async def main():
+            silent, _ = await sound.arender_sequence(events)
+            spoken, _ = await sound.arender_sequence(events)
+            return silent, spoken
+
+        silent, spoken = run(main())
+        assert flite.calls == ["oops", "oops"]
+        assert len(sound.backend.to_array(silent)) == 0
+        assert len(sound.backend.to_array(spoken)) > 0
+        assert tuple(events) in sound.sequence_cache
+
+    def test_speech_sequence_starts_with_the_first_phrase(self, sound,
+                                                          monkeypatch):
+        flite = FakeFlite(slow=["two"])
+        monkeypatch.setattr(robot_sound, 'aspeech_to_wav', flite)
+        played = []
+
+        async def aplay_file(path, category='sfx', priority=0):
+            played.append((path, "two" in sound.speech_map))
+            return True
+
+        monkeypatch.setattr(sound, 'aplay_file', aplay_file)
+        assert run(sound.aplay_speech_sequence(["one", "two"],
+                                                    pause=0.01))
+        # "one" plays while "two" is still being synthesized.
+        assert played == [(sound.speech_map["one"], False),
+                          (sound.speech_map["two"], True)]
+        assert flite.max_active == 2
@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+import robot.outputs.synth as synth
+
+
+@pytest.mark.parametrize('waveform', list(synth.Waveform))
+def test_oscillate_range(waveform):
+    phase = np.linspace(0, 4, 1000)
+    values = synth.oscillate(waveform, phase)
+    assert values.shape == phase.shape
+    assert np.all(values >= -1.0)
+    assert np.all(values <= 1.0)
+
+
+class TestADSR:
+    def test_idle_is_silent(self):
+        env = synth.ADSR()
+        assert np.all(env.render(128, 1000) == 0)
+        assert not env.active
+
+    def test_attack_decay_sustain(self):
+        env = synth.ADSR(attack=0.01, decay=0.01, sustain=0.5, release=0.01)
+        env.note_on()
+        levels = env.render(100, 1000)
+
+        assert levels[9] == pytest.approx(1.0)
+        assert np.all(np.diff(levels[:10]) > 0)
+        assert np.all(levels[20:] == pytest.approx(0.5))
+        assert env.stage == synth.ADSR.SUSTAIN
+
+    def test_release(self):
+        env = synth.ADSR(attack=0.0, decay=0.0, sustain=0.8, release=0.05)
+        env.note_on()
+        env.render(10, 1000)
+        env.note_off()
+        levels = env.render(100, 1000)
+
+        assert np.all(np.diff(levels[:50]) <= 0)
+        assert np.all(levels[50:] == 0)
+        assert not env.active
+
+
+def test_knob_mapping():
+    freq = synth.KnobMapping(pin=2, param='freq', low=100, high=400, log=True)
+    assert freq.scale(0) == pytest.approx(100)
+    assert freq.scale(1023) == pytest.approx(400)
+    assert freq.scale(511.5) == pytest.approx(200)
+
+    volume = synth.KnobMapping(pin=3, param='volume', low=0, high=1)
+    assert volume.scale(2048) == pytest.approx(1)
+
+
+class TestStreamingSynth:
+    def test_render_block(self):
+        s = synth.StreamingSynth(sr=1000, block_size=100, volume=1.0,
+                                 amplitude=1000)
+        s.note_on()
+        block = s.render_block()
+
+        assert block.dtype == np.int16
+        assert len(block) == 100
+        assert np.abs(block).max() <= 1000
+
+    def test_silent_without_note(self):
+        s = synth.StreamingSynth(sr=1000, block_size=100)
+        assert np.all(s.render_block() == 0)
+
+    def test_phase_is_continuous(self):
+        s = synth.StreamingSynth(sr=1000, block_size=100, freq=30,
+                                 envelope=synth.ADSR(0, 0, 1.0, 0))
+        s.note_on()
+        first = s.render_block().copy()
+        second = s.render_block().copy()
+        joined = np.concatenate([first, second]).astype(float)
+
+        assert np.abs(np.diff(joined)).max() < 2 * np.abs(np.diff(first)).max()
+
+    def test_unknown_param(self):
+        s = synth.StreamingSynth()
+        with pytest.raises(KeyError):
+            s.set_param('cutoff', 100)
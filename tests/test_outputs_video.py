@@ -0,0 +1,192 @@
+import asyncio
+import time
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import robot.outputs.video as video
+
+
+@pytest.fixture
+def frame_dir(tmp_path):
+    # Numbered so that a plain sort would put 10 before 2.
+    for i, colour in enumerate(["red", "green", "blue", "white"], start=1):
+        Image.new("RGB", (64, 48), colour).save(tmp_path / f"{i * 5}.png")
+    return tmp_path
+
+
+class Recorder:
+    def __init__(self, delay=0.0):
+        self.frames = []
+        self.delay = delay
+
+    async def adraw_frame(self, frame):
+        self.frames.append(frame)
+        time.sleep(self.delay)
+
+
+def play(display, *args, **kwargs):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(
+            video.play_video(display, *args, **kwargs))
+    finally:
+        loop.close()
+
+
+def test_read_directory(frame_dir):
+    frames = video.read_frames(frame_dir, fps=20)
+    assert not isinstance(frames, list)
+    frames = list(frames)
+    assert [tuple(load()[0, 0]) for load, _ in frames] == [
+        (255, 0, 0), (0, 128, 0), (0, 0, 255), (255, 255, 255)]
+    assert [d for _, d in frames] == [0.05] * 4
+
+
+def test_read_gif(tmp_path):
+    path = tmp_path / "clip.gif"
+    frames = [Image.new("RGB", (16, 16), c) for c in ["red", "blue"]]
+    frames[0].save(path, save_all=True, append_images=frames[1:],
+                   duration=[40, 80])
+    durations = [d for _, d in video.read_frames(path)]
+    assert durations == pytest.approx([0.04, 0.08])
+
+
+def test_read_missing(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        video.read_frames(tmp_path / "missing.mp4")
+
+
+def test_downsample():
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    frame[:, :320] = 255
+    small = video.downsample(frame, (128, 128))
+    assert small.shape == (128, 128, 3)
+    assert small.dtype == np.uint8
+    # The centre is cropped square, so the edge lands in the middle.
+    assert (small[:, :64] == 255).all()
+    assert (small[:, 64:] == 0).all()
+
+
+def test_downsample_averages_blocks():
+    frame = np.zeros((4, 4, 3), dtype=np.uint8)
+    frame[::2, ::2] = 200
+    assert (video.downsample(frame, (2, 2)) == 50).all()
+
+
+def test_downsample_upscales():
+    frame = np.arange(4 * 3, dtype=np.uint8).reshape(2, 2, 3)
+    assert video.downsample(frame, (4, 4)).shape == (4, 4, 3)
+
+
+def test_play(frame_dir):
+    recorder = Recorder()
+    loop = asyncio.new_event_loop()
+    try:
+        start = loop.time()
+        dropped = loop.run_until_complete(video.play_video(
+            recorder, frame_dir, size=(32, 32), fps=50))
+        elapsed = loop.time() - start
+    finally:
+        loop.close()
+
+    assert dropped == 0
+    assert [f.shape for f in recorder.frames] == [(32, 32, 3)] * 4
+    assert elapsed == pytest.approx(4 / 50, abs=0.015)
+
+
+def test_play_drops_late_frames(frame_dir):
+    recorder = Recorder(delay=0.05)
+    dropped = play(recorder, frame_dir, size=(8, 8), fps=50)
+
+    # Each drawn frame overruns the next one's slot, which is dropped.
+    assert dropped == 2
+    assert len(recorder.frames) == 2
+
+
+class FakeCapture:
+    """Stands in for `cv2.VideoCapture`, counting how many frames are
+    demuxed and how many decoded."""
+    def __init__(self, path, n_frames=4):
+        self.n_frames = n_frames
+        self.grabbed = 0
+        self.retrieved = 0
+        self.released = False
+        FakeCapture.last = self
+
+    def isOpened(self):
+        return True
+
+    def get(self, prop):
+        return 50.0
+
+    def grab(self):
+        if self.grabbed == self.n_frames:
+            return False
+        self.grabbed += 1
+        return True
+
+    def retrieve(self):
+        self.retrieved += 1
+        frame = np.zeros((48, 64, 3), dtype=np.uint8)
+        frame[..., 2] = 255  # BGR, so red.
+        return True, frame
+
+    def release(self):
+        self.released = True
+
+
+class FakeCV2:
+    CAP_PROP_FPS = 5
+    VideoCapture = FakeCapture
+
+
+def test_play_video_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(video, 'cv2', FakeCV2)
+    path = tmp_path / "clip.mp4"
+    path.write_bytes(b"")
+    recorder = Recorder(delay=0.05)
+    dropped = play(recorder, path, size=(8, 8))
+
+    capture = FakeCapture.last
+    assert capture.grabbed == 4
+    # Dropped frames are skipped without being decoded.
+    assert dropped == 2
+    assert capture.retrieved == 2
+    assert tuple(recorder.frames[0][0, 0]) == (255, 0, 0)
+    assert capture.released
+
+
+def test_play_does_not_block_the_loop(tmp_path, monkeypatch):
+    class SlowCapture(FakeCapture):
+        def retrieve(self):
+            time.sleep(0.05)
+            return super().retrieve()
+
+    class SlowCV2(FakeCV2):
+        VideoCapture = SlowCapture
+
+    monkeypatch.setattr(video, 'cv2', SlowCV2)
+    path = tmp_path / "clip.mp4"
+    path.write_bytes(b"")
+    ticks = []
+
+    async def main():
+        async def tick():
+            while True:
+                ticks.append(asyncio.get_event_loop().time())
+                await asyncio.sleep(0.005)
+
+        ticker = asyncio.ensure_future(tick())
+        await video.play_video(Recorder(), path, size=(8, 8))
+        ticker.cancel()
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(main())
+    finally:
+        loop.close()
+
+    # Decoding on a worker thread leaves the loop free to keep ticking.
+    assert max(b - a for a, b in zip(ticks, ticks[1:])) < 0.04
@@ -0,0 +1,69 @@
+import json
+
+import numpy as np
+from PIL import Image
+
+import robot.outputs.display as display
+from robot.outputs.rgb565 import encode_rgb565
+from robot.outputs.virtual_display import VirtualDevice
+
+
+def virtual_oled(**kwargs):
+    oled = display.OLEDDisplay(echo_result=False, virtual=True, **kwargs)
+    oled.setup()
+    return oled
+
+
+def test_setup_uses_virtual_device():
+    oled = virtual_oled()
+    assert isinstance(oled.device, VirtualDevice)
+    assert oled.device.size == (128, 128)
+    assert oled.native
+
+
+def test_window_writes():
+    device = VirtualDevice(8, 8)
+    pixels = np.full((2, 3, 3), 255, dtype=np.uint8)
+    device.command(0x15, 1, 3)
+    device.command(0x75, 4, 5)
+    device.command(0x5C)
+    device.data(list(encode_rgb565(pixels).tobytes()))
+
+    assert device.frame[4:6, 1:4].min() == 248
+    assert device.frame.sum() == device.frame[4:6, 1:4].sum()
+    assert device.n_frames == 1
+    assert device.n_bytes == 3 + 3 + 1 + 12
+    assert device.frame_log[0]['window'] == [1, 4, 4, 6]
+
+
+def test_display_counts_whole_frames():
+    device = VirtualDevice(16, 8, mode='1')
+    device.display(Image.new('1', (16, 8), 1))
+    assert device.n_bytes == 16
+    assert device.frame.min() == 255
+
+
+def test_drawing_is_exercised_headless(tmp_path):
+    oled = virtual_oled(snapshot_dir=tmp_path / "frames")
+    oled.fill_rgb(255, 0, 0)
+    oled.draw_bars(0.4, 0.8)
+    full = oled.device.n_bytes
+    oled.draw_bars(0.45, 0.8)
+
+    np.testing.assert_array_equal(oled.device.frame,
+                                  oled.frame & [0xF8, 0xFC, 0xF8])
+    assert oled.device.n_bytes - full < 128 * 10 * 2
+    assert len(list((tmp_path / "frames").glob("*.png"))) == \
+        oled.device.n_frames
+
+    log = oled.device.write_frame_log(tmp_path / "frames.jsonl")
+    entries = [json.loads(line) for line in open(log)]
+    assert len(entries) == oled.device.n_frames
+
+
+def test_snapshot(tmp_path):
+    oled = virtual_oled()
+    oled.draw_text("snap")
+    path = oled.device.snapshot(tmp_path / "snap.png")
+    assert Image.open(path).size == (128, 128)
+    assert np.asarray(Image.open(path)).any()
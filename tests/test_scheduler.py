@@ -0,0 +1,154 @@
+import asyncio
+
+import pytest
+
+from robot.scheduler import ActionScheduler
+from conftest import run
+
+
+class FakeDriver:
+    def __init__(self):
+        self.log = []
+
+
+class FakeAction:
+    """Records when it starts and finishes in the driver's log."""
+    priority = 0
+    timeout = None
+    duration = 0.0
+    result = None
+
+    def __init__(self, driver):
+        self.driver = driver
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.driver.log.append(('exit', type(self).__name__))
+        return False
+
+    async def run(self):
+        self.driver.log.append(('start', type(self).__name__))
+        await asyncio.sleep(self.duration)
+        self.driver.log.append(('end', type(self).__name__))
+        return self.result
+
+
+class Idle(FakeAction):
+    pass
+
+
+class Low(FakeAction):
+    pass
+
+
+class Urgent(FakeAction):
+    priority = 5
+
+
+class Slow(FakeAction):
+    duration = 1.0
+
+
+class Short(FakeAction):
+    duration = 0.05
+
+
+class Chain(FakeAction):
+    result = [Low, Idle]
+
+
+@pytest.fixture
+def scheduler():
+    return ActionScheduler(FakeDriver(), lambda: Idle)
+
+
+def started(scheduler):
+    return [name for event, name in scheduler.driver.log if event == 'start']
+
+
+def test_priority_order(scheduler):
+    scheduler.submit(Low)
+    scheduler.submit(Idle)
+    scheduler.submit(Urgent)
+    assert scheduler.queued == [Urgent, Low, Idle]
+
+
+def test_coalesce(scheduler):
+    assert scheduler.submit(Low)
+    assert scheduler.submit(Idle)
+    assert not scheduler.submit(Low)
+    assert scheduler.queued == [Low, Idle]
+    assert len(scheduler) == 2
+
+    # Resubmitting at a higher priority moves it forward.
+    assert not scheduler.submit(Idle, priority=3)
+    assert scheduler.queued == [Idle, Low]
+    assert len(scheduler) == 2
+
+
+def test_idle_when_empty(scheduler):
+    run(scheduler.run_next())
+    assert started(scheduler) == ['Idle']
+
+
+def test_results_are_queued(scheduler):
+    scheduler.submit(Chain)
+    assert run(scheduler.run_next()) == [Low, Idle]
+    assert scheduler.queued == [Low, Idle]
+
+
+def test_preempt(scheduler):
+    async def press_during():
+        await asyncio.sleep(0.05)
+        scheduler.submit(Urgent)
+
+    async def main():
+        scheduler.submit(Slow)
+        asyncio.ensure_future(press_during())
+        start = asyncio.get_event_loop().time()
+        await scheduler.run_next()
+        elapsed = asyncio.get_event_loop().time() - start
+        await scheduler.run_next()
+        return elapsed
+
+    elapsed = run(main())
+    assert elapsed < 0.5
+    assert scheduler.driver.log == [
+        ('start', 'Slow'), ('exit', 'Slow'),
+        ('start', 'Urgent'), ('end', 'Urgent'), ('exit', 'Urgent')]
+
+
+def test_no_preempt_at_same_priority(scheduler):
+    async def submit_during():
+        await asyncio.sleep(0.01)
+        scheduler.submit(Low)
+
+    async def main():
+        scheduler.submit(Short)
+        asyncio.ensure_future(submit_during())
+        await scheduler.run_next()
+
+    run(main())
+    assert ('end', 'Short') in scheduler.driver.log
+    assert scheduler.queued == [Low]
+
+
+def test_timeout(scheduler):
+    scheduler.submit(Slow, timeout=0.05)
+    assert run(scheduler.run_next()) is None
+    assert scheduler.driver.log == [('start', 'Slow'), ('exit', 'Slow')]
+
+
+def test_cancelling_the_scheduler_cancels_the_action(scheduler):
+    async def main():
+        scheduler.submit(Slow)
+        task = asyncio.ensure_future(scheduler.run_next())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    run(main())
+    assert scheduler.driver.log == [('start', 'Slow'), ('exit', 'Slow')]
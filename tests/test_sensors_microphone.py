@@ -0,0 +1,117 @@
+import numpy as np
+import pytest
+
+import robot.sensors.microphone as microphone
+from robot.outputs.audio import write_wav
+from conftest import FakeClock
+
+
+def ambient_recording(sr=16000, seconds=2, clap_at=1.0, loud_at=None):
+    rng = np.random.RandomState(0)
+    t = np.arange(sr * seconds) / sr
+    x = 300 * np.sin(2 * np.pi * 150 * t) + rng.randn(len(t)) * 30
+    if clap_at is not None:
+        i = int(clap_at * sr)
+        clap = rng.randn(800) * np.exp(-np.arange(800) / 200)
+        # Keep the clap broadband but mostly high frequency.
+        x[i:i + 800] += np.diff(clap, prepend=0) * 20000
+    if loud_at is not None:
+        i = int(loud_at * sr)
+        x[i:] += 12000 * np.sin(2 * np.pi * 440 * t[i:])
+    return np.clip(x, -32768, 32767).astype(np.int16), sr
+
+
+@pytest.fixture
+def make_sensor(tmp_path):
+    def make(samples, sr, block_size=512, **kwargs):
+        path = tmp_path / "ambient.wav"
+        write_wav(path, samples, sr)
+        clock = FakeClock()
+        source = microphone.WavFileSource(path, block_size=block_size,
+                                          loop=False, clock=clock)
+        sensor = microphone.AmbientSoundSensor(source, **kwargs)
+        sensor.setup()
+        return sensor, clock
+    return make
+
+
+def test_wav_source_paces_blocks(make_sensor):
+    sensor, clock = make_sensor(*ambient_recording(clap_at=None))
+    assert sensor.poll() is None
+
+    clock.now = 512 / 16000
+    assert sensor.poll() is not None
+    assert sensor.poll() is None
+
+    clock.now = 10.0
+    sensor.poll()
+    assert len(sensor.history) == sensor.history.maxlen
+
+
+def test_wav_source_reads_nothing_until_started(tmp_path):
+    path = tmp_path / "ambient.wav"
+    write_wav(path, *ambient_recording(seconds=1, clap_at=None))
+    source = microphone.WavFileSource(path, clock=FakeClock())
+    assert source.read() is None
+
+
+def test_band_energies(make_sensor):
+    sensor, clock = make_sensor(*ambient_recording(clap_at=None))
+    clock.now = 0.5
+    level = sensor.poll()
+
+    assert level.bands.shape == (3,)
+    assert np.argmax(level.bands) == 0
+    assert level.db == pytest.approx(20 * np.log10(300 / np.sqrt(2) / 32768),
+                                     abs=1.0)
+
+
+def test_high_fraction(make_sensor):
+    sensor, _ = make_sensor(*ambient_recording(clap_at=None))
+    t = np.arange(512) / 16000
+    low = (8000 * np.sin(2 * np.pi * 150 * t)).astype(np.int16)
+    high = (8000 * np.sin(2 * np.pi * 4000 * t)).astype(np.int16)
+
+    # Analysed on its own, each block reports its own fraction.
+    assert sensor.analyse(high).high_fraction > 0.9
+    assert sensor.analyse(low).high_fraction < 0.1
+
+
+def test_clap_callback(make_sensor):
+    claps = []
+    sensor, clock = make_sensor(*ambient_recording())
+    sensor.set_clap_callback(claps.append)
+
+    clock.now = 2.0
+    sensor.poll()
+    assert len(claps) == 1
+
+
+def test_loudness_callback_hysteresis(make_sensor):
+    loud = []
+    sensor, clock = make_sensor(*ambient_recording(clap_at=None, loud_at=1.0))
+    sensor.set_loudness_callback(loud.append)
+
+    clock.now = 0.9
+    sensor.poll()
+    assert loud == []
+
+    clock.now = 2.0
+    sensor.poll()
+    assert len(loud) == 1
+    assert loud[0].db > sensor.loud_db
+
+    sensor.clear_callbacks()
+    assert sensor._loudness_callback is None
+
+
+def test_microphone_factory(tmp_path):
+    assert microphone.microphone_factory(None) is None
+
+    sensor = microphone.microphone_factory({
+        'source': 'wav',
+        'source_args': {'path': tmp_path / "x.wav", 'block_size': 256},
+        'loud_db': -10})
+    assert isinstance(sensor.source, microphone.WavFileSource)
+    assert sensor.source.block_size == 256
+    assert sensor.loud_db == -10